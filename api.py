@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from service import HotelService, ValidationError, NotFound, DuplicateRoom, booking_dict, room_dict
+from store import RoomOccupied, UnknownRoom
+
+IDLE_TIMEOUT = 15.0
+MAX_BODY = 1 << 20
+MAX_BATCH = 100
+WORKERS = 4
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+# A handler result that is sent as-is instead of as JSON (invoices).
+Raw = namedtuple("Raw", "content_type filename data")
+
+
+class BadRequest(Exception):
+    pass
+
+
+def status_for(error):
+    if isinstance(error, (ValidationError, BadRequest)):
+        return 400
+    if isinstance(error, NotFound):
+        return 404
+    if isinstance(error, (RoomOccupied, DuplicateRoom)):
+        return 409
+    if isinstance(error, UnknownRoom):
+        return 422
+    return 500
+
+
+def error_message(error):
+    if isinstance(error, RoomOccupied):
+        return "This room is occupied during the selected dates."
+    if isinstance(error, UnknownRoom):
+        return f"Room {error} does not exist."
+    return str(error) or type(error).__name__
+
+
+# ---------- HANDLERS ----------
+# Each handler runs on a worker thread as fn(service, args, query, body):
+# args are the route's captured groups, query the parsed query string and
+# body the decoded JSON object ({} when there is none).
+def _one(query, key, default=None):
+    values = query.get(key)
+    return values[-1] if values else default
+
+
+def _flag(query, key):
+    return _one(query, key, "").lower() in ("1", "true", "yes")
+
+
+def health(service, args, query, body):
+    return {"status": "ok", "rooms": len(service.store.catalog)}
+
+
+def list_rooms(service, args, query, body):
+    return [room_dict(r) for r in service.rooms()]
+
+
+def get_room(service, args, query, body):
+    return room_dict(service.room(int(args[0])))
+
+
+def add_room(service, args, query, body):
+    return 201, room_dict(service.add_room(body.get("room_no"), body.get("room_type"), body.get("rate"), body.get("notes")))
+
+
+def update_room(service, args, query, body):
+    return room_dict(service.update_room(int(args[0]), body.get("room_no"), body.get("room_type"), body.get("rate"), body.get("notes")))
+
+
+def delete_room(service, args, query, body):
+    return room_dict(service.delete_room(int(args[0])))
+
+
+def list_bookings(service, args, query, body):
+    before = _one(query, "before_created"), _one(query, "before_id")
+    return [booking_dict(r) for r in service.recent_bookings(_one(query, "limit"), before if all(before) else None)]
+
+
+def get_booking(service, args, query, body):
+    return booking_dict(service.booking(int(args[0])))
+
+
+def _booking_fields(body):
+    return [body.get(k) for k in ("guest_name", "room_no", "phone", "check_in", "check_out")]
+
+
+def add_booking(service, args, query, body):
+    return 201, booking_dict(service.add_booking(*_booking_fields(body)))
+
+
+def update_booking(service, args, query, body):
+    return booking_dict(service.update_booking(int(args[0]), *_booking_fields(body)))
+
+
+def cancel_booking(service, args, query, body):
+    return booking_dict(service.cancel_booking(int(args[0])))
+
+
+def check_out(service, args, query, body):
+    return booking_dict(service.check_out(int(args[0])))
+
+
+def search_bookings(service, args, query, body):
+    rows = service.search(_one(query, "q"), _flag(query, "archive"), _one(query, "limit"))
+    return [booking_dict(r) for r in rows]
+
+
+def free_rooms(service, args, query, body):
+    return service.free_rooms(_one(query, "from"), _one(query, "to"), _one(query, "type"), _one(query, "max_rate"))
+
+
+def earliest_fit(service, args, query, body):
+    first, rooms = service.earliest_fit(_one(query, "nights"), _one(query, "type"), _one(query, "from"),
+                                        _one(query, "days"), _one(query, "max_rate"))
+    return {"check_in": first.isoformat() if first else None, "rooms": rooms}
+
+
+def free_on(service, args, query, body):
+    found = service.free_on(",".join(query.get("dates", [])), _one(query, "k"), _one(query, "type"), _one(query, "max_rate"))
+    return [{"room_no": room, "nights_free": n} for room, n in found]
+
+
+def quote(service, args, query, body):
+    return service.quote(_one(query, "room"), _one(query, "from"), _one(query, "to"))
+
+
+def invoice(service, args, query, body):
+    pdf = _one(query, "format") == "pdf"
+    name, data = service.invoice(int(args[0]), pdf)
+    return Raw("application/pdf" if name.endswith(".pdf") else "text/plain; charset=utf-8", name, data)
+
+
+ROUTES = [
+    ("GET", r"/health", health),
+    ("GET", r"/rooms", list_rooms),
+    ("POST", r"/rooms", add_room),
+    ("GET", r"/rooms/(\d+)", get_room),
+    ("PUT", r"/rooms/(\d+)", update_room),
+    ("DELETE", r"/rooms/(\d+)", delete_room),
+    ("GET", r"/bookings", list_bookings),
+    ("POST", r"/bookings", add_booking),
+    ("GET", r"/bookings/(\d+)", get_booking),
+    ("PUT", r"/bookings/(\d+)", update_booking),
+    ("DELETE", r"/bookings/(\d+)", cancel_booking),
+    ("POST", r"/bookings/(\d+)/check-out", check_out),
+    ("GET", r"/search", search_bookings),
+    ("GET", r"/availability", free_rooms),
+    ("GET", r"/availability/earliest", earliest_fit),
+    ("GET", r"/availability/free-on", free_on),
+    ("GET", r"/quote", quote),
+    ("GET", r"/invoices/(\d+)", invoice),
+]
+ROUTES = [(method, re.compile(pattern + "$"), fn) for method, pattern, fn in ROUTES]
+
+
+def dispatch(service, method, target, body):
+    # (status, payload) for one request; never raises.
+    url = urlsplit(target)
+    allowed = False
+    for m, pattern, fn in ROUTES:
+        match = pattern.match(url.path)
+        if not match:
+            continue
+        if m != method:
+            allowed = True
+            continue
+        try:
+            if body is not None and not isinstance(body, dict):
+                raise BadRequest("Request body must be a JSON object.")
+            result = fn(service, match.groups(), parse_qs(url.query), body or {})
+        except Exception as e:
+            return status_for(e), {"error": error_message(e)}
+        return result if isinstance(result, tuple) and not isinstance(result, Raw) else (200, result)
+    if allowed:
+        return 405, {"error": f"{method} is not allowed on {url.path}"}
+    return 404, {"error": f"No route for {url.path}"}
+
+
+def run_batch(service, requests):
+    # Sub-requests run in order on one worker thread, so a batch costs a
+    # single hop to the pool however many requests it carries. Each one
+    # succeeds or fails on its own.
+    if not isinstance(requests, list):
+        raise BadRequest("Batch body must be a list of requests.")
+    if len(requests) > MAX_BATCH:
+        raise BadRequest(f"A batch holds at most {MAX_BATCH} requests.")
+    results = []
+    for r in requests:
+        if not isinstance(r, dict) or not isinstance(r.get("path"), str):
+            results.append({"status": 400, "body": {"error": "Each request needs a path."}})
+            continue
+        status, payload = dispatch(service, str(r.get("method", "GET")).upper(), r["path"], r.get("body"))
+        if isinstance(payload, Raw):
+            status, payload = 400, {"error": "Invoices cannot be fetched in a batch."}
+        results.append({"status": status, "body": payload})
+    return results
+
+
+# ---------- SERVER ----------
+class ApiServer:
+    # HTTP/1.1 with keep-alive on asyncio; SQLite work goes to a small
+    # thread pool (each thread keeps its own connection, see db.py) so the
+    # event loop only parses and writes.
+    def __init__(self, db, host="127.0.0.1", port=8080, workers=WORKERS, service=None):
+        self.service = service or HotelService(db)
+        self.host = host
+        self.port = port
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.server = None
+        self._clients = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        # Stops listening and drops open keep-alive connections.
+        if self.server is not None:
+            self.server.close()
+        for task in list(self._clients):
+            task.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.pool.shutdown(wait=True)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close" and (
+                    version == "HTTP/1.1" or headers.get("connection", "").lower() == "keep-alive")
+                status, payload = await self._respond(method, target, headers, body)
+                self._write(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except BadRequest as e:
+            self._write(writer, 400, {"error": str(e)}, False)
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise BadRequest("Malformed request line.") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise BadRequest("Bad Content-Length.") from None
+        if length < 0:
+            raise BadRequest("Bad Content-Length.")
+        if length > MAX_BODY:
+            raise BadRequest("Request body is too large.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, version, headers, body
+
+    async def _respond(self, method, target, headers, body):
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            return 400, {"error": "Request body is not valid JSON."}
+        if urlsplit(target).path == "/batch":
+            if method != "POST":
+                return 405, {"error": "Batches are sent with POST."}
+            try:
+                return 200, await self._run(run_batch, self.service, data)
+            except BadRequest as e:
+                return 400, {"error": str(e)}
+        return await self._run(dispatch, self.service, method, target, data)
+
+    def _write(self, writer, status, payload, keep_alive):
+        if isinstance(payload, Raw):
+            content_type, data = payload.content_type, payload.data
+            extra = f'Content-Disposition: attachment; filename="{payload.filename}"\r\n'
+        else:
+            content_type, data = "application/json", json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            extra = ""
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n{extra}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Local JSON API over hotel.db")
+    parser.add_argument("--db", default="hotel.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="threads running SQLite calls")
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    migrations.migrate(db)
+    api = ApiServer(db, args.host, args.port, args.workers)
+
+    async def main():
+        await api.start()
+        print(f"Serving http://{args.host}:{api.port}/ (Ctrl+C to stop)")
+        await api.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+        db.close_all()
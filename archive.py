@@ -0,0 +1,73 @@
+import argparse
+from datetime import date, datetime, timezone
+
+from days import to_day
+
+ARCHIVE_COLUMNS = ("id", "guest_name", "room_no", "phone", "check_in", "check_out", "created_at", "nights", "total")
+BATCH_SIZE = 5000
+
+_COLUMNS = ", ".join(ARCHIVE_COLUMNS)
+MOVE_ONE_SQL = f"INSERT INTO bookings_archive ({_COLUMNS}, archived_at) SELECT {_COLUMNS}, ? FROM bookings WHERE id = ?"
+MOVE_BATCH_SQL = f"INSERT INTO bookings_archive ({_COLUMNS}, archived_at) SELECT {_COLUMNS}, ? FROM bookings WHERE id IN temp.archive_batch"
+CLOSED_SQL = "SELECT id FROM stays WHERE day_out <= ?"
+
+
+def _stamp():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def archive_booking(c, booking_id, stamp=None):
+    # Inside the caller's write transaction. The archive row goes in first,
+    # which tells the rollup delete trigger to keep the stay's nights.
+    c.execute(MOVE_ONE_SQL, (stamp or _stamp(), booking_id))
+    c.execute("DELETE FROM stays WHERE id = ?", (booking_id,))
+
+
+def count_closed(db, before=None):
+    return db.query(f"SELECT COUNT(*) FROM ({CLOSED_SQL})", (to_day(before or date.today()),))[0][0]
+
+
+def archive_closed(db, before=None, job=None, batch_size=BATCH_SIZE):
+    # Moves every stay that checked out on or before `before` (default
+    # today) into bookings_archive. Each batch is its own short write
+    # transaction, so desks can keep booking while a large backlog moves.
+    before = to_day(before or date.today())
+    stamp = _stamp()
+    moved = 0
+
+    def move(c):
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+        c.execute("DELETE FROM temp.archive_batch")
+        n = c.execute(f"INSERT INTO temp.archive_batch {CLOSED_SQL} LIMIT ?", (before, batch_size)).rowcount
+        if n:
+            c.execute(MOVE_BATCH_SQL, (stamp,))
+            c.execute("DELETE FROM stays WHERE id IN temp.archive_batch")
+        return n
+    while True:
+        n = db.write(move)
+        if not n:
+            break
+        moved += n
+        if job is not None:
+            job.check()
+            job.progress(moved)
+    return moved
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Move checked-out stays from bookings into bookings_archive")
+    parser.add_argument("--db", default="hotel.db")
+    parser.add_argument("--before", help="archive stays that checked out on or before this date (default: today)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    migrations.migrate(db)
+    if args.dry_run:
+        print(f"{count_closed(db, args.before)} stays would be archived")
+    else:
+        print(f"Archived {archive_closed(db, args.before, batch_size=args.batch)} stays")
+    db.close_all()
@@ -0,0 +1,26 @@
+from days import to_day
+
+FREE_ROOMS_SQL = """
+    SELECT r.room_no FROM rooms r
+    WHERE {filters}NOT EXISTS (
+        SELECT 1 FROM stays s
+        WHERE s.room_id = r.id AND s.day_out > ? AND s.day_in < ?
+    )
+    ORDER BY r.room_no
+"""
+
+
+def free_rooms(db, frm, to, room_type=None, max_rate=None):
+    # Same overlap rule as the booking checks: a stay blocks the range
+    # unless it ends on/before `frm` or starts on/after `to`. Probing on
+    # day_out first keeps the index range to current and future stays.
+    # frm and to are dates or YYYY-MM-DD strings.
+    filters, params = [], []
+    if room_type:
+        filters.append("r.room_type = ?"); params.append(room_type)
+    if max_rate is not None:
+        filters.append("r.rate <= ?"); params.append(max_rate)
+    where = "".join(f + " AND " for f in filters)
+    params.extend((to_day(frm), to_day(to)))
+    return [r[0] for r in db.query(FREE_ROOMS_SQL.format(filters=where), params)]
+
@@ -0,0 +1,240 @@
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005
+KEEP = 14
+STAMP = "%Y%m%d-%H%M%S"
+COPY_CHUNK = 1 << 20
+
+log = logging.getLogger("hotelms.backup")
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupStopped(BackupError):
+    pass
+
+
+def backup(db, dest, pages=PAGES_PER_STEP, pause=STEP_PAUSE, compress=False, verify=False, job=None, stop=None):
+    # Copies the live database to `dest` (gzipped when compress is set)
+    # with the online backup API, `pages` pages per step and a short pause
+    # between steps so the copy never hogs the disk. Runs on its own
+    # connection. Setting the `stop` event aborts the copy between steps
+    # with BackupStopped, leaving no partial file. Returns (path, pages,
+    # seconds).
+    t0 = time.perf_counter()
+    part = dest + ".part"
+    src = sqlite3.connect(db.path, timeout=db.timeout, isolation_level=None, check_same_thread=False)
+    dst = sqlite3.connect(part, isolation_level=None)
+    copied = [0]
+
+    def check():
+        if stop is not None and stop.is_set():
+            raise BackupStopped(f"backup to {dest} stopped")
+
+    def progress(status, remaining, total):
+        copied[0] = total
+        check()
+        if job is not None:
+            job.check()
+            job.progress(total - remaining, total)
+        if pause:
+            time.sleep(pause)
+    try:
+        # A read transaction pins one WAL snapshot for the whole copy.
+        # Without it every commit from the desk restarts the backup, which
+        # on a busy multi-GB database may never finish. Writers are not
+        # blocked by it.
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+        src.execute("COMMIT")
+        # A standalone file: no -wal/-shm next to the snapshot.
+        dst.execute("PRAGMA journal_mode=DELETE")
+        if verify:
+            result = dst.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"snapshot failed quick_check: {result}")
+    except BaseException:
+        dst.close()
+        os.remove(part)
+        raise
+    finally:
+        src.close()
+    dst.close()
+    if compress:
+        try:
+            with open(part, "rb") as f, gzip.open(dest, "wb", compresslevel=6) as out:
+                for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+                    check()
+                    out.write(chunk)
+        except BaseException:
+            if os.path.exists(dest):
+                os.remove(dest)
+            raise
+        finally:
+            os.remove(part)
+    else:
+        os.replace(part, dest)
+    return dest, copied[0], time.perf_counter() - t0
+
+
+# ---------- SNAPSHOTS ----------
+def _prefix(db):
+    return os.path.splitext(os.path.basename(db.path))[0] + "-"
+
+
+def snapshots(db, directory):
+    # Snapshot files of this database, oldest first (names sort by time).
+    if not os.path.isdir(directory):
+        return []
+    prefix = _prefix(db)
+    names = [n for n in os.listdir(directory) if n.startswith(prefix) and (n.endswith(".db") or n.endswith(".db.gz"))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def rotate(db, directory, keep=KEEP):
+    # Deletes all but the newest `keep` snapshots (0 keeps them all);
+    # returns the removed paths.
+    old = snapshots(db, directory)[:-keep] if keep > 0 else []
+    for path in old:
+        os.remove(path)
+    return old
+
+
+def take_snapshot(db, directory, keep=KEEP, compress=False, verify=False, job=None, stop=None):
+    os.makedirs(directory, exist_ok=True)
+    name = _prefix(db) + time.strftime(STAMP)
+    dest = os.path.join(directory, name + (".db.gz" if compress else ".db"))
+    n = 1
+    # "_" sorts after ".", so a second snapshot in the same second still
+    # comes after the first.
+    while os.path.exists(dest):
+        dest = os.path.join(directory, f"{name}_{n}" + (".db.gz" if compress else ".db")); n += 1
+    result = backup(db, dest, compress=compress, verify=verify, job=job, stop=stop)
+    rotate(db, directory, keep)
+    return result
+
+
+class BackupScheduler:
+    # Takes a snapshot every `interval` seconds on its own thread, keeping
+    # the newest `keep`. Failures are logged and retried at the next slot.
+    def __init__(self, db, directory, interval, keep=KEEP, compress=True, on_done=None):
+        self.db = db
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.compress = compress
+        self.on_done = on_done
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="backup", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait=True):
+        # A backup in progress stops at its next step.
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = take_snapshot(self.db, self.directory, self.keep, self.compress, stop=self._stop)
+            except BackupStopped:
+                log.info("scheduled backup of %s stopped", self.db.path)
+                break
+            except Exception:
+                log.exception("scheduled backup of %s failed", self.db.path)
+                continue
+            log.info("backed up %s to %s in %.1f s", self.db.path, result[0], result[2])
+            if self.on_done is not None:
+                self.on_done(result)
+
+
+# ---------- RESTORE ----------
+def restore(db, snapshot, safety_dir=None):
+    # Replaces the database's contents with a snapshot (.db or .db.gz),
+    # through the backup API so other connections see either the old or
+    # the new database, never a half-copied file. The snapshot is checked
+    # first, and with safety_dir the current database is snapshotted there
+    # before being overwritten. Returns that safety snapshot's path.
+    plain = snapshot
+    if snapshot.endswith(".gz"):
+        plain = snapshot[:-3] + ".restore"
+        with gzip.open(snapshot, "rb") as f, open(plain, "wb") as out:
+            shutil.copyfileobj(f, out, COPY_CHUNK)
+    try:
+        src = sqlite3.connect(f"file:{plain}?mode=ro", uri=True)
+        try:
+            result = src.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise BackupError(f"{snapshot} failed quick_check: {result}")
+            safety = take_snapshot(db, safety_dir, keep=0)[0] if safety_dir else None
+            dst = sqlite3.connect(db.path, timeout=db.timeout)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    finally:
+        if plain != snapshot:
+            os.remove(plain)
+    return safety
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Online backups of hotel.db")
+    parser.add_argument("--db", default="hotel.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("snapshot", help="take one rotating snapshot")
+    p.add_argument("--dir", default="backups"); p.add_argument("--keep", type=int, default=KEEP)
+    p.add_argument("--gzip", action="store_true"); p.add_argument("--verify", action="store_true")
+    p = sub.add_parser("schedule", help="take a snapshot every --every minutes until interrupted")
+    p.add_argument("--dir", default="backups"); p.add_argument("--keep", type=int, default=KEEP)
+    p.add_argument("--every", type=float, default=60.0); p.add_argument("--no-gzip", action="store_true")
+    p = sub.add_parser("list")
+    p.add_argument("--dir", default="backups")
+    p = sub.add_parser("restore", help="overwrite --db with a snapshot (stop the app first)")
+    p.add_argument("snapshot"); p.add_argument("--safety-dir", default="backups", help="snapshot the current database here first ('' to skip)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    db = ConnectionManager(args.db)
+    if args.command == "snapshot":
+        migrations.migrate(db)
+        path, pages, seconds = take_snapshot(db, args.dir, args.keep, args.gzip, args.verify)
+        print(f"Backed up {pages} pages to {path} in {seconds:.2f} s")
+    elif args.command == "schedule":
+        migrations.migrate(db)
+        scheduler = BackupScheduler(db, args.dir, args.every * 60.0, args.keep, not args.no_gzip)
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop(wait=True)
+    elif args.command == "list":
+        for path in snapshots(db, args.dir):
+            print(f"{path}\t{os.path.getsize(path)}")
+    elif args.command == "restore":
+        safety = restore(db, args.snapshot, args.safety_dir or None)
+        if safety:
+            print(f"Saved the previous database to {safety}")
+        print(f"Restored {args.db} from {args.snapshot}")
+    db.close_all()
@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import string
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import availability
+import backup
+import csvio
+import invoices
+import migrations
+import rates
+import reports
+import search
+from instrument import Profiler
+from days import to_date, to_day
+from db import ConnectionManager
+from occupancy import OccupancyIndex
+from paging import BookingPager
+from store import Store, RoomOccupied
+
+ROOM_TYPES = [("Single", 60.0), ("Double", 90.0), ("Twin", 95.0), ("Deluxe", 140.0), ("Suite", 240.0)]
+FIRST_NAMES = ["Anna", "Ben", "Chloe", "David", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jamal", "Kira", "Luca", "Maya", "Noah", "Olga", "Priya"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Müller", "Okafor", "Rossi", "Kowalski", "Tanaka", "Haddad", "Silva", "Novak", "Patel"]
+STRESS_GUEST = "Stress Writer"
+OPERATIONS = ("add_booking", "update_booking", "availability", "earliest_fit", "search", "booking_page", "full_table_load", "csv_export", "invoice_render", "report", "quote", "reprice")
+
+
+# ---------- SYNTHETIC DATA ----------
+def _stay_length(rng):
+    # Mostly short stays with a long tail, as at a city hotel.
+    return min(1 + int(rng.expovariate(0.45)), 21)
+
+
+def seed_database(path, rooms=300, bookings=100000, seed=1, start=None, batch=20000):
+    # Each room gets a back-to-back timeline of stays separated by short
+    # gaps, so rooms are ~75% occupied and bookings never overlap.
+    rng = random.Random(seed)
+    db = ConnectionManager(path)
+    migrations.migrate(db)
+    start = start or date.today() - timedelta(days=int(bookings / max(rooms, 1) * 4.5 * 0.8))
+    room_rows = []
+    for i in range(rooms):
+        room_type, rate = rng.choice(ROOM_TYPES)
+        room_rows.append((f"{100 * (1 + i // 100) + i % 100 + 1}", room_type, rate, ""))
+    with db.transaction(immediate=True) as c:
+        c.executemany("INSERT INTO rooms (room_no, room_type, rate, notes) VALUES (?, ?, ?, ?)", room_rows)
+    room_ids = dict(db.query("SELECT room_no, id FROM rooms"))
+    # Weekend rates a quarter above the base and 10% off a week or more;
+    # the seeded totals stay at the flat rate, as if booked before them.
+    for room_type, rate in ROOM_TYPES:
+        rates.set_weekend(db, room_type, rate * 1.25)
+    rates.set_discount(db, "", 7, 10.0)
+    cursors = {room_no: start + timedelta(days=rng.randint(0, 6)) for room_no, _, _, _ in room_rows}
+    base_rates = {room_no: rate for room_no, _, rate, _ in room_rows}
+    rows = []
+    for n in range(bookings):
+        room_no = room_rows[n % rooms][0]
+        check_in = cursors[room_no] + timedelta(days=int(rng.expovariate(0.7)))
+        nights = _stay_length(rng)
+        check_out = check_in + timedelta(days=nights)
+        cursors[room_no] = check_out
+        created = datetime.combine(check_in, datetime.min.time()) - timedelta(days=rng.randint(0, 60), seconds=rng.randint(0, 86399))
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        phone = "+1-555-" + "".join(rng.choice(string.digits) for _ in range(7))
+        rows.append((name, room_ids[room_no], phone, to_day(check_in), to_day(check_out),
+                     created.strftime("%Y-%m-%d %H:%M:%S"), nights, nights * base_rates[room_no]))
+        if len(rows) >= batch:
+            _insert_bookings(db, rows); rows = []
+    if rows:
+        _insert_bookings(db, rows)
+    db.execute("ANALYZE")
+    return db
+
+
+def _insert_bookings(db, rows):
+    with db.transaction(immediate=True) as c:
+        c.executemany("INSERT INTO stays (guest_name, room_id, phone, day_in, day_out, created_at, nights, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+# ---------- MEASUREMENT ----------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, rows=None):
+    ms = sorted(s * 1000.0 for s in samples)
+    result = {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+    }
+    if rows is not None:
+        result["rows_per_s"] = round(rows / sum(samples), 1) if sum(samples) else None
+    return result
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+class Bench:
+    def __init__(self, db, seed=1):
+        self.db = db
+        self.store = Store(db)
+        self.rng = random.Random(seed)
+        self.rooms = [r[0] for r in db.query("SELECT room_no FROM rooms")]
+        span = db.query("SELECT MIN(day_in), MAX(day_out), MAX(id) FROM stays")[0]
+        self.first_day = to_date(span[0]) if span[0] is not None else date.today()
+        self.last_day = to_date(span[1]) if span[1] is not None else date.today()
+        self.max_id = span[2] or 0
+        self.occupancy = OccupancyIndex(db, self.store.catalog, self.store.events)
+        self.conflicts = {"add_booking": 0, "update_booking": 0}
+
+    def _range(self, horizon=30):
+        days = max((self.last_day - self.first_day).days, 1)
+        frm = self.first_day + timedelta(days=self.rng.randint(days // 2, days + horizon))
+        return frm, frm + timedelta(days=_stay_length(self.rng))
+
+    def add_booking(self):
+        frm, to = self._range()
+        try:
+            self.store.add_booking("Bench Guest", self.rng.choice(self.rooms), "", frm.isoformat(), to.isoformat(), (to - frm).days)
+        except RoomOccupied:
+            self.conflicts["add_booking"] += 1
+
+    def update_booking(self):
+        booking_id = self.rng.randint(max(1, self.max_id - 5000), max(1, self.max_id))
+        row = self.store.get_booking(booking_id)
+        if row is None or not row[4]:
+            return
+        try:
+            self.store.update_booking(booking_id, row[1], row[2], row[3], row[4], row[5], row[6])
+        except RoomOccupied:
+            self.conflicts["update_booking"] += 1
+
+    def availability(self):
+        frm, to = self._range()
+        availability.free_rooms(self.db, frm.isoformat(), to.isoformat())
+
+    def earliest_fit(self):
+        room_type = self.rng.choice([None] + [t for t, _ in ROOM_TYPES])
+        self.occupancy.earliest_fit(_stay_length(self.rng), room_type, self.first_day + timedelta(days=(self.last_day - self.first_day).days // 2))
+
+    def search(self):
+        q = self.rng.choice(FIRST_NAMES)[: self.rng.randint(2, 5)] + " " + self.rng.choice(LAST_NAMES)[:3]
+        search.search_bookings(self.db, q)
+
+    def booking_page(self):
+        BookingPager(self.db).first_page()
+
+    def full_table_load(self):
+        return len(self.db.query("SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings ORDER BY created_at DESC"))
+
+    def csv_export(self, path):
+        return csvio.export_bookings(self.db, path)
+
+    def report(self):
+        # A year of monthly figures by room type against the year before.
+        end = self.first_day + timedelta(days=self.rng.randint(365, max(365, (self.last_day - self.first_day).days)))
+        reports.compare_years(self.db, end - timedelta(days=364), end, "month", by_type=True)
+
+    def quote(self):
+        frm, to = self._range()
+        room = self.store.catalog.get(self.rng.choice(self.rooms))
+        self.store.rates.quote(room.room_type, room.rate, to_day(frm), to_day(to))
+
+    def reprice(self):
+        # Stays in the later half of the timeline, about half the table.
+        return self.store.reprice(self.first_day + timedelta(days=(self.last_day - self.first_day).days // 2))
+
+    def invoice_render(self, items):
+        booking, room_type, rate = self.rng.choice(items)
+        invoices.render_invoice(booking, room_type, rate)
+
+
+def run_benchmarks(db, iterations=200, ops=OPERATIONS, seed=1):
+    bench = Bench(db, seed)
+    total = db.query("SELECT COUNT(*) FROM bookings")[0][0]
+    results = {}
+    for op in ops:
+        if op == "full_table_load":
+            samples = timed(bench.full_table_load, max(3, iterations // 50))
+            results[op] = summarize(samples, rows=total * len(samples))
+        elif op == "csv_export":
+            fd, path = tempfile.mkstemp(suffix=".csv"); os.close(fd)
+            try:
+                samples = timed(lambda: bench.csv_export(path), max(3, iterations // 50))
+            finally:
+                os.remove(path)
+            results[op] = summarize(samples, rows=total * len(samples))
+        elif op == "reprice":
+            # Only the first run writes; later runs find nothing to change.
+            changed = []
+            results[op] = summarize(timed(lambda: changed.append(bench.reprice()), max(3, iterations // 50)))
+            results[op]["repriced"] = changed[0]
+        elif op == "invoice_render":
+            items = invoices.select_bookings(db, bench.first_day.isoformat(), (bench.first_day + timedelta(days=30)).isoformat())[:1000]
+            if items:
+                results[op] = summarize(timed(lambda: bench.invoice_render(items), iterations))
+        else:
+            results[op] = summarize(timed(getattr(bench, op), iterations))
+            if op in bench.conflicts:
+                # Calls rejected by the overlap check are timed too.
+                results[op]["conflicts"] = bench.conflicts[op]
+    return results
+
+
+# ---------- CONCURRENT WRITERS ----------
+def _stress_writer(path, rooms, first_day, days, attempts, seed, barrier, results):
+    db = ConnectionManager(path)
+    store = Store(db)
+    rng = random.Random(seed)
+    booked = conflicts = errors = 0
+    samples = []
+    barrier.wait()
+    for _ in range(attempts):
+        frm = first_day + timedelta(days=rng.randint(0, days))
+        nights = _stay_length(rng)
+        t0 = time.perf_counter()
+        try:
+            store.add_booking(STRESS_GUEST, rng.choice(rooms), "", frm.isoformat(), (frm + timedelta(days=nights)).isoformat(), nights)
+            booked += 1
+        except RoomOccupied:
+            conflicts += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        samples.append(time.perf_counter() - t0)
+    db.close_all()
+    results.put((booked, conflicts, errors, samples))
+
+
+def run_stress(path, writers=8, attempts=300, hot_rooms=20, days=60, seed=1):
+    # Separate processes, each with its own connections, all booking the
+    # same few rooms over the same window so most attempts contend. The
+    # result is then checked for overlapping stays among the new rows.
+    db = ConnectionManager(path)
+    rooms = [r[0] for r in db.query("SELECT room_no FROM rooms ORDER BY room_no LIMIT ?", (hot_rooms,))]
+    last = db.query("SELECT MAX(day_out) FROM stays")[0][0]
+    first_day = to_date(last) + timedelta(days=1) if last is not None else date.today()
+    db.close_all()
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(writers + 1)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_stress_writer, args=(path, rooms, first_day, days, attempts, seed * 1000 + i, barrier, results))
+             for i in range(writers)]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    outcomes = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    db = ConnectionManager(path)
+    double_booked = db.query("""
+        SELECT COUNT(*) FROM stays a JOIN stays b
+          ON b.room_id = a.room_id AND b.id != a.id AND b.day_out > a.day_in AND b.day_in < a.day_out
+        WHERE a.guest_name = ?
+    """, (STRESS_GUEST,))[0][0]
+    db.close_all()
+    booked = sum(o[0] for o in outcomes)
+    return {
+        "writers": writers,
+        "attempts": writers * attempts,
+        "rooms": len(rooms),
+        "booked": booked,
+        "conflicts": sum(o[1] for o in outcomes),
+        "errors": sum(o[2] for o in outcomes),
+        "double_bookings": double_booked,
+        "seconds": round(elapsed, 3),
+        "bookings_per_s": round(booked / elapsed, 1) if elapsed else None,
+        "attempts_per_s": round(writers * attempts / elapsed, 1) if elapsed else None,
+        "latency": summarize([s for o in outcomes for s in o[3]]),
+    }
+
+
+# ---------- API LOAD ----------
+def _api_client(port, paths, results):
+    # One keep-alive connection issuing its share of requests in order.
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    samples, errors = [], 0
+    for method, path, body in paths:
+        t0 = time.perf_counter()
+        conn.request(method, path, body=body, headers={"Content-Type": "application/json"} if body else {})
+        response = conn.getresponse()
+        response.read()
+        samples.append(time.perf_counter() - t0)
+        if response.status >= 500:
+            errors += 1
+    conn.close()
+    results.append((samples, errors))
+
+
+def run_api_load(path, clients=8, requests=500, workers=4, seed=1):
+    # Starts api.ApiServer on a free port in this process and drives it
+    # from client threads over keep-alive connections with a read-heavy
+    # mix: bookings by id, availability, earliest fit, search and batches.
+    import api
+
+    db = ConnectionManager(path)
+    rng = random.Random(seed)
+    ids = [r[0] for r in db.query("SELECT id FROM stays ORDER BY RANDOM() LIMIT 1000")] or [1]
+    last = db.query("SELECT MAX(day_out) FROM stays")[0][0]
+    base = to_date(last) - timedelta(days=30) if last is not None else date.today()
+    names = [r[0].split()[0] for r in db.query("SELECT guest_name FROM stays LIMIT 200")] or ["guest"]
+    server = api.ApiServer(db, port=0, workers=workers)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def request():
+        kind = rng.random()
+        frm = base + timedelta(days=rng.randint(0, 60))
+        if kind < 0.4:
+            return "GET", f"/bookings/{rng.choice(ids)}", None
+        if kind < 0.7:
+            return "GET", f"/availability?from={frm}&to={frm + timedelta(days=rng.randint(1, 7))}", None
+        if kind < 0.8:
+            return "GET", f"/availability/earliest?nights={rng.randint(1, 7)}&from={frm}", None
+        if kind < 0.9:
+            return "GET", f"/search?q={rng.choice(names)}&limit=20", None
+        batch = [{"path": f"/bookings/{rng.choice(ids)}"} for _ in range(10)]
+        return "POST", "/batch", json.dumps(batch)
+    plans = [[request() for _ in range(requests)] for _ in range(clients)]
+    results = []
+    threads = [threading.Thread(target=_api_client, args=(server.port, plan, results)) for plan in plans]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.close()
+    db.close_all()
+    total = clients * requests
+    return {
+        "clients": clients,
+        "workers": workers,
+        "requests": total,
+        "errors": sum(r[1] for r in results),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1) if elapsed else None,
+        "latency": summarize([s for r in results for s in r[0]]),
+    }
+
+
+# ---------- BACKUP ----------
+def run_backup_load(path, seconds=5.0, pages=backup.PAGES_PER_STEP, pause=backup.STEP_PAUSE, seed=1):
+    # Booking-write latency from one writer, first alone and then while a
+    # backup of the same database runs: stepped as backup.py does it, and
+    # as a single step for comparison. Bookings go after the last stay so
+    # none conflict.
+    db = ConnectionManager(path)
+    store = Store(db)
+    rng = random.Random(seed)
+    rooms = store.catalog.room_numbers()
+    last = db.query("SELECT MAX(day_out) FROM stays")[0][0]
+    start = to_date(last) + timedelta(days=1) if last is not None else date.today()
+    cursors = dict.fromkeys(rooms, start)
+    size_mb = os.path.getsize(path) / 1048576.0
+
+    def write(samples):
+        room = rng.choice(rooms)
+        frm = cursors[room]
+        to = cursors[room] = frm + timedelta(days=_stay_length(rng))
+        t0 = time.perf_counter()
+        store.add_booking(STRESS_GUEST, room, "", frm.isoformat(), to.isoformat(), (to - frm).days)
+        samples.append(time.perf_counter() - t0)
+
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        write(samples)
+    report = {"db_mb": round(size_mb, 1), "baseline": summarize(samples)}
+    tmpdir = tempfile.mkdtemp(prefix="hotelms-backup-")
+    for mode, step_pages, step_pause in (("stepped", pages, pause), ("single_step", -1, 0)):
+        dest = os.path.join(tmpdir, f"{mode}.db")
+        result, samples = {}, []
+
+        def run():
+            t0 = time.perf_counter()
+            result["pages"] = backup.backup(db, dest, step_pages, step_pause)[1]
+            result["seconds"] = round(time.perf_counter() - t0, 3)
+        thread = threading.Thread(target=run)
+        thread.start()
+        while thread.is_alive():
+            write(samples)
+        thread.join()
+        os.remove(dest)
+        report[mode] = {"pages_per_step": step_pages, "pause_ms": step_pause * 1000.0, **result, "writes": summarize(samples) if samples else None}
+    os.rmdir(tmpdir)
+    db.close_all()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a synthetic hotel.db and time the core operations")
+    parser.add_argument("--db", help="database file (default: a fresh temporary file)")
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--bookings", type=int, default=100000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="comma-separated subset of: " + ", ".join(OPERATIONS))
+    parser.add_argument("--reuse", action="store_true", help="benchmark an existing --db without reseeding")
+    parser.add_argument("--stress", type=int, metavar="WRITERS", help="also run N concurrent writer processes against a few hot rooms")
+    parser.add_argument("--stress-attempts", type=int, default=300, help="booking attempts per writer")
+    parser.add_argument("--api", type=int, metavar="CLIENTS", help="also load-test the JSON API (api.py) with N keep-alive clients")
+    parser.add_argument("--api-requests", type=int, default=500, help="requests per API client")
+    parser.add_argument("--api-workers", type=int, default=4, help="API server threads running SQLite calls")
+    parser.add_argument("--backup", type=float, metavar="SECONDS", help="also time booking writes alone for SECONDS and then during a backup")
+    parser.add_argument("--profile", action="store_true", help="include per-statement timings from instrument.Profiler")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    ops = [op for op in args.ops.split(",") if op]
+    unknown = set(ops) - set(OPERATIONS)
+    if unknown:
+        parser.error("unknown operations: " + ", ".join(sorted(unknown)))
+    tmpdir = None
+    path = args.db
+    if path is None:
+        tmpdir = tempfile.mkdtemp(prefix="hotelms-bench-")
+        path = os.path.join(tmpdir, "bench.db")
+    if args.reuse:
+        db = ConnectionManager(path)
+        migrations.migrate(db)
+        seed_seconds = 0.0
+    else:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        t0 = time.perf_counter()
+        db = seed_database(path, args.rooms, args.bookings, args.seed)
+        seed_seconds = time.perf_counter() - t0
+    profiler = None
+    if args.profile:
+        # Reopen with a profiler so only the timed operations are recorded.
+        db.close_all()
+        profiler = Profiler(slow_ms=float("inf"))
+        db = ConnectionManager(path, profiler=profiler)
+    report = {
+        "config": {"rooms": args.rooms, "bookings": args.bookings, "iterations": args.iterations, "seed": args.seed, "db": path, "reused": args.reuse},
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "seed_seconds": round(seed_seconds, 3),
+        "results": run_benchmarks(db, args.iterations, ops, args.seed),
+    }
+    if args.stress:
+        db.close_all()
+        report["stress"] = run_stress(path, args.stress, args.stress_attempts, seed=args.seed)
+    if args.api:
+        db.close_all()
+        report["api"] = run_api_load(path, args.api, args.api_requests, args.api_workers, args.seed)
+    if args.backup:
+        db.close_all()
+        report["backup"] = run_backup_load(path, args.backup, seed=args.seed)
+    if profiler is not None:
+        report["queries"] = profiler.snapshot(limit=20)["queries"]
+    db.close_all()
+    if tmpdir:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.rmdir(tmpdir)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
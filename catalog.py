@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import insort
+
+from events import INSERT, UPDATE, DELETE
+
+ROOMS_SQL = "SELECT id, room_no, room_type, rate, notes FROM rooms"
+VERSION_SQL = "SELECT version FROM table_versions WHERE name = ?"
+# How long a thread trusts a cache before re-reading the table's counter.
+# The check costs about as much as a primary-key lookup, so doing it on
+# every call would gain nothing.
+RECHECK_SECONDS = 0.25
+
+
+class TableWatch:
+    # Tells an in-memory cache whether a table changed since it was loaded,
+    # by comparing the table's trigger-maintained counter in table_versions
+    # (at most every RECHECK_SECONDS per thread). PRAGMA data_version is no
+    # use as a shortcut: it ignores commits made on the same connection, so
+    # bulk writes outside the Store (CSV import, archiving) would go unseen.
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.version = None
+        self._local = threading.local()
+
+    def stored(self):
+        r = self.db.query(VERSION_SQL, (self.table,))
+        return r[0][0] if r else None
+
+    def loaded(self):
+        # Call just before reading the table into the cache.
+        self.version = self.stored()
+
+    def stale(self, force=False):
+        local = self._local
+        now = time.monotonic()
+        if not force and now < getattr(local, "recheck_at", 0.0):
+            return False
+        local.recheck_at = now + RECHECK_SECONDS
+        return self.stored() != self.version
+
+    def applied(self):
+        # After patching the cache from one of our own write events: every
+        # such write bumps the counter once, so anything more means another
+        # writer got in between and the cache must be reloaded.
+        version = self.stored()
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+            return True
+        return False
+
+
+class RoomRecord:
+    __slots__ = ("id", "room_no", "room_type", "rate", "notes")
+
+    def __init__(self, id, room_no, room_type, rate, notes):
+        self.id = id
+        self.room_no = room_no
+        self.room_type = room_type or ""
+        self.rate = float(rate or 0.0)
+        self.notes = notes or ""
+
+    def as_row(self):
+        return (self.id, self.room_no, self.room_type, self.rate, self.notes)
+
+
+class RoomCatalog:
+    # All rooms, held in memory and keyed by room_no. Store room writes are
+    # applied from their RowEvents; other writers are caught by a TableWatch
+    # on rooms. Bulk writes outside the Store (CSV import) should call
+    # invalidate() so the next read does not wait out RECHECK_SECONDS.
+    def __init__(self, db, events=None):
+        self.db = db
+        self.watch = TableWatch(db, "rooms")
+        self._lock = threading.RLock()
+        # (rooms by room_no, sorted room_nos), replaced wholesale on every
+        # change so readers on other threads always see a consistent pair.
+        self._state = None
+        if events is not None:
+            events.subscribe("rooms", self.on_event)
+
+    def _load(self):
+        with self._lock:
+            self.watch.loaded()
+            rooms = {row[1]: RoomRecord(*row) for row in self.db.query(ROOMS_SQL)}
+            self._state = (rooms, sorted(rooms))
+            return self._state
+
+    def refresh(self, force=False):
+        state = self._state
+        if state is None or self.watch.stale(force):
+            return self._load()
+        return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def on_event(self, event):
+        with self._lock:
+            if self._state is None:
+                return
+            rooms, order = dict(self._state[0]), list(self._state[1])
+            if event.action in (UPDATE, DELETE):
+                old = event.old or event.row
+                if rooms.pop(old[1], None) is not None:
+                    order.remove(old[1])
+            if event.action in (INSERT, UPDATE):
+                rec = RoomRecord(*event.row)
+                rooms[rec.room_no] = rec
+                insort(order, rec.room_no)
+            self._state = (rooms, order) if self.watch.applied() else None
+
+    # ---------- LOOKUPS ----------
+    def get(self, room_no):
+        return self.refresh()[0].get(room_no)
+
+    def rate(self, room_no):
+        rec = self.get(room_no)
+        return rec.rate if rec is not None else 0.0
+
+    def room_numbers(self):
+        return list(self.refresh()[1])
+
+    def rooms(self):
+        rooms, order = self.refresh()
+        return [rooms[n] for n in order]
+
+    def room_types(self):
+        return sorted({r.room_type for r in self.refresh()[0].values() if r.room_type})
+
+    def __len__(self):
+        return len(self.refresh()[0])
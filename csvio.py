@@ -0,0 +1,271 @@
+import argparse
+import csv
+from bisect import bisect_left
+from datetime import datetime, timezone
+from operator import itemgetter
+
+from days import MAX_NIGHTS, parse_day, to_day
+from rates import RateBook
+from store import BOOKING_COLUMNS
+
+EXPORT_HEADER = ["ID", "Guest Name", "Room No", "Phone", "Check-in", "Check-out", "Nights", "Total", "Created At"]
+CHUNK_SIZE = 5000
+BATCH_SIZE = 10000
+WRITE_BUFFER = 1 << 20
+
+
+# ---------- EXPORT ----------
+def export_bookings(db, fpath, date_from=None, date_to=None, job=None, chunk_size=CHUNK_SIZE, include_archive=False):
+    # Streams rows from the cursor in fixed-size chunks, so memory stays
+    # flat however many bookings there are. The optional range filters on
+    # check-in date, both ends inclusive. Archived stays follow the live
+    # ones when included.
+    clauses, params = [], []
+    if date_from:
+        clauses.append("check_in >= ?"); params.append(date_from)
+    if date_to:
+        clauses.append("check_in <= ?"); params.append(date_to)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    tables = ("bookings", "bookings_archive") if include_archive else ("bookings",)
+    count = 0
+    with open(fpath, mode="w", newline='', encoding="utf-8", buffering=WRITE_BUFFER) as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        for table in tables:
+            cur = db.execute(f"SELECT {', '.join(BOOKING_COLUMNS)} FROM {table}{where} ORDER BY created_at DESC, id DESC", params)
+            try:
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    count += len(rows)
+                    if job is not None:
+                        job.check()
+                        job.progress(count)
+            finally:
+                cur.close()
+    return count
+
+
+# ---------- IMPORT ----------
+class ImportReport:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = []  # (line number, reason)
+
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+    def write_rejects(self, fpath):
+        with open(fpath, mode="w", newline='', encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Line", "Reason"])
+            writer.writerows(self.rejected)
+
+    def summary(self):
+        return f"{self.accepted} rows imported, {len(self.rejected)} rejected"
+
+
+ROOM_FIELDS = ("room_no", "room_type", "rate", "notes")
+BOOKING_FIELDS = ("guest_name", "room_no", "phone", "check_in", "check_out", "total", "created_at")
+
+
+def _normalize(name):
+    name = name.strip().lower().replace("-", "_").replace(" ", "_")
+    return "room_type" if name == "type" else name
+
+
+def _read_rows(f, fields):
+    # Yields (line number, field values) in `fields` order. Header names are
+    # normalized so both the export header ("Check-in") and column names
+    # ("check_in") work; missing columns read as "".
+    reader = csv.reader(f)
+    header = [_normalize(h) for h in next(reader, [])]
+    width = len(header)
+    pick = itemgetter(*[header.index(c) if c in header else width for c in fields])
+    pad = [""] * (width + 1)
+    for row in reader:
+        if row:
+            # Fields past the header are dropped, so slot `width` (every
+            # missing column) is always "".
+            del row[width:]
+            row.extend(pad[len(row):])
+            yield reader.line_num, pick(row)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _float(value, default=0.0):
+    value = value.strip()
+    return float(value) if value else default
+
+
+def import_rooms(db, fpath, job=None, batch_size=BATCH_SIZE):
+    report = ImportReport()
+    with open(fpath, newline='', encoding="utf-8-sig") as f:
+        for batch in _batches(_read_rows(f, ROOM_FIELDS), batch_size):
+            with db.transaction(immediate=True) as c:
+                existing = {r[0] for r in c.execute("SELECT room_no FROM rooms")}
+                accepted = []
+                for line, (room_no, room_type, rate, notes) in batch:
+                    room_no = room_no.strip()
+                    if not room_no:
+                        report.reject(line, "room number is required"); continue
+                    if room_no in existing:
+                        report.reject(line, f"room {room_no} already exists"); continue
+                    try:
+                        rate = _float(rate)
+                    except ValueError:
+                        report.reject(line, "rate must be a number"); continue
+                    existing.add(room_no)
+                    accepted.append((room_no, room_type.strip(), rate, notes.strip()))
+                c.executemany("INSERT INTO rooms (room_no, room_type, rate, notes) VALUES (?, ?, ?, ?)", accepted)
+            report.accepted += len(accepted)
+            if job is not None:
+                job.check()
+                job.progress(report.accepted)
+    return report
+
+
+def _parse_booking(line, values, rooms, rates, stamp, report):
+    # Returns (line, name, room_no, phone, day_in, day_out, nights, total,
+    # created_at), with day numbers (None when undated) for the dates.
+    name, room, phone, check_in, check_out, total, created_at = values
+    name, room, check_in, check_out = name.strip(), room.strip(), check_in.strip(), check_out.strip()
+    if not name or not room:
+        report.reject(line, "guest name and room number are required"); return None
+    if room not in rooms:
+        report.reject(line, f"unknown room {room}"); return None
+    try:
+        dt_in = parse_day(check_in) if check_in else None
+        dt_out = parse_day(check_out) if check_out else None
+    except ValueError as e:
+        report.reject(line, f"date format should be YYYY-MM-DD: {e}"); return None
+    nights = 0
+    if dt_in and dt_out:
+        nights = (dt_out - dt_in).days
+        if nights <= 0:
+            report.reject(line, "check-out must be after check-in"); return None
+        if nights > MAX_NIGHTS:
+            report.reject(line, f"a stay can be at most {MAX_NIGHTS} nights"); return None
+    try:
+        total = _float(total, None)
+    except ValueError:
+        report.reject(line, "total must be a number"); return None
+    day_in, day_out = to_day(dt_in), to_day(dt_out)
+    if total is None:
+        total = rates.quote(rooms[room][2], rooms[room][1], day_in, day_out)
+    return (line, name, room, phone.strip(), day_in, day_out, nights, total, created_at.strip() or stamp)
+
+
+def _existing_stays(c, rows):
+    # One indexed query per batch (chunked to stay under the bound
+    # parameter limit) fetches the stored stays that could clash, grouped
+    # per room as sorted starts plus a running maximum of ends.
+    rooms = sorted({r[2] for r in rows})
+    lo, hi = min(r[4] for r in rows), max(r[5] for r in rows)
+    stays = {}
+    for i in range(0, len(rooms), 500):
+        chunk = rooms[i:i + 500]
+        marks = ", ".join("?" * len(chunk))
+        stays_sql = f"""
+            SELECT r.room_no, s.day_in, s.day_out FROM stays s JOIN rooms r ON r.id = s.room_id
+            WHERE r.room_no IN ({marks}) AND s.day_out > ? AND s.day_in < ? ORDER BY r.room_no, s.day_in
+        """
+        for room, ci, co in c.execute(stays_sql, (*chunk, lo, hi)):
+            stays.setdefault(room, []).append((ci, co))
+    index = {}
+    for room, spans in stays.items():
+        ends, top = [], float("-inf")
+        for _, co in spans:
+            top = max(top, co)
+            ends.append(top)
+        index[room] = ([ci for ci, _ in spans], ends)
+    return index
+
+
+def _reject_overlaps(c, rows, report):
+    # Checks the whole batch in one pass: each stay is tested against the
+    # stored stays with a bisect, then a sort + sweep finds stays in the
+    # batch that overlap each other.
+    dated = [r for r in rows if r[4] is not None and r[5] is not None]
+    if not dated:
+        return rows
+    index = _existing_stays(c, dated)
+    bad = set()
+    for r in dated:
+        spans = index.get(r[2])
+        if spans:
+            i = bisect_left(spans[0], r[5])
+            if i and spans[1][i - 1] > r[4]:
+                bad.add(r[0])
+                report.reject(r[0], f"room {r[2]} is occupied during these dates")
+    room, last_out = None, float("-inf")
+    for r in sorted((r for r in dated if r[0] not in bad), key=lambda r: (r[2], r[4], r[0])):
+        if r[2] != room:
+            room, last_out = r[2], float("-inf")
+        if r[4] < last_out:
+            bad.add(r[0])
+            report.reject(r[0], f"overlaps another imported stay in room {r[2]}")
+            continue
+        last_out = r[5]
+    return [r for r in rows if r[0] not in bad] if bad else rows
+
+
+def import_bookings(db, fpath, job=None, batch_size=BATCH_SIZE):
+    # Each batch is validated, overlap-checked and inserted straight into
+    # stays with a single executemany inside one transaction.
+    report = ImportReport()
+    rooms = {r[0]: (r[1], float(r[2] or 0), r[3] or "") for r in db.query("SELECT room_no, id, rate, room_type FROM rooms")}
+    rates = RateBook(db)
+    # Rows without a created_at get one import timestamp, formatted like
+    # CURRENT_TIMESTAMP, instead of evaluating it per row.
+    stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    with open(fpath, newline='', encoding="utf-8-sig") as f:
+        for batch in _batches(_read_rows(f, BOOKING_FIELDS), batch_size):
+            rows = [p for p in (_parse_booking(line, values, rooms, rates, stamp, report) for line, values in batch) if p]
+            with db.transaction(immediate=True) as c:
+                rows = _reject_overlaps(c, rows, report)
+                c.executemany(
+                    "INSERT INTO stays (guest_name, room_id, phone, day_in, day_out, nights, total, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(r[1], rooms[r[2]][0], *r[3:]) for r in rows]
+                )
+            report.accepted += len(rows)
+            if job is not None:
+                job.check()
+                job.progress(report.accepted)
+    report.rejected.sort()
+    return report
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Bulk CSV export/import for hotel.db")
+    parser.add_argument("command", choices=["export", "import-bookings", "import-rooms"])
+    parser.add_argument("file")
+    parser.add_argument("--db", default="hotel.db")
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    migrations.migrate(db)
+    if args.command == "export":
+        print(f"Exported {export_bookings(db, args.file, args.date_from, args.date_to)} bookings")
+    else:
+        report = (import_bookings if args.command == "import-bookings" else import_rooms)(db, args.file)
+        print(report.summary())
+        for line, reason in report.rejected[:20]:
+            print(f"  line {line}: {reason}")
+    db.close_all()
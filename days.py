@@ -0,0 +1,38 @@
+from datetime import date
+from functools import lru_cache
+
+# Stays store dates as day numbers: days since 1970-01-01, the numbering
+# SQLite's 'unixepoch' modifier uses, so SQL converts with the expressions
+# below and Python with to_day/to_date/from_day.
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DAY_SQL = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+DATE_SQL = "IFNULL(date({} * 86400, 'unixepoch'), '')"
+# Longest stay accepted: a year, inside both the availability window and
+# the nights the daily rollup spreads a stay over (ROLLUP_MAX_NIGHTS).
+MAX_NIGHTS = 366
+
+
+@lru_cache(maxsize=8192)
+def parse_day(value):
+    # Strict YYYY-MM-DD (fromisoformat alone also takes 20240101 and week
+    # dates). Dates repeat heavily, so parsing is memoized.
+    if len(value) != 10 or value[4] != "-" or value[7] != "-":
+        raise ValueError(value)
+    return date.fromisoformat(value)
+
+
+def to_day(value):
+    # Day number for a date or YYYY-MM-DD string; None for an empty date.
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = parse_day(value)
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def to_date(day):
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def from_day(day):
+    return "" if day is None else to_date(day).isoformat()
@@ -0,0 +1,135 @@
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from instrument import TracedConnection
+
+BUSY_TIMEOUT = 5.0
+STATEMENT_CACHE_SIZE = 256
+WRITE_RETRIES = 4
+RETRY_DELAY = 0.05
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error))
+
+
+class ConnectionManager:
+    # One long-lived connection per thread. Connections run in autocommit
+    # mode; multi-statement work goes through transaction(). With a
+    # profiler attached, every statement is timed (see instrument.py).
+    def __init__(self, path, timeout=BUSY_TIMEOUT, profiler=None):
+        self.path = path
+        self.timeout = timeout
+        self.profiler = profiler
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False,
+                factory=TracedConnection if self.profiler is not None else sqlite3.Connection,
+            )
+            if self.profiler is not None:
+                conn.profiler = self.profiler
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute(self, query, params=()):
+        return self.connection().execute(query, params)
+
+    def executemany(self, query, seq):
+        return self.connection().executemany(query, seq)
+
+    def query(self, query, params=()):
+        conn = self.connection()
+        if self.profiler is None:
+            return conn.execute(query, params).fetchall()
+        # Timed here rather than in TracedConnection so the fetch and the
+        # row count are included.
+        t0 = time.perf_counter()
+        try:
+            rows = sqlite3.Connection.execute(conn, query, params).fetchall()
+        except sqlite3.Error as e:
+            self.profiler.record(conn, query, params, time.perf_counter() - t0, -1, error=e)
+            raise
+        self.profiler.record(conn, query, params, time.perf_counter() - t0, len(rows))
+        return rows
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        conn = self.connection()
+        if conn.in_transaction:
+            # Nested use joins the enclosing transaction.
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        if self.profiler is None:
+            conn.commit()
+            return
+        t0 = time.perf_counter()
+        conn.commit()
+        self.profiler.record(conn, "COMMIT", (), time.perf_counter() - t0, 0)
+
+    def write(self, fn, retries=WRITE_RETRIES):
+        # Runs fn(conn) in a BEGIN IMMEDIATE transaction, so reads inside it
+        # (overlap checks) and the write see the same snapshot and no other
+        # writer can slip in between. If the lock is still held after the
+        # busy timeout, retries with jittered exponential backoff. Nested
+        # calls join the enclosing transaction and are never retried.
+        attempt = 0
+        while True:
+            nested = self.connection().in_transaction
+            try:
+                with self.transaction(immediate=True) as c:
+                    return fn(c)
+            except sqlite3.OperationalError as e:
+                if nested or attempt >= retries or not is_busy(e):
+                    raise
+            time.sleep(RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            conns, self._connections = self._connections, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
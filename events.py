@@ -0,0 +1,27 @@
+from collections import defaultdict, namedtuple
+
+INSERT, UPDATE, DELETE = "insert", "update", "delete"
+# A bulk write changed many rows at once; subscribers re-read the table.
+RELOAD = "reload"
+
+# row is the row after the change (the removed row for DELETE); old is the
+# row before an UPDATE and None otherwise. Both are None for RELOAD.
+RowEvent = namedtuple("RowEvent", "table action row old")
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, table, callback):
+        self._subscribers[table].append(callback)
+
+    def unsubscribe(self, table, callback):
+        if callback in self._subscribers[table]:
+            self._subscribers[table].remove(callback)
+
+    def emit(self, table, action, row, old=None):
+        event = RowEvent(table, action, row, old)
+        for callback in list(self._subscribers[table]):
+            callback(event)
+        return event
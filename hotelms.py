@@ -1,68 +1,116 @@
+import time
+LAUNCHED = time.perf_counter()  # before the other imports, for the startup report
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import sqlite3
-import csv
-from datetime import datetime
+from datetime import date, timedelta
 import os
+import bisect
+
+from days import parse_day
+from db import ConnectionManager
+import archive
+import backup
+import migrations
+import csvio
+import invoices
+import reports
+import search
+from invoices import FPDF_AVAILABLE
+from paging import BookingPager
+from occupancy import SEARCH_HORIZON
+from service import HotelService, ValidationError, NotFound, DuplicateRoom
+from store import RoomOccupied, UnknownRoom
+from events import INSERT, UPDATE, DELETE, RELOAD
+from worker import BackgroundWorker, Cancelled
+from instrument import Profiler, traced, format_report
 
 DB_FILE = "hotel.db"
+BACKUP_DIR = os.environ.get("HOTELMS_BACKUP_DIR", "backups")
+BACKUP_MINUTES = float(os.environ.get("HOTELMS_BACKUP_MINUTES", "0"))
+SEARCH_DEBOUNCE_MS = 250
 
-try:
-    from fpdf import FPDF
-    FPDF_AVAILABLE = True
-except Exception:
-    FPDF_AVAILABLE = False
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS rooms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_no TEXT UNIQUE NOT NULL,
-            room_type TEXT,
-            rate REAL DEFAULT 0,
-            notes TEXT
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guest_name TEXT NOT NULL,
-            room_no TEXT NOT NULL,
-            phone TEXT,
-            check_in TEXT,
-            check_out TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            nights INTEGER DEFAULT 0,
-            total REAL DEFAULT 0
-        )
-    """)
-    conn.commit()
-    conn.close()
+def init_db(db):
+    migrations.migrate(db)
 
 class HotelApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Hotel Management System — Rooms & Invoices")
         self.root.geometry("1000x650")
-        init_db()
+        self.profiler = Profiler(launched=LAUNCHED)
+        self.startup = self.profiler.startup
+        self.startup.mark("imports")
+        self.db = ConnectionManager(DB_FILE, profiler=self.profiler)
+        init_db(self.db)
+        self._fts = search.has_fts(self.db)
+        self.startup.mark("open database")
+        self.service = HotelService(self.db)
+        self.store = self.service.store
+        self.pager = BookingPager(self.db)
+        self._paging = True
+        self._page_job = None
+        self._room_order = []
+        self._search_after = None
+        self._search_job = None
         self.create_widgets()
-        self.populate_room_tree()
-        self.populate_booking_tree()
-        self.update_room_dropdown()
-
-    def run_query(self, query, params=(), commit=False):
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute(query, params)
-        result = c.fetchall()
-        if commit:
-            conn.commit()
-            conn.close()
-            return None
-        conn.close()
-        return result
+        self.worker = BackgroundWorker(self.root, self.status_var, on_jobs_changed=self.on_jobs_changed, profiler=self.profiler)
+        # Store writes may run on pool threads; hop back to Tk before
+        # touching widgets.
+        self.store.events.subscribe("rooms", lambda ev: self.worker.call_soon(self.on_room_event, ev))
+        self.store.events.subscribe("bookings", lambda ev: self.worker.call_soon(self.on_booking_event, ev))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.backups = None
+        if BACKUP_MINUTES > 0:
+            self.backups = backup.BackupScheduler(self.db, BACKUP_DIR, BACKUP_MINUTES * 60.0,
+                                                  on_done=lambda r: self.worker.call_soon(self.status_var.set, f"Backed up to {r[0]}"))
+            self.backups.start()
+        self.startup.mark("build widgets")
+        # Rooms and the first page of bookings load once the window is up.
+        self.root.after_idle(self.initial_load)
+
+    def initial_load(self):
+        self.startup.mark("show window")
+        plan = self.pager.plan_first()
+
+        def load(job):
+            self.store.catalog.refresh(force=True)
+            return self.pager.fetch(plan)
+
+        def done(fetched):
+            self.startup.mark("load rooms and bookings")
+            self._fill_room_tree()
+            self.update_room_dropdown()
+            self._fill_booking_tree(self.pager.apply_first(plan, fetched) or [])
+            self._booking_status()
+            self.root.update_idletasks()
+            self.startup.mark("fill tables")
+
+        def failed(error):
+            self._paging = False
+            messagebox.showerror("Database Error", str(error))
+        self.worker.submit("Loading bookings", load, on_done=done, on_error=failed)
+
+    def run_query(self, query, params=()):
+        return self.db.query(query, params)
+
+    def on_close(self):
+        if self.backups is not None:
+            self.backups.stop()
+        self.root.withdraw()
+
+        def close_db():
+            # Runs once the pool has drained, so no job still holds a
+            # connection.
+            self.db.execute("PRAGMA optimize")
+            self.db.close_all()
+
+        def finish():
+            dump = os.environ.get("HOTELMS_PROFILE_DUMP")
+            if dump:
+                self.profiler.dump(dump)
+            self.root.destroy()
+        self.worker.shutdown(final=close_db, on_done=finish)
 
     def create_widgets(self):
         nb = ttk.Notebook(self.root)
@@ -94,16 +142,27 @@ class HotelApp:
         btn_frame = ttk.Frame(frm); btn_frame.grid(row=3, column=0, columnspan=4, pady=8)
         ttk.Button(btn_frame, text="Add Booking", command=self.add_booking).grid(row=0, column=0, padx=6)
         ttk.Button(btn_frame, text="Update Selected", command=self.update_booking).grid(row=0, column=1, padx=6)
-        ttk.Button(btn_frame, text="Check-out (Delete)", command=self.delete_booking).grid(row=0, column=2, padx=6)
+        ttk.Button(btn_frame, text="Check-out (Archive)", command=self.check_out_booking).grid(row=0, column=2, padx=6)
         ttk.Button(btn_frame, text="Export CSV", command=self.export_csv).grid(row=0, column=3, padx=6)
         ttk.Button(btn_frame, text="Generate Invoice (selected)", command=self.generate_invoice).grid(row=0, column=4, padx=6)
+        ttk.Button(btn_frame, text="Import CSV", command=self.import_bookings_csv).grid(row=0, column=5, padx=6)
+        ttk.Button(btn_frame, text="Batch Invoices...", command=self.open_batch_invoices).grid(row=0, column=6, padx=6)
+        ttk.Button(btn_frame, text="Cancel (Delete)", command=self.delete_booking).grid(row=1, column=2, padx=6, pady=(6, 0))
+        ttk.Button(btn_frame, text="Archive Past Stays", command=self.archive_past_stays).grid(row=1, column=3, padx=6, pady=(6, 0))
 
         search_frame = ttk.LabelFrame(tab_book, text="Search", padding=8)
         search_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=6)
-        ttk.Label(search_frame, text="Query (name or room)").pack(side=tk.LEFT, padx=6)
+        ttk.Label(search_frame, text="Query (name, phone or room)").pack(side=tk.LEFT, padx=6)
         self.search_var = tk.StringVar(); ttk.Entry(search_frame, textvariable=self.search_var, width=40).pack(side=tk.LEFT, padx=6)
+        self.search_var.trace_add("write", self.on_search_typed)
         ttk.Button(search_frame, text="Search", command=self.search_bookings).pack(side=tk.LEFT, padx=6)
-        ttk.Button(search_frame, text="Clear Search", command=self.populate_booking_tree).pack(side=tk.LEFT, padx=6)
+        ttk.Button(search_frame, text="Clear Search", command=self.clear_search).pack(side=tk.LEFT, padx=6)
+        self.include_archive = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="Include archive", variable=self.include_archive, command=self.search_bookings).pack(side=tk.LEFT, padx=6)
+        self.export_to = ttk.Entry(search_frame, width=12); self.export_to.pack(side=tk.RIGHT, padx=6)
+        ttk.Label(search_frame, text="to").pack(side=tk.RIGHT)
+        self.export_from = ttk.Entry(search_frame, width=12); self.export_from.pack(side=tk.RIGHT, padx=6)
+        ttk.Label(search_frame, text="Export check-ins from").pack(side=tk.RIGHT, padx=6)
 
         tree_frame = ttk.Frame(tab_book); tree_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=6)
         columns = ("id", "guest_name", "room_no", "phone", "check_in", "check_out", "nights", "total", "created_at")
@@ -113,12 +172,14 @@ class HotelApp:
             ("phone","Phone",120), ("check_in","Check-in",100), ("check_out","Check-out",100),
             ("nights","Nights",70), ("total","Total",90), ("created_at","Created At",170)
         ]:
-            self.tree.heading(col, text=head)
+            self.tree.heading(col, text=head, command=lambda c=col: self.sort_bookings(c))
             self.tree.column(col, width=width, anchor=tk.CENTER if col!="guest_name" else tk.W)
+        self.tree_headings = {col: self.tree.heading(col, "text") for col in columns}
 
         vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
         hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscroll=vsb.set, xscroll=hsb.set)
+        self.tree_vsb = vsb
+        self.tree.configure(yscroll=self.on_tree_scroll, xscroll=hsb.set)
         self.tree.grid(row=0, column=0, sticky="nsew")
         vsb.grid(row=0, column=1, sticky="ns")
         hsb.grid(row=1, column=0, sticky="ew")
@@ -132,8 +193,23 @@ class HotelApp:
         self.av_from = ttk.Entry(avail_frame, width=15); self.av_from.grid(row=0, column=1, padx=6)
         ttk.Label(avail_frame, text="To (YYYY-MM-DD)").grid(row=0, column=2, padx=6, pady=4)
         self.av_to = ttk.Entry(avail_frame, width=15); self.av_to.grid(row=0, column=3, padx=6)
-        ttk.Button(avail_frame, text="Check Available Rooms", command=self.check_availability).grid(row=0, column=4, padx=8)
-        self.av_result = tk.StringVar(); ttk.Label(avail_frame, textvariable=self.av_result).grid(row=1, column=0, columnspan=6, sticky=tk.W, padx=6)
+        ttk.Label(avail_frame, text="Type").grid(row=0, column=4, padx=6, pady=4)
+        self.av_type_var = tk.StringVar()
+        self.av_type = ttk.Combobox(avail_frame, width=14, textvariable=self.av_type_var); self.av_type.grid(row=0, column=5, padx=6)
+        ttk.Label(avail_frame, text="Max rate").grid(row=0, column=6, padx=6, pady=4)
+        self.av_max_rate = ttk.Entry(avail_frame, width=10); self.av_max_rate.grid(row=0, column=7, padx=6)
+        ttk.Button(avail_frame, text="Check Available Rooms", command=self.check_availability).grid(row=0, column=8, padx=8)
+        ttk.Label(avail_frame, text="Nights").grid(row=1, column=0, padx=6, pady=4)
+        self.av_nights = ttk.Entry(avail_frame, width=15); self.av_nights.grid(row=1, column=1, padx=6)
+        ttk.Label(avail_frame, text="Within (days)").grid(row=1, column=2, padx=6, pady=4)
+        self.av_horizon = ttk.Entry(avail_frame, width=15); self.av_horizon.grid(row=1, column=3, padx=6); self.av_horizon.insert(0, str(SEARCH_HORIZON))
+        ttk.Button(avail_frame, text="Find Earliest Fit", command=self.find_earliest_fit).grid(row=1, column=8, padx=8)
+        ttk.Label(avail_frame, text="Dates (comma-separated)").grid(row=2, column=0, padx=6, pady=4)
+        self.av_dates = ttk.Entry(avail_frame, width=50); self.av_dates.grid(row=2, column=1, columnspan=5, sticky=tk.W, padx=6)
+        ttk.Label(avail_frame, text="At least").grid(row=2, column=6, padx=6, pady=4)
+        self.av_min_dates = ttk.Entry(avail_frame, width=10); self.av_min_dates.grid(row=2, column=7, padx=6)
+        ttk.Button(avail_frame, text="Rooms Free On Dates", command=self.find_free_on_dates).grid(row=2, column=8, padx=8)
+        self.av_result = tk.StringVar(); ttk.Label(avail_frame, textvariable=self.av_result).grid(row=3, column=0, columnspan=9, sticky=tk.W, padx=6)
 
         tab_rooms = ttk.Frame(nb)
         nb.add(tab_rooms, text="Rooms")
@@ -153,6 +229,7 @@ class HotelApp:
         ttk.Button(room_btns, text="Update Selected Room", command=self.update_room).grid(row=0, column=1, padx=6)
         ttk.Button(room_btns, text="Delete Selected Room", command=self.delete_room).grid(row=0, column=2, padx=6)
         ttk.Button(room_btns, text="Refresh Rooms", command=self.populate_room_tree).grid(row=0, column=3, padx=6)
+        ttk.Button(room_btns, text="Import Rooms CSV", command=self.import_rooms_csv).grid(row=0, column=4, padx=6)
         rframe = ttk.Frame(tab_rooms); rframe.pack(fill=tk.BOTH, expand=True, padx=10, pady=6)
         rcols = ("id","room_no","room_type","rate","notes")
         self.room_tree = ttk.Treeview(rframe, columns=rcols, show="headings", selectmode="browse")
@@ -168,40 +245,97 @@ class HotelApp:
         rvsb.grid(row=0, column=1, sticky="ns"); rhsb.grid(row=1, column=0, sticky="ew")
         rframe.grid_rowconfigure(0, weight=1); rframe.grid_columnconfigure(0, weight=1)
         self.room_tree.bind("<<TreeviewSelect>>", self.on_room_select)
+
+        tab_reports = ttk.Frame(nb)
+        nb.add(tab_reports, text="Reports")
+        rep_form = ttk.Frame(tab_reports, padding=10); rep_form.pack(side=tk.TOP, fill=tk.X)
+        ttk.Label(rep_form, text="From (YYYY-MM-DD)").grid(row=0, column=0, padx=4, pady=4)
+        self.rep_from = ttk.Entry(rep_form, width=12); self.rep_from.grid(row=0, column=1, padx=4, pady=4)
+        ttk.Label(rep_form, text="To (YYYY-MM-DD)").grid(row=0, column=2, padx=4, pady=4)
+        self.rep_to = ttk.Entry(rep_form, width=12); self.rep_to.grid(row=0, column=3, padx=4, pady=4)
+        self.rep_to.insert(0, date.today().isoformat()); self.rep_from.insert(0, (date.today() - timedelta(days=364)).isoformat())
+        ttk.Label(rep_form, text="Period").grid(row=0, column=4, padx=4, pady=4)
+        self.rep_period = tk.StringVar(value="month")
+        ttk.Combobox(rep_form, width=8, textvariable=self.rep_period, values=reports.PERIODS, state="readonly").grid(row=0, column=5, padx=4, pady=4)
+        self.rep_by_type = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rep_form, text="By room type", variable=self.rep_by_type).grid(row=0, column=6, padx=4, pady=4)
+        self.rep_compare = tk.BooleanVar(value=True)
+        ttk.Checkbutton(rep_form, text="Compare with previous year", variable=self.rep_compare).grid(row=0, column=7, padx=4, pady=4)
+        rep_btns = ttk.Frame(rep_form); rep_btns.grid(row=1, column=0, columnspan=8, pady=6, sticky=tk.W)
+        ttk.Button(rep_btns, text="Generate Report", command=self.generate_report).grid(row=0, column=0, padx=6)
+        ttk.Button(rep_btns, text="Export Report CSV", command=self.export_report).grid(row=0, column=1, padx=6)
+        self.rep_summary = tk.StringVar(); ttk.Label(rep_form, textvariable=self.rep_summary).grid(row=2, column=0, columnspan=8, sticky=tk.W, padx=4)
+        rep_frame = ttk.Frame(tab_reports); rep_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=6)
+        rep_cols = reports.REPORT_HEADER + reports.COMPARE_HEADER
+        self.report_tree = ttk.Treeview(rep_frame, columns=[str(i) for i in range(len(rep_cols))], show="headings")
+        for i, head in enumerate(rep_cols):
+            self.report_tree.heading(str(i), text=head); self.report_tree.column(str(i), width=90 if i > 1 else 100, anchor=tk.CENTER)
+        rep_vsb = ttk.Scrollbar(rep_frame, orient="vertical", command=self.report_tree.yview)
+        rep_hsb = ttk.Scrollbar(rep_frame, orient="horizontal", command=self.report_tree.xview)
+        self.report_tree.configure(yscroll=rep_vsb.set, xscroll=rep_hsb.set)
+        self.report_tree.grid(row=0, column=0, sticky="nsew")
+        rep_vsb.grid(row=0, column=1, sticky="ns"); rep_hsb.grid(row=1, column=0, sticky="ew")
+        rep_frame.grid_rowconfigure(0, weight=1); rep_frame.grid_columnconfigure(0, weight=1)
+        status_frame = ttk.Frame(self.root); status_frame.pack(fill=tk.X, side=tk.BOTTOM)
         self.status_var = tk.StringVar(); self.status_var.set("Ready")
-        ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W).pack(fill=tk.X, side=tk.BOTTOM)
+        self.btn_cancel = ttk.Button(status_frame, text="Cancel", command=lambda: self.worker.cancel_latest(), state=tk.DISABLED)
+        self.btn_cancel.pack(side=tk.RIGHT)
+        ttk.Button(status_frame, text="Diagnostics", command=self.open_diagnostics).pack(side=tk.RIGHT)
+        ttk.Button(status_frame, text="Backup Now", command=self.backup_now).pack(side=tk.RIGHT)
+        ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W).pack(fill=tk.X, side=tk.LEFT, expand=True)
+
+    @traced
+    def backup_now(self):
+        def done(result):
+            path, pages, seconds = result
+            self.status_var.set(f"Backed up {pages} pages to {path} in {seconds:.1f} s")
+        self.worker.submit("Backing up", lambda job: backup.take_snapshot(self.db, BACKUP_DIR, compress=True, job=job), on_done=done)
+
+    def on_jobs_changed(self, active):
+        self.btn_cancel.configure(state=tk.NORMAL if active else tk.DISABLED)
 
     # ---------- ROOM FUNCTIONS ----------
+    @traced
     def add_room(self):
         room_no = self.r_room_no.get().strip()
         room_type = self.r_type.get().strip()
         rate = self.r_rate.get().strip()
         notes = self.r_notes.get().strip()
-        if not room_no:
-            messagebox.showwarning("Validation", "Room number is required.")
-            return
-        try:
-            rate_f = float(rate) if rate else 0.0
-        except ValueError:
-            messagebox.showwarning("Validation", "Rate must be a number.")
-            return
 
-        try:
-            self.run_query("INSERT INTO rooms (room_no, room_type, rate, notes) VALUES (?, ?, ?, ?)", (room_no, room_type, rate_f, notes), commit=True)
+        def done(row):
             self.status_var.set(f"Added room {room_no}")
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Duplicate", "Room number already exists.")
-            return
-        self.clear_room_form()
-        self.populate_room_tree()
-        self.update_room_dropdown()
+            self.clear_room_form()
+        self.worker.submit(f"Adding room {room_no}", lambda job: self.service.add_room(room_no, room_type, rate, notes),
+                           on_done=done, on_error=self.service_error)
+
+    def service_error(self, error):
+        self.status_var.set("Ready")
+        if isinstance(error, ValidationError):
+            messagebox.showwarning("Validation", str(error))
+        elif isinstance(error, DuplicateRoom):
+            messagebox.showerror("Duplicate", str(error))
+        elif isinstance(error, RoomOccupied):
+            messagebox.showwarning("Room Occupied", "This room is occupied during the selected dates.")
+        elif isinstance(error, UnknownRoom):
+            messagebox.showwarning("Unknown Room", f"Room {error} does not exist.")
+        elif isinstance(error, NotFound):
+            messagebox.showinfo("Not Found", str(error))
+        else:
+            messagebox.showerror("Database Error", str(error))
 
+    @traced
     def populate_room_tree(self):
-        rows = self.run_query("SELECT id, room_no, room_type, rate, notes FROM rooms ORDER BY room_no")
-        for r in self.room_tree.get_children():
-            self.room_tree.delete(r)
+        def done(_):
+            self._fill_room_tree()
+            self.update_room_dropdown()
+        self.worker.submit("Loading rooms", lambda job: self.store.catalog.refresh(force=True), on_done=done)
+
+    def _fill_room_tree(self):
+        rows = [r.as_row() for r in self.store.catalog.rooms()]
+        self.room_tree.delete(*self.room_tree.get_children())
         for row in rows:
-            self.room_tree.insert("", tk.END, values=row)
+            self.room_tree.insert("", tk.END, iid=str(row[0]), values=row)
+        self._room_order = [(row[1], row[0]) for row in rows]
         self.status_var.set(f"{len(rows)} rooms loaded")
 
     def on_room_select(self, event):
@@ -213,6 +347,7 @@ class HotelApp:
         self.r_rate.delete(0, tk.END); self.r_rate.insert(0, vals[3])
         self.r_notes.delete(0, tk.END); self.r_notes.insert(0, vals[4])
 
+    @traced
     def update_room(self):
         sel = self.room_tree.selection()
         if not sel:
@@ -224,20 +359,10 @@ class HotelApp:
         room_type = self.r_type.get().strip()
         rate = self.r_rate.get().strip()
         notes = self.r_notes.get().strip()
-        try:
-            rate_f = float(rate) if rate else 0.0
-        except ValueError:
-            messagebox.showwarning("Validation", "Rate must be a number.")
-            return
-        try:
-            self.run_query("UPDATE rooms SET room_no=?, room_type=?, rate=?, notes=? WHERE id=?", (room_no, room_type, rate_f, notes, room_id), commit=True)
-            self.status_var.set(f"Updated room {room_no}")
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Duplicate", "Room number conflicts with existing room.")
-            return
-        self.populate_room_tree()
-        self.update_room_dropdown()
+        self.worker.submit(f"Updating room {room_no}", lambda job: self.service.update_room(room_id, room_no, room_type, rate, notes),
+                           on_done=lambda row: self.status_var.set(f"Updated room {room_no}"), on_error=self.service_error)
 
+    @traced
     def delete_room(self):
         sel = self.room_tree.selection()
         if not sel:
@@ -245,24 +370,49 @@ class HotelApp:
             return
         row = self.room_tree.item(sel[0], "values")
         room_id, room_no = row[0], row[1]
-        linked = self.run_query("SELECT id FROM bookings WHERE room_no=?", (room_no,))
-        if linked:
-            if not messagebox.askyesno("Confirm delete", f"There are {len(linked)} bookings for room {room_no}. Delete anyway?"):
-                return
-        self.run_query("DELETE FROM rooms WHERE id=?", (room_id,), commit=True)
-        self.status_var.set(f"Deleted room {room_no}")
-        self.populate_room_tree()
-        self.update_room_dropdown()
+        def confirm(linked):
+            if linked:
+                if not messagebox.askyesno("Confirm delete", f"There are {linked} bookings for room {room_no}. Delete anyway? They will be moved to the archive."):
+                    self.status_var.set("Ready")
+                    return
+
+            def done(row):
+                self.status_var.set(f"Deleted room {room_no}")
+                if linked:
+                    self.populate_booking_tree()
+            self.worker.submit(f"Deleting room {room_no}", lambda job: self.service.delete_room(room_id), on_done=done, on_error=self.service_error)
+        self.worker.submit(f"Checking bookings for room {room_no}", lambda job: self.service.room_booking_count(room_id), on_done=confirm)
 
     def clear_room_form(self):
         self.r_room_no.delete(0, tk.END); self.r_type.delete(0, tk.END); self.r_rate.delete(0, tk.END); self.r_notes.delete(0, tk.END)
 
     def update_room_dropdown(self):
-        rows = self.run_query("SELECT room_no FROM rooms ORDER BY room_no")
-        room_list = [r[0] for r in rows]
-        self.combo_room['values'] = room_list
+        self.combo_room['values'] = self.store.catalog.room_numbers()
+        self.av_type['values'] = [""] + self.store.catalog.room_types()
+
+    def on_room_event(self, event):
+        # Patch only the affected room row; _room_order mirrors the
+        # Treeview order so new rows can be placed with a bisect.
+        row, old = event.row, event.old
+        iid = str(row[0])
+        if event.action in (UPDATE, DELETE):
+            key = (old or row)[1], row[0]
+            i = bisect.bisect_left(self._room_order, key)
+            if i < len(self._room_order) and self._room_order[i] == key:
+                del self._room_order[i]
+            if self.room_tree.exists(iid):
+                self.room_tree.delete(iid)
+        if event.action in (INSERT, UPDATE):
+            i = bisect.bisect_left(self._room_order, (row[1], row[0]))
+            self._room_order.insert(i, (row[1], row[0]))
+            self.room_tree.insert("", i, iid=iid, values=row)
+        self.update_room_dropdown()
+        if event.action == UPDATE and old is not None and old[1] != row[1] and not self.pager.static:
+            # Its bookings follow the room to its new number.
+            self.populate_booking_tree()
 
     # ---------- BOOKING FUNCTIONS ----------
+    @traced
     def add_booking(self):
         name = self.entry_name.get().strip()
         room = self.room_var.get().strip()
@@ -270,57 +420,132 @@ class HotelApp:
         check_in = self.entry_checkin.get().strip()
         check_out = self.entry_checkout.get().strip()
 
-        if not name or not room:
-            messagebox.showwarning("Validation", "Guest name and room number are required.")
-            return
-
-        for d in (check_in, check_out):
-            if d:
-                try:
-                    datetime.strptime(d, "%Y-%m-%d")
-                except ValueError:
-                    messagebox.showwarning("Validation", f"Date format should be YYYY-MM-DD: {d}")
-                    return
-
-        nights = 0
-        if check_in and check_out:
-            dt_in = datetime.strptime(check_in, "%Y-%m-%d")
-            dt_out = datetime.strptime(check_out, "%Y-%m-%d")
-            nights = (dt_out - dt_in).days
-            if nights <= 0:
-                messagebox.showwarning("Validation", "Check-out must be after check-in.")
-                return
+        def done(row):
+            self.status_var.set(f"Added booking for {name} in room {room}")
+            self.clear_form()
+        self.worker.submit(f"Adding booking for {name}", lambda job: self.service.add_booking(name, room, phone, check_in, check_out),
+                           on_done=done, on_error=self.service_error)
+
+    @traced
+    def populate_booking_tree(self):
+        # The query runs on the worker. A later reload, sort or search
+        # makes the pager drop this result (see BookingPager.plan_first).
+        plan = self.pager.plan_first()
+
+        def done(fetched):
+            rows = self.pager.apply_first(plan, fetched)
+            if rows is not None:
+                self._fill_booking_tree(rows)
+                self._booking_status()
+        self._page_job = self.worker.submit("Loading bookings", lambda job: self.pager.fetch(plan), on_done=done)
+
+    def _booking_status(self):
+        n = self.pager.loaded()
+        if self.pager.at_end:
+            self.status_var.set(f"{n} bookings loaded")
+        else:
+            self.status_var.set(f"Showing {n} bookings (scroll for more)")
 
-        r = self.run_query("SELECT rate FROM rooms WHERE room_no=?", (room,))
-        rate = float(r[0][0]) if r else 0.0
-        total = nights * rate
-        
-        if check_in and check_out:
-            overlapping = self.run_query(
-                "SELECT id FROM bookings WHERE room_no = ? AND NOT (check_out <= ? OR check_in >= ?)",
-                (room, check_in, check_out)
-            )
-            if overlapping:
-                messagebox.showwarning("Room Occupied", "This room is occupied during the selected dates.")
+    def _fill_booking_tree(self, rows):
+        self._paging = True
+        try:
+            self.tree.delete(*self.tree.get_children())
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+            self.tree.yview_moveto(0)
+        finally:
+            self._paging = False
+
+    def on_booking_event(self, event):
+        if event.action == RELOAD:
+            # Bulk change (e.g. Store.reprice): re-read what is shown.
+            if self.pager.static:
+                self.search_bookings()
+            else:
+                self.populate_booking_tree()
+            return
+        iid = str(event.row[0])
+        if event.action == UPDATE and self.pager.static:
+            # Ranked search results keep their order; patch the row in place.
+            if self.pager.replace(event.row):
+                self.tree.item(iid, values=event.row)
+            return
+        if event.action in (UPDATE, DELETE):
+            self.pager.remove(event.row[0])
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        if event.action in (INSERT, UPDATE):
+            pos = self.pager.place(event.row)
+            if pos is not None:
+                self.tree.insert("", pos, iid=iid, values=event.row)
+                if event.action == UPDATE:
+                    self.tree.selection_set(iid)
+
+    def on_tree_scroll(self, first, last):
+        self.tree_vsb.set(first, last)
+        if self._paging or self._page_job in self.worker.jobs:
+            return
+        if float(last) >= 0.98 and not self.pager.at_end:
+            self._paging = True
+            self.root.after_idle(self.load_next_page)
+        elif float(first) <= 0.02 and not self.pager.at_start:
+            self._paging = True
+            self.root.after_idle(self.load_prev_page)
+
+    def _tree_anchor(self):
+        # First visible row, so the view can be restored after rows are
+        # added or evicted above it.
+        children = self.tree.get_children()
+        top = self.tree.identify_row(1)
+        return top if top in children else None
+
+    def _restore_anchor(self, anchor):
+        children = self.tree.get_children()
+        if anchor and children and self.tree.exists(anchor):
+            self.tree.yview_moveto(self.tree.index(anchor) / len(children))
+
+    def _load_page(self, plan, apply, show):
+        # Fetches a page on the worker; while it is in flight, on_tree_scroll
+        # starts no other (a cancelled job leaves worker.jobs too).
+        try:
+            if plan is None:
                 return
 
-        self.run_query(
-            "INSERT INTO bookings (guest_name, room_no, phone, check_in, check_out, nights, total) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (name, room, phone, check_in, check_out, nights, total),
-            commit=True
-        )
-        self.status_var.set(f"Added booking for {name} in room {room}")
-        self.clear_form()
+            def done(fetched):
+                anchor = self._tree_anchor()
+                rows, evicted = apply(plan, fetched)
+                show(rows)
+                if evicted:
+                    self.tree.delete(*[str(r[0]) for r in evicted])
+                self._restore_anchor(anchor)
+                self._booking_status()
+            self._page_job = self.worker.submit("Loading bookings", lambda job: self.pager.fetch(plan), on_done=done)
+        finally:
+            self._paging = False
+
+    @traced
+    def load_next_page(self):
+        def show(rows):
+            for row in rows:
+                self.tree.insert("", tk.END, iid=str(row[0]), values=row)
+        self._load_page(self.pager.plan_next(), self.pager.apply_next, show)
+
+    @traced
+    def load_prev_page(self):
+        def show(rows):
+            for i, row in enumerate(rows):
+                self.tree.insert("", i, iid=str(row[0]), values=row)
+        self._load_page(self.pager.plan_prev(), self.pager.apply_prev, show)
+
+    @traced
+    def sort_bookings(self, col):
+        self.pager.set_sort(col)
+        for c, text in self.tree_headings.items():
+            if c == col:
+                text += " ▼" if self.pager.descending else " ▲"
+            self.tree.heading(c, text=text)
         self.populate_booking_tree()
 
-    def populate_booking_tree(self, rows=None):
-        for r in self.tree.get_children(): self.tree.delete(r)
-        if rows is None:
-            rows = self.run_query("SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings ORDER BY created_at DESC")
-        for row in rows:
-            self.tree.insert("", tk.END, values=row)
-        self.status_var.set(f"{len(rows)} bookings loaded")
-
     def on_tree_select(self, event):
         sel = self.tree.selection()
         if sel:
@@ -344,6 +569,7 @@ class HotelApp:
             return None
         return self.tree.item(sel[0], "values")[0]
 
+    @traced
     def update_booking(self):
         booking_id = self.get_selected_booking_id()
         if not booking_id: return
@@ -352,63 +578,98 @@ class HotelApp:
         phone = self.entry_phone.get().strip()
         check_in = self.entry_checkin.get().strip()
         check_out = self.entry_checkout.get().strip()
-        if not name or not room:
-            messagebox.showwarning("Validation", "Guest name and room number are required.")
+        def done(row):
+            self.status_var.set(f"Updated booking {booking_id}")
+            self.clear_form()
+        self.worker.submit(f"Updating booking {booking_id}", lambda job: self.service.update_booking(booking_id, name, room, phone, check_in, check_out),
+                           on_done=done, on_error=self.service_error)
+
+    @traced
+    def check_out_booking(self):
+        booking_id = self.get_selected_booking_id()
+        if not booking_id: return
+        if not messagebox.askyesno("Confirm", "Check out this booking and move it to the archive?"):
             return
-        for d in (check_in, check_out):
-            if d:
-                try:
-                    datetime.strptime(d, "%Y-%m-%d")
-                except ValueError:
-                    messagebox.showwarning("Validation", f"Date format should be YYYY-MM-DD: {d}")
-                    return
-        nights = 0
-        if check_in and check_out:
-            dt_in = datetime.strptime(check_in, "%Y-%m-%d")
-            dt_out = datetime.strptime(check_out, "%Y-%m-%d")
-            nights = (dt_out - dt_in).days
-            if nights <= 0:
-                messagebox.showwarning("Validation", "Check-out must be after check-in.")
+
+        self.worker.submit(f"Checking out booking {booking_id}", lambda job: self.service.check_out(booking_id),
+                           on_done=lambda row: self.status_var.set(f"Checked out booking {booking_id}"), on_error=self.service_error)
+
+    @traced
+    def archive_past_stays(self):
+        today = date.today().isoformat()
+
+        def confirm(count):
+            if not count:
+                messagebox.showinfo("Archive", "No checked-out stays to archive.")
                 return
-        r = self.run_query("SELECT rate FROM rooms WHERE room_no=?", (room,))
-        rate = float(r[0][0]) if r else 0.0
-        total = nights * rate
-        
-        if check_in and check_out:
-            overlapping = self.run_query(
-                "SELECT id FROM bookings WHERE room_no = ? AND id != ? AND NOT (check_out <= ? OR check_in >= ?)",
-                (room, booking_id, check_in, check_out)
-            )
-            if overlapping:
-                messagebox.showwarning("Room Occupied", "This room is occupied during the selected dates.")
+            if not messagebox.askyesno("Archive", f"Move {count} stays that checked out by {today} to the archive?"):
                 return
+            self.worker.submit("Archiving stays", lambda job: self.service.archive_closed(today, job=job), on_done=done)
 
-        self.run_query(
-            "UPDATE bookings SET guest_name=?, room_no=?, phone=?, check_in=?, check_out=?, nights=?, total=? WHERE id=?",
-            (name, room, phone, check_in, check_out, nights, total, booking_id),
-            commit=True
-        )
-        self.status_var.set(f"Updated booking {booking_id}")
-        self.clear_form()
-        self.populate_booking_tree()
+        def done(moved):
+            self.status_var.set(f"Archived {moved} stays")
+            self.populate_booking_tree()
+        self.worker.submit("Counting stays to archive", lambda job: archive.count_closed(self.db, today), on_done=confirm)
 
+    @traced
     def delete_booking(self):
         booking_id = self.get_selected_booking_id()
         if not booking_id: return
-        if not messagebox.askyesno("Confirm", "Are you sure you want to check-out / delete this booking?"):
+        if not messagebox.askyesno("Confirm", "Cancel this booking? It will be deleted, not archived."):
             return
-        self.run_query("DELETE FROM bookings WHERE id=?", (booking_id,), commit=True)
-        self.status_var.set(f"Deleted booking {booking_id}")
-        self.populate_booking_tree()
-
+        self.worker.submit(f"Deleting booking {booking_id}", lambda job: self.service.cancel_booking(booking_id),
+                           on_done=lambda row: self.status_var.set(f"Deleted booking {booking_id}"), on_error=self.service_error)
+
+    def on_search_typed(self, *args):
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+        self._search_after = self.root.after(SEARCH_DEBOUNCE_MS, self.search_bookings)
+
+    def _cancel_search(self):
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+            self._search_after = None
+        if self._search_job is not None:
+            self._search_job.cancel()
+            self._search_job = None
+
+    @traced
     def search_bookings(self):
+        self._cancel_search()
         q = self.search_var.get().strip()
+        include_archive = self.include_archive.get()
         if not q:
-            self.populate_booking_tree()
+            if self.pager.static:
+                self.populate_booking_tree()
+            return
+        if len(q) < search.MIN_QUERY_LENGTH:
             return
-        like = f"%{q}%"
-        rows = self.run_query("SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings WHERE guest_name LIKE ? OR room_no LIKE ? ORDER BY created_at DESC",(like,like))
-        self.populate_booking_tree(rows)
+
+        def run(job):
+            job.bind(self.db.connection())
+            try:
+                return search.search_bookings(self.db, q, fts=self._fts, include_archive=include_archive)
+            except sqlite3.OperationalError:
+                if job.cancelled:
+                    raise Cancelled(job.label)
+                raise
+            finally:
+                job.unbind()
+
+        def done(rows):
+            if job is not self._search_job:
+                return
+            self._search_job = None
+            self._fill_booking_tree(self.pager.show_rows(rows))
+            more = " (best matches shown)" if len(rows) >= search.RESULT_LIMIT else ""
+            self.status_var.set(f"{len(rows)} bookings match '{q}'{more}")
+        job = self._search_job = self.worker.submit("Searching", run, on_done=done)
+
+    @traced
+    def clear_search(self):
+        self.search_var.set("")
+        self._cancel_search()
+        self.populate_booking_tree()
 
     def clear_form(self):
         self.entry_name.delete(0, tk.END)
@@ -417,53 +678,204 @@ class HotelApp:
         self.entry_checkin.delete(0, tk.END)
         self.entry_checkout.delete(0, tk.END)
 
+    @traced
     def export_csv(self):
-        rows = self.run_query("SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings ORDER BY created_at DESC")
-        if not rows:
-            messagebox.showinfo("Export CSV", "No bookings to export.")
-            return
-        fpath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files","*.csv")], title="Save bookings as...")
+        date_from = self.export_from.get().strip() or None
+        date_to = self.export_to.get().strip() or None
+        for d in (date_from, date_to):
+            if d:
+                try:
+                    parse_day(d)
+                except ValueError:
+                    messagebox.showwarning("Validation", f"Date format should be YYYY-MM-DD: {d}")
+                    return
+        include_archive = self.include_archive.get()
+        tables = ("bookings", "bookings_archive") if include_archive else ("bookings",)
+
+        def has_rows(job):
+            return any(self.run_query(f"SELECT 1 FROM {t} LIMIT 1") for t in tables)
+
+        def choose(found):
+            if not found:
+                self.status_var.set("Ready")
+                messagebox.showinfo("Export CSV", "No bookings to export.")
+                return
+            fpath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files","*.csv")], title="Save bookings as...")
+            if not fpath:
+                self.status_var.set("Ready")
+                return
+
+            def export(job):
+                try:
+                    return csvio.export_bookings(self.db, fpath, date_from, date_to, job=job, include_archive=include_archive)
+                except Cancelled:
+                    os.remove(fpath)
+                    raise
+
+            def done(count):
+                messagebox.showinfo("Export CSV", f"Bookings exported to {fpath}")
+                self.status_var.set(f"Exported {count} bookings to CSV")
+
+            def failed(error):
+                self.status_var.set("Export failed")
+                messagebox.showerror("Export Error", f"Failed to export CSV: {error}")
+            self.worker.submit("Exporting CSV", export, on_done=done, on_error=failed)
+        self.worker.submit("Checking for bookings", has_rows, on_done=choose)
+
+    @traced
+    def import_bookings_csv(self):
+        def import_bookings(db, fpath, job):
+            try:
+                return csvio.import_bookings(db, fpath, job)
+            finally:
+                self.service.occupancy.invalidate()
+        self._import_csv("bookings", import_bookings, self.populate_booking_tree)
+
+    @traced
+    def import_rooms_csv(self):
+        def import_rooms(db, fpath, job):
+            try:
+                return csvio.import_rooms(db, fpath, job)
+            finally:
+                self.store.catalog.invalidate()
+        self._import_csv("rooms", import_rooms, self.populate_room_tree)
+
+    def _import_csv(self, what, importer, refresh):
+        fpath = filedialog.askopenfilename(filetypes=[("CSV Files","*.csv")], title=f"Import {what} from...")
         if not fpath: return
-        try:
-            with open(fpath, mode="w", newline='', encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(["ID","Guest Name","Room No","Phone","Check-in","Check-out","Nights","Total","Created At"])
-                for r in rows: writer.writerow(r)
-            messagebox.showinfo("Export CSV", f"Bookings exported to {fpath}")
-            self.status_var.set(f"Exported {len(rows)} bookings to CSV")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export CSV: {e}")
+
+        def run(job):
+            try:
+                report = importer(self.db, fpath, job=job)
+            except Cancelled:
+                # Batches committed before the cancel stay imported.
+                self.worker.call_soon(refresh)
+                raise
+            if report.rejected:
+                report.write_rejects(fpath + ".rejected.csv")
+            return report
+
+        def done(report):
+            refresh()
+            self.status_var.set(f"Imported {report.accepted} {what}")
+            msg = report.summary()
+            if report.rejected:
+                msg += "\n\n" + "\n".join(f"Line {line}: {reason}" for line, reason in report.rejected[:10])
+                msg += f"\n\nAll rejected rows were written to {fpath}.rejected.csv"
+            messagebox.showinfo("Import CSV", msg)
+
+        def failed(error):
+            refresh()
+            self.status_var.set("Import stopped")
+            messagebox.showerror("Import Error", f"Failed to import CSV: {error}")
+        self.worker.submit(f"Importing {what}", run, on_done=done, on_error=failed)
 
     # ---------- AVAILABILITY ----------
+    @traced
     def check_availability(self):
         frm = self.av_from.get().strip()
         to = self.av_to.get().strip()
-        for d in (frm, to):
-            if d:
-                try:
-                    datetime.strptime(d, "%Y-%m-%d")
-                except ValueError:
-                    messagebox.showwarning("Validation", f"Date format should be YYYY-MM-DD: {d}")
-                    return
-        if not frm or not to:
-            messagebox.showwarning("Validation", "Please enter both From and To dates.")
-            return
-        if datetime.strptime(to, "%Y-%m-%d") <= datetime.strptime(frm, "%Y-%m-%d"):
-            messagebox.showwarning("Validation", "To date must be after From date.")
+        room_type, max_rate = self._availability_filters()
+
+        def check(job):
+            has_rooms = len(self.store.catalog) > 0
+            return has_rooms, self.service.free_rooms(frm, to, room_type, max_rate)
+
+        def done(result):
+            has_rooms, free_rooms = result
+            if not has_rooms:
+                self.av_result.set("No rooms configured yet.")
+            elif free_rooms:
+                self.av_result.set("Available rooms: " + ", ".join(free_rooms))
+            else:
+                self.av_result.set("No rooms are available in this date range.")
+            self.status_var.set("Availability checked")
+        self.worker.submit("Checking availability", check, on_done=done, on_error=self.service_error)
+
+    def _availability_filters(self):
+        # Raw strings; the service validates them.
+        return self.av_type_var.get().strip(), self.av_max_rate.get().strip()
+
+    @traced
+    def find_earliest_fit(self):
+        nights = self.av_nights.get().strip()
+        horizon = self.av_horizon.get().strip() or SEARCH_HORIZON
+        start = self.av_from.get().strip()
+        room_type, max_rate = self._availability_filters()
+
+        def done(result):
+            first, rooms = result
+            what = f"{room_type} room" if room_type else "room"
+            if first is None:
+                self.av_result.set(f"No {what} is free for {nights} nights within {horizon} days of {start or date.today()}.")
+            else:
+                self.av_result.set(f"Earliest {nights}-night stay from {first}: rooms " + ", ".join(rooms))
+            self.status_var.set("Availability checked")
+        self.worker.submit("Finding earliest fit", lambda job: self.service.earliest_fit(nights, room_type, start, horizon, max_rate),
+                           on_done=done, on_error=self.service_error)
+
+    @traced
+    def find_free_on_dates(self):
+        dates = self.av_dates.get()
+        nights = len({d.strip() for d in dates.replace(";", ",").split(",") if d.strip()})
+        k = self.av_min_dates.get().strip() or nights
+        room_type, max_rate = self._availability_filters()
+
+        def done(found):
+            if found:
+                self.av_result.set(f"Free on at least {k} of {nights} nights: " + ", ".join(f"{room} ({n})" for room, n in found))
+            else:
+                self.av_result.set(f"No room is free on at least {k} of these nights.")
+            self.status_var.set("Availability checked")
+        self.worker.submit("Finding free rooms", lambda job: self.service.free_on(dates, k, room_type, max_rate),
+                           on_done=done, on_error=self.service_error)
+
+    # ---------- REPORTS ----------
+    def _report_args(self):
+        try:
+            date_from = parse_day(self.rep_from.get().strip())
+            date_to = parse_day(self.rep_to.get().strip())
+        except ValueError:
+            messagebox.showwarning("Validation", "Date format should be YYYY-MM-DD.")
+            return None
+        if date_to < date_from:
+            messagebox.showwarning("Validation", "To date must not be before From date.")
+            return None
+        return date_from, date_to, self.rep_period.get(), self.rep_by_type.get()
+
+    def _run_report(self, args, compare):
+        return (reports.compare_years if compare else reports.report)(self.db, *args)
+
+    @traced
+    def generate_report(self):
+        args = self._report_args()
+        if args is None: return
+        compare = self.rep_compare.get()
+
+        def done(rows):
+            self.report_tree.delete(*self.report_tree.get_children())
+            for g in rows:
+                self.report_tree.insert("", tk.END, values=reports.format_row(g, compare))
+            t = reports.totals(rows)
+            self.rep_summary.set(
+                f"{t['sold']} of {t['available']} room-nights sold, occupancy {reports.fmt(t['occupancy'])}%, "
+                f"ADR {reports.fmt(t['adr'])}, RevPAR {reports.fmt(t['revpar'])}, revenue {reports.fmt(t['revenue'])}")
+            self.status_var.set(f"Report: {len(rows)} rows")
+        self.worker.submit("Generating report", lambda job: self._run_report(args, compare), on_done=done)
+
+    @traced
+    def export_report(self):
+        args = self._report_args()
+        if args is None: return
+        compare = self.rep_compare.get()
+        fpath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files","*.csv")], initialfile="hotel_report.csv", title="Save report as...")
+        if not fpath:
             return
-        rooms = [r[0] for r in self.run_query("SELECT room_no FROM rooms")]
-        free_rooms = []
-        for room in rooms:
-            overlapping = self.run_query("SELECT id FROM bookings WHERE room_no=? AND NOT (check_out <= ? OR check_in >= ?)", (room, frm, to))
-            if not overlapping:
-                free_rooms.append(room)
-        if not rooms:
-            self.av_result.set("No rooms configured yet.")
-        elif free_rooms:
-            self.av_result.set("Available rooms: " + ", ".join(free_rooms))
-        else:
-            self.av_result.set("No rooms are available in this date range.")
-        self.status_var.set("Availability checked")
+
+        def done(count):
+            self.status_var.set(f"Exported {count} report rows")
+            messagebox.showinfo("Export", f"Exported {count} report rows to {fpath}")
+        self.worker.submit("Exporting report", lambda job: reports.export_report(self._run_report(args, compare), fpath, compare), on_done=done)
 
     # ---------- INVOICE ----------
     def get_selected_booking_row(self):
@@ -474,68 +886,122 @@ class HotelApp:
         vals = self.tree.item(sel[0], "values")
         return vals
 
+    @traced
     def generate_invoice(self):
         vals = self.get_selected_booking_row()
         if not vals: return
-        booking = {
-            "id": vals[0],
-            "guest_name": vals[1],
-            "room_no": vals[2],
-            "phone": vals[3],
-            "check_in": vals[4] or "",
-            "check_out": vals[5] or "",
-            "nights": vals[6] or 0,
-            "total": vals[7] or 0.0,
-            "created_at": vals[8]
-        }
-        r = self.run_query("SELECT room_type, rate FROM rooms WHERE room_no=?", (booking["room_no"],))
-        room_type = r[0][0] if r else ""
-        rate = float(r[0][1]) if r else 0.0
-
-        default_name = f"invoice_booking_{booking['id']}.pdf" if FPDF_AVAILABLE else f"invoice_booking_{booking['id']}.txt"
+        booking_id = vals[0]
+        default_name = f"invoice_booking_{booking_id}.pdf" if FPDF_AVAILABLE else f"invoice_booking_{booking_id}.txt"
         fpath = filedialog.asksaveasfilename(defaultextension=os.path.splitext(default_name)[1], initialfile=default_name, title="Save Invoice As")
         if not fpath:
             return
 
-        try:
-            if FPDF_AVAILABLE and fpath.lower().endswith(".pdf"):
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", 'B', 16)
-                pdf.cell(0, 10, "Hotel Invoice", ln=True, align="C")
-                pdf.ln(6)
-                pdf.set_font("Arial", size=12)
-                pdf.cell(40, 8, f"Invoice ID: {booking['id']}", ln=True)
-                pdf.cell(40, 8, f"Guest: {booking['guest_name']}", ln=True)
-                pdf.cell(40, 8, f"Phone: {booking['phone']}", ln=True)
-                pdf.cell(40, 8, f"Room No: {booking['room_no']} ({room_type})", ln=True)
-                pdf.cell(40, 8, f"Check-in: {booking['check_in']}", ln=True)
-                pdf.cell(40, 8, f"Check-out: {booking['check_out']}", ln=True)
-                pdf.cell(40, 8, f"Nights: {booking['nights']}", ln=True)
-                pdf.cell(40, 8, f"Rate/night: {rate:.2f}", ln=True)
-                pdf.ln(4)
-                pdf.set_font("Arial", 'B', 12)
-                pdf.cell(40, 8, f"Total: {float(booking['total']):.2f}", ln=True)
-                pdf.output(fpath)
-            else:
-                    with open(fpath, "w", encoding="utf-8") as f:
-                    f.write("HOTEL INVOICE\n\n")
-                    f.write(f"Invoice ID: {booking['id']}\n")
-                    f.write(f"Guest: {booking['guest_name']}\n")
-                    f.write(f"Phone: {booking['phone']}\n")
-                    f.write(f"Room No: {booking['room_no']} ({room_type})\n")
-                    f.write(f"Check-in: {booking['check_in']}\n")
-                    f.write(f"Check-out: {booking['check_out']}\n")
-                    f.write(f"Nights: {booking['nights']}\n")
-                    f.write(f"Rate/night: {rate:.2f}\n")
-                    f.write(f"\nTotal: {float(booking['total']):.2f}\n")
+        def done(result):
             messagebox.showinfo("Invoice", f"Invoice saved to {fpath}")
-            self.status_var.set(f"Invoice generated for booking {booking['id']}")
-        except Exception as e:
-            messagebox.showerror("Invoice Error", f"Failed to create invoice: {e}")
+            self.status_var.set(f"Invoice generated for booking {booking_id}")
+
+        def failed(error):
+            self.status_var.set("Invoice failed")
+            messagebox.showerror("Invoice Error", f"Failed to create invoice: {error}")
+        self.worker.submit(f"Generating invoice for booking {booking_id}", lambda job: self.service.write_invoice(booking_id, fpath),
+                           on_done=done, on_error=failed)
+
+    def open_batch_invoices(self):
+        win = tk.Toplevel(self.root); win.title("Batch Invoices"); win.transient(self.root)
+        frm = ttk.Frame(win, padding=10); frm.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(frm, text="Checked out from (YYYY-MM-DD)").grid(row=0, column=0, sticky=tk.W, padx=4, pady=4)
+        e_from = ttk.Entry(frm, width=15); e_from.grid(row=0, column=1, padx=4, pady=4)
+        ttk.Label(frm, text="to (YYYY-MM-DD)").grid(row=1, column=0, sticky=tk.W, padx=4, pady=4)
+        e_to = ttk.Entry(frm, width=15); e_to.grid(row=1, column=1, padx=4, pady=4)
+        ttk.Label(frm, text="Room (optional)").grid(row=2, column=0, sticky=tk.W, padx=4, pady=4)
+        room_var = tk.StringVar()
+        ttk.Combobox(frm, width=13, textvariable=room_var, values=[""] + list(self.combo_room['values'])).grid(row=2, column=1, padx=4, pady=4)
+        zip_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frm, text="Save as a single zip file", variable=zip_var).grid(row=3, column=0, columnspan=2, sticky=tk.W, padx=4, pady=4)
+
+        def start():
+            date_from, date_to = e_from.get().strip(), e_to.get().strip()
+            for d in (date_from, date_to):
+                if d:
+                    try:
+                        parse_day(d)
+                    except ValueError:
+                        messagebox.showwarning("Validation", f"Date format should be YYYY-MM-DD: {d}", parent=win)
+                        return
+            if zip_var.get():
+                out = filedialog.asksaveasfilename(defaultextension=".zip", filetypes=[("Zip Files","*.zip")], initialfile="invoices.zip", title="Save invoices as...", parent=win)
+            else:
+                out = filedialog.askdirectory(title="Save invoices into...", parent=win)
+            if not out: return
+            win.destroy()
+            self.generate_batch_invoices(date_from or None, date_to or None, room_var.get().strip() or None, out, zip_var.get())
+        ttk.Button(frm, text="Generate", command=start).grid(row=4, column=0, columnspan=2, pady=8)
+
+    @traced
+    def generate_batch_invoices(self, date_from, date_to, room_no, out, as_zip):
+        def run(job):
+            items = invoices.select_bookings(self.db, date_from, date_to, room_no, self.store.rates)
+            return invoices.generate_batch(items, out, as_zip=as_zip, job=job)
+
+        def done(count):
+            self.status_var.set(f"Generated {count} invoices")
+            messagebox.showinfo("Batch Invoices", f"{count} invoices saved to {out}")
+
+        def failed(error):
+            self.status_var.set("Batch invoices failed")
+            messagebox.showerror("Invoice Error", f"Failed to create invoices: {error}")
+        self.worker.submit("Generating invoices", run, on_done=done, on_error=failed)
+
+    # ---------- DIAGNOSTICS ----------
+    def open_diagnostics(self):
+        win = tk.Toplevel(self.root); win.title("Diagnostics"); win.geometry("900x480")
+        nb = ttk.Notebook(win); nb.pack(fill=tk.BOTH, expand=True, padx=6, pady=6)
+        trees = {}
+        for key, title, cols in [
+            ("queries", "Queries", [("total_ms","Total ms",80), ("calls","Calls",60), ("mean_ms","Mean",70), ("p95_ms","p95",60), ("rows","Rows",70), ("site","Call site",180), ("name","Statement",420)]),
+            ("actions", "UI Actions", [("name","Action",160), ("calls","Calls",60), ("mean_ms","Mean ms",80), ("p95_ms","p95",60), ("tk_ms","Tk ms",90), ("worker_ms","Worker ms",90), ("db_ms","DB ms",90)]),
+            ("slow", "Slow Queries", [("at","At",140), ("ms","ms",70), ("site","Call site",180), ("sql","Statement",300), ("plan","Plan",300)]),
+            ("startup", "Startup", [("name","Phase",220), ("ms","ms",90), ("at_ms","At ms",90)]),
+        ]:
+            tab = ttk.Frame(nb); nb.add(tab, text=title)
+            tree = ttk.Treeview(tab, columns=[c for c, _, _ in cols], show="headings")
+            for col, head, width in cols:
+                tree.heading(col, text=head); tree.column(col, width=width, anchor=tk.W)
+            vsb = ttk.Scrollbar(tab, orient="vertical", command=tree.yview); tree.configure(yscroll=vsb.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); vsb.pack(side=tk.RIGHT, fill=tk.Y)
+            trees[key] = (tree, [c for c, _, _ in cols])
+
+        def refresh():
+            snap = self.profiler.snapshot(limit=200)
+            for q in snap["queries"]:
+                q["site"] = next(iter(q["sites"]), "")
+            for s in snap["slow"]:
+                s["plan"] = "; ".join(s["plan"])
+            for key, (tree, cols) in trees.items():
+                tree.delete(*tree.get_children())
+                rows = reversed(snap[key]) if key == "slow" else snap[key]
+                for row in rows:
+                    tree.insert("", tk.END, values=[row.get(c, "") for c in cols])
+            win.title(f"Diagnostics — {len(snap['queries'])} statements, slow threshold {snap['slow_ms']:g} ms")
+
+        def save():
+            fpath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files","*.json"), ("Text Files","*.txt")], initialfile="hotelms-diagnostics.json", title="Save diagnostics as...", parent=win)
+            if not fpath: return
+            if fpath.lower().endswith(".txt"):
+                with open(fpath, "w", encoding="utf-8") as f:
+                    f.write(format_report(self.profiler.snapshot()) + "\n")
+            else:
+                self.profiler.dump(fpath)
+
+        def reset():
+            self.profiler.reset(); refresh()
+        btns = ttk.Frame(win); btns.pack(fill=tk.X, padx=6, pady=(0, 6))
+        ttk.Button(btns, text="Refresh", command=refresh).pack(side=tk.LEFT, padx=4)
+        ttk.Button(btns, text="Reset", command=reset).pack(side=tk.LEFT, padx=4)
+        ttk.Button(btns, text="Save...", command=save).pack(side=tk.LEFT, padx=4)
+        refresh()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = HotelApp(root)
     root.mainloop()
-
@@ -0,0 +1,362 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+SLOW_MS = float(os.environ.get("HOTELMS_SLOW_MS", "100"))
+SLOW_LOG_SIZE = 200
+# Upper bounds of the latency histogram buckets, in milliseconds; the
+# last bucket collects everything slower.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+# Frames in these files are plumbing; the call site is the first frame
+# outside them.
+INTERNAL_FILES = ("db.py", "instrument.py", "contextlib.py")
+
+log = logging.getLogger("hotelms.slow")
+
+_SPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    # One key per statement shape: whitespace collapsed and IN (?, ?, ...)
+    # lists of any length folded together.
+    return _IN_LIST.sub("(?, ...)", _SPACE.sub(" ", sql).strip())
+
+
+def call_site():
+    f = sys._getframe(2)
+    while f is not None and f.f_code.co_filename.endswith(INTERNAL_FILES):
+        f = f.f_back
+    if f is None:
+        return "?"
+    return f"{os.path.basename(f.f_code.co_filename)}:{f.f_lineno} {f.f_code.co_name}"
+
+
+def explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return []
+    return [r[3] for r in rows]
+
+
+class Timing:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect_left(BUCKETS_MS, elapsed * 1000.0)] += 1
+
+    def percentile(self, pct):
+        # Upper bound of the bucket holding the pct-th sample, so an
+        # estimate that never understates.
+        if not self.calls:
+            return None
+        rank = pct / 100.0 * self.calls
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else round(self.max * 1000.0, 3)
+        return round(self.max * 1000.0, 3)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_ms": round(self.total * 1000.0, 3),
+            "mean_ms": round(self.total * 1000.0 / self.calls, 3) if self.calls else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max * 1000.0, 3),
+            "histogram": dict(zip([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], self.buckets)),
+        }
+
+
+class QueryStat(Timing):
+    def __init__(self, sql):
+        super().__init__(sql)
+        self.rows = 0
+        self.errors = 0
+        self.sites = {}
+        self.plan = None
+
+    def add_call(self, elapsed, rows, site):
+        self.add(elapsed)
+        if rows > 0:
+            self.rows += rows
+        self.sites[site] = self.sites.get(site, 0) + 1
+
+    def as_dict(self):
+        d = super().as_dict()
+        d["rows"] = self.rows
+        d["errors"] = self.errors
+        d["sites"] = dict(sorted(self.sites.items(), key=lambda kv: -kv[1]))
+        if self.plan is not None:
+            d["plan"] = self.plan
+        return d
+
+
+class ActionStat(Timing):
+    def __init__(self, name):
+        super().__init__(name)
+        self.tk = 0.0
+        self.worker = 0.0
+        self.db = 0.0
+
+    def as_dict(self):
+        d = super().as_dict()
+        d["tk_ms"] = round(self.tk * 1000.0, 3)
+        d["worker_ms"] = round(self.worker * 1000.0, 3)
+        d["db_ms"] = round(self.db * 1000.0, 3)
+        return d
+
+
+class Span:
+    # One UI action, followed across threads: time on the Tk thread, time
+    # on pool threads, and SQL time wherever it ran. It is recorded when
+    # the action and every job or callback it started have finished.
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.started = time.perf_counter()
+        self.tk = 0.0
+        self.worker = 0.0
+        self.db = 0.0
+        self._holds = 1
+        self._lock = threading.Lock()
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            done = self._holds == 0
+        if done:
+            self.profiler._finish_span(self, time.perf_counter() - self.started)
+
+    @contextmanager
+    def active(self, where="tk"):
+        local = self.profiler._local
+        prev = getattr(local, "span", None)
+        local.span = self
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - t0
+            local.span = prev
+            with self._lock:
+                if where == "tk":
+                    self.tk += elapsed
+                else:
+                    self.worker += elapsed
+
+
+class StartupTimer:
+    # Wall time of each launch phase, measured from the end of the previous
+    # one; the first is measured from `launched`, taken before the imports.
+    def __init__(self, launched=None):
+        self.launched = launched or time.perf_counter()
+        self._last = self.launched
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last, now - self.launched))
+        self._last = now
+
+    def as_list(self):
+        return [{"name": name, "ms": round(elapsed * 1000.0, 3), "at_ms": round(at * 1000.0, 3)}
+                for name, elapsed, at in self.phases]
+
+
+class Profiler:
+    def __init__(self, slow_ms=SLOW_MS, launched=None):
+        self.slow_ms = slow_ms
+        self.startup = StartupTimer(launched)
+        self.queries = {}
+        self.actions = {}
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current(self):
+        return getattr(self._local, "span", None)
+
+    def span(self, name):
+        return Span(self, name)
+
+    def record(self, conn, sql, params, elapsed, rows, error=None, many=False):
+        site = call_site()
+        key = normalize(sql)
+        span = getattr(self._local, "span", None)
+        if span is not None:
+            with span._lock:
+                span.db += elapsed
+        with self._lock:
+            stat = self.queries.get(key)
+            if stat is None:
+                stat = self.queries[key] = QueryStat(key)
+            stat.add_call(elapsed, rows, site)
+            if error is not None:
+                stat.errors += 1
+        ms = elapsed * 1000.0
+        if ms >= self.slow_ms:
+            if stat.plan is None and not many and error is None:
+                stat.plan = explain(conn, sql, params)
+            entry = {
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "ms": round(ms, 3),
+                "sql": key,
+                "rows": rows,
+                "site": site,
+                "plan": stat.plan or [],
+            }
+            if error is not None:
+                entry["error"] = str(error)
+            self.slow.append(entry)
+            log.warning("slow query %.1f ms at %s: %s\n  plan: %s", ms, site, key, "; ".join(entry["plan"]) or "-")
+
+    def _finish_span(self, span, wall):
+        with self._lock:
+            stat = self.actions.get(span.name)
+            if stat is None:
+                stat = self.actions[span.name] = ActionStat(span.name)
+            stat.add(wall)
+            stat.tk += span.tk
+            stat.worker += span.worker
+            stat.db += span.db
+
+    def reset(self):
+        with self._lock:
+            self.queries = {}
+            self.actions = {}
+            self.slow.clear()
+            self.started = time.time()
+
+    def snapshot(self, limit=None):
+        with self._lock:
+            queries = sorted((s.as_dict() for s in self.queries.values()), key=lambda d: -d["total_ms"])
+            actions = sorted((s.as_dict() for s in self.actions.values()), key=lambda d: -d["total_ms"])
+            slow = list(self.slow)
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "slow_ms": self.slow_ms,
+            "queries": queries[:limit],
+            "actions": actions[:limit],
+            "slow": slow,
+            "startup": self.startup.as_list(),
+        }
+
+    def dump(self, fpath):
+        with open(fpath, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+            f.write("\n")
+
+
+class TracedConnection(sqlite3.Connection):
+    # Connection factory used when a Profiler is attached: every statement,
+    # including those run inside Store transactions, is timed.
+    profiler = None
+
+    def execute(self, sql, params=()):
+        if self.profiler is None:
+            return super().execute(sql, params)
+        t0 = time.perf_counter()
+        try:
+            cur = super().execute(sql, params)
+        except sqlite3.Error as e:
+            self.profiler.record(self, sql, params, time.perf_counter() - t0, -1, error=e)
+            raise
+        self.profiler.record(self, sql, params, time.perf_counter() - t0, cur.rowcount)
+        return cur
+
+    def executemany(self, sql, seq):
+        if self.profiler is None:
+            return super().executemany(sql, seq)
+        t0 = time.perf_counter()
+        try:
+            cur = super().executemany(sql, seq)
+        except sqlite3.Error as e:
+            self.profiler.record(self, sql, (), time.perf_counter() - t0, -1, error=e, many=True)
+            raise
+        self.profiler.record(self, sql, (), time.perf_counter() - t0, cur.rowcount, many=True)
+        return cur
+
+
+def traced(method):
+    # Wraps a HotelApp action in a Span. Actions called from inside another
+    # traced action count towards the outer one.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(self, "profiler", None)
+        if profiler is None or profiler.current() is not None:
+            return method(self, *args, **kwargs)
+        span = profiler.span(method.__name__)
+        try:
+            with span.active("tk"):
+                return method(self, *args, **kwargs)
+        finally:
+            span.release()
+    return wrapper
+
+
+# ---------- REPORT ----------
+def format_report(snapshot, limit=15):
+    out = [f"Uptime {snapshot['uptime_s']} s, slow threshold {snapshot['slow_ms']} ms", "", "Top queries by total time"]
+    out.append(f"{'total ms':>10} {'calls':>7} {'mean':>8} {'p95':>8} {'rows':>9}  statement")
+    for q in snapshot["queries"][:limit]:
+        site = next(iter(q["sites"]), "")
+        out.append(f"{q['total_ms']:>10.1f} {q['calls']:>7} {q['mean_ms']:>8.3f} {q['p95_ms']:>8} {q['rows']:>9}  {q['name'][:90]}")
+        out.append(f"{'':>46}  at {site}")
+    if snapshot.get("startup"):
+        out += ["", f"Startup ({snapshot['startup'][-1]['at_ms']:.1f} ms to last phase)", f"{'ms':>10} {'at ms':>10}  phase"]
+        for p in snapshot["startup"]:
+            out.append(f"{p['ms']:>10.1f} {p['at_ms']:>10.1f}  {p['name']}")
+    if snapshot["actions"]:
+        out += ["", "UI actions", f"{'calls':>7} {'mean ms':>9} {'p95':>8} {'tk ms':>10} {'worker ms':>10} {'db ms':>10}  action"]
+        for a in snapshot["actions"][:limit]:
+            out.append(f"{a['calls']:>7} {a['mean_ms']:>9.3f} {a['p95_ms']:>8} {a['tk_ms']:>10.1f} {a['worker_ms']:>10.1f} {a['db_ms']:>10.1f}  {a['name']}")
+    if snapshot["slow"]:
+        out += ["", f"Slow queries (last {len(snapshot['slow'])})"]
+        for s in snapshot["slow"][-limit:]:
+            out.append(f"{s['at']} {s['ms']:>9.1f} ms  {s['site']}  {s['sql'][:80]}")
+            for step in s["plan"]:
+                out.append(f"{'':>32}{step}")
+    return "\n".join(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a saved diagnostics dump (Diagnostics > Save, or HOTELMS_PROFILE_DUMP)")
+    parser.add_argument("dump")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    with open(args.dump, encoding="utf-8") as f:
+        print(format_report(json.load(f), args.top))
@@ -0,0 +1,191 @@
+import argparse
+import importlib.util
+import os
+
+from days import DATE_SQL, to_day, from_day
+from rates import RateBook
+
+# fpdf is imported on the first PDF; finding it is enough to know whether
+# PDFs are possible, and keeps it (and PIL behind it) out of app startup.
+FPDF_AVAILABLE = importlib.util.find_spec("fpdf") is not None
+
+CHUNK_SIZE = 50
+
+# Live stays are filtered on their day numbers, archived ones on the
+# stored text dates.
+LIVE_SQL = f"""
+    SELECT s.id, s.guest_name, r.room_no, s.phone, {DATE_SQL.format("s.day_in")}, {DATE_SQL.format("s.day_out")},
+           s.nights, s.total, s.created_at, r.room_type, r.rate
+    FROM stays s JOIN rooms r ON r.id = s.room_id
+"""
+ARCHIVE_SQL = """
+    SELECT b.id, b.guest_name, b.room_no, b.phone, b.check_in, b.check_out, b.nights, b.total, b.created_at,
+           r.room_type, r.rate
+    FROM bookings_archive b LEFT JOIN rooms r ON r.room_no = b.room_no
+"""
+
+
+def invoice_lines(booking, room_type, rate):
+    lines = [
+        f"Invoice ID: {booking['id']}",
+        f"Guest: {booking['guest_name']}",
+        f"Phone: {booking['phone']}",
+        f"Room No: {booking['room_no']} ({room_type})",
+        f"Check-in: {booking['check_in']}",
+        f"Check-out: {booking['check_out']}",
+        f"Nights: {booking['nights']}",
+    ]
+    nightly = booking.get("nightly")
+    if not nightly:
+        return lines + [f"Rate/night: {rate:.2f}"]
+    lines += [f"  {from_day(day)}  {price:.2f}" for day, price in nightly]
+    if booking.get("discount"):
+        subtotal = sum(price for _, price in nightly)
+        lines.append(f"Length-of-stay discount {booking['discount']:g}%: -{subtotal - float(booking['total']):.2f}")
+    return lines
+
+
+def add_nightly(booking, room_type, rate, rates):
+    # Per-night prices from the current rate calendar, kept only when they
+    # still add up to what the stay was charged (a stay priced before a
+    # tariff change keeps the flat Rate/night line).
+    try:
+        day_in, day_out = to_day(booking["check_in"]), to_day(booking["check_out"])
+    except ValueError:
+        return booking  # archived with a malformed date
+    nightly, pct = rates.nightly(room_type, rate, day_in, day_out)
+    if nightly and abs(rates.quote(room_type, rate, day_in, day_out) - float(booking["total"])) < 0.005:
+        booking["nightly"], booking["discount"] = nightly, pct
+    return booking
+
+
+def render_invoice(booking, room_type, rate, pdf=None):
+    # Returns the invoice as bytes: a PDF when FPDF is installed (or pdf is
+    # forced), otherwise the plain-text layout.
+    if pdf is None:
+        pdf = FPDF_AVAILABLE
+    total = f"Total: {float(booking['total']):.2f}"
+    if pdf:
+        from fpdf import FPDF
+        doc = FPDF()
+        doc.add_page()
+        doc.set_font("Arial", 'B', 16)
+        doc.cell(0, 10, "Hotel Invoice", ln=True, align="C")
+        doc.ln(6)
+        doc.set_font("Arial", size=12)
+        for line in invoice_lines(booking, room_type, rate):
+            doc.cell(40, 8, line, ln=True)
+        doc.ln(4)
+        doc.set_font("Arial", 'B', 12)
+        doc.cell(40, 8, total, ln=True)
+        out = doc.output(dest="S")
+        # PyFPDF returns a latin-1 str, fpdf2 a bytearray.
+        return out.encode("latin-1") if isinstance(out, str) else bytes(out)
+    text = "HOTEL INVOICE\n\n" + "".join(line + "\n" for line in invoice_lines(booking, room_type, rate)) + f"\n{total}\n"
+    return text.encode("utf-8")
+
+
+def write_invoice(fpath, booking, room_type, rate):
+    data = render_invoice(booking, room_type, rate, pdf=FPDF_AVAILABLE and fpath.lower().endswith(".pdf"))
+    with open(fpath, "wb") as f:
+        f.write(data)
+
+
+# ---------- BATCH ----------
+def select_bookings(db, date_from=None, date_to=None, room_no=None, rates=None):
+    # Bookings that checked out in [date_from, date_to], live or archived,
+    # with room type and rate joined in the same query.
+    sql, params = [], []
+    for select, check_out, room, convert in ((LIVE_SQL, "s.day_out", "r.room_no", to_day),
+                                             (ARCHIVE_SQL, "b.check_out", "b.room_no", str)):
+        clauses = []
+        if date_from:
+            clauses.append(f"{check_out} >= ?"); params.append(convert(date_from))
+        if date_to:
+            clauses.append(f"{check_out} <= ?"); params.append(convert(date_to))
+        if room_no:
+            clauses.append(f"{room} = ?"); params.append(room_no)
+        sql.append(select + (" WHERE " + " AND ".join(clauses) if clauses else ""))
+    sql = " UNION ALL ".join(sql) + " ORDER BY 1"
+    rates = rates or RateBook(db)
+    return [_item(row, rates) for row in db.query(sql, params)]
+
+
+def select_booking(db, booking_id, rates=None):
+    # One booking, live or archived, as (booking, room_type, rate); None
+    # when there is no such booking.
+    rows = db.query(f"{LIVE_SQL} WHERE s.id = ? UNION ALL {ARCHIVE_SQL} WHERE b.id = ?", (booking_id, booking_id))
+    return _item(rows[0], rates or RateBook(db)) if rows else None
+
+
+def _item(row, rates):
+    booking = {
+        "id": row[0], "guest_name": row[1], "room_no": row[2], "phone": row[3],
+        "check_in": row[4] or "", "check_out": row[5] or "", "nights": row[6] or 0,
+        "total": row[7] or 0.0, "created_at": row[8],
+    }
+    room_type, rate = row[9] or "", float(row[10] or 0.0)
+    return add_nightly(booking, room_type, rate, rates), room_type, rate
+
+
+def render_chunk(items, pdf):
+    ext = ".pdf" if pdf else ".txt"
+    return [(f"invoice_booking_{b['id']}{ext}", render_invoice(b, room_type, rate, pdf)) for b, room_type, rate in items]
+
+
+def generate_batch(items, out_path, as_zip=False, pdf=None, workers=None, job=None):
+    # Renders invoices across a process pool in chunks and writes them into
+    # a directory or a single zip file. Returns the number written.
+    import multiprocessing
+    import zipfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    if pdf is None:
+        pdf = FPDF_AVAILABLE
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    if as_zip:
+        sink = zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED)
+        put = sink.writestr
+    else:
+        os.makedirs(out_path, exist_ok=True)
+        sink = None
+
+        def put(name, data):
+            with open(os.path.join(out_path, name), "wb") as f:
+                f.write(data)
+    done = 0
+    # spawn rather than fork: the Tk app has live threads.
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+    try:
+        for rendered in executor.map(render_chunk, chunks, [pdf] * len(chunks)):
+            for name, data in rendered:
+                put(name, data)
+            done += len(rendered)
+            if job is not None:
+                job.check()
+                job.progress(done, len(items))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if sink is not None:
+            sink.close()
+    return done
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+
+    parser = argparse.ArgumentParser(description="Render invoices for bookings that checked out in a period")
+    parser.add_argument("out", help="output directory, or a .zip file")
+    parser.add_argument("--db", default="hotel.db")
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    parser.add_argument("--room")
+    parser.add_argument("--text", action="store_true", help="plain-text invoices even if FPDF is installed")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    items = select_bookings(db, args.date_from, args.date_to, args.room)
+    count = generate_batch(items, args.out, as_zip=args.out.lower().endswith(".zip"),
+                           pdf=False if args.text else None, workers=args.workers)
+    print(f"Wrote {count} invoices to {args.out}")
+    db.close_all()
@@ -0,0 +1,732 @@
+import sqlite3
+import sys
+
+from days import DATE_SQL, DAY_SQL
+from db import ConnectionManager
+
+OVERLAP_ERROR = "room occupied"
+UNKNOWN_ROOM_ERROR = "unknown room"
+
+
+def _v1_base_tables(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS rooms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_no TEXT UNIQUE NOT NULL,
+            room_type TEXT,
+            rate REAL DEFAULT 0,
+            notes TEXT
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guest_name TEXT NOT NULL,
+            room_no TEXT NOT NULL,
+            phone TEXT,
+            check_in TEXT,
+            check_out TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            nights INTEGER DEFAULT 0,
+            total REAL DEFAULT 0
+        )
+    """)
+
+
+def _v2_booking_indexes(c):
+    # Overlap checks probe room_no then check_out (see availability.py);
+    # listing/export order by created_at, with id breaking ties.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_room_dates ON bookings (room_no, check_out, check_in)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings (created_at, id)")
+
+
+def _v3_check_out_index(c):
+    # Batch invoicing selects stays by check-out date across all rooms.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_check_out ON bookings (check_out)")
+
+
+def _v4_booking_search_index(c):
+    # External-content FTS5 index over the searchable booking columns,
+    # kept in sync by triggers. Builds without FTS5 fall back to LIKE
+    # search (see search.py).
+    try:
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bookings_fts USING fts5(
+                guest_name, phone, room_no,
+                content='bookings', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_fts_ai AFTER INSERT ON bookings BEGIN
+            INSERT INTO bookings_fts (rowid, guest_name, phone, room_no)
+            VALUES (new.id, new.guest_name, new.phone, new.room_no);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_fts_ad AFTER DELETE ON bookings BEGIN
+            INSERT INTO bookings_fts (bookings_fts, rowid, guest_name, phone, room_no)
+            VALUES ('delete', old.id, old.guest_name, old.phone, old.room_no);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_fts_au AFTER UPDATE OF guest_name, phone, room_no ON bookings BEGIN
+            INSERT INTO bookings_fts (bookings_fts, rowid, guest_name, phone, room_no)
+            VALUES ('delete', old.id, old.guest_name, old.phone, old.room_no);
+            INSERT INTO bookings_fts (rowid, guest_name, phone, room_no)
+            VALUES (new.id, new.guest_name, new.phone, new.room_no);
+        END
+    """)
+    c.execute("INSERT INTO bookings_fts (bookings_fts) VALUES ('rebuild')")
+
+
+def _v5_table_versions(c):
+    # A per-table change counter bumped by triggers, so in-process caches
+    # (see catalog.py) can tell whether a table changed without reloading it.
+    c.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('rooms', 0)")
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS rooms_version_{suffix} AFTER {event} ON rooms BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'rooms';
+            END
+        """)
+
+
+def _v6_booking_overlap_triggers(c):
+    # The database itself refuses overlapping stays, whichever process or
+    # code path writes them. Same rule and index probe as availability.py;
+    # undated bookings are not checked.
+    for suffix, event in (("bi", "INSERT"), ("bu", "UPDATE OF room_no, check_in, check_out")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS bookings_no_overlap_{suffix} BEFORE {event} ON bookings
+            WHEN new.check_in IS NOT NULL AND new.check_in != '' AND new.check_out IS NOT NULL AND new.check_out != ''
+            BEGIN
+                SELECT RAISE(ABORT, '{OVERLAP_ERROR}')
+                WHERE EXISTS (
+                    SELECT 1 FROM bookings
+                    WHERE room_no = new.room_no AND check_out > new.check_in AND check_in < new.check_out
+                      AND id IS NOT new.id
+                );
+            END
+        """)
+
+
+def _v7_bookings_version(c):
+    # Change counter for bookings too, for the occupancy index.
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('bookings', 0)")
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS bookings_version_{suffix} AFTER {event} ON bookings BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'bookings';
+            END
+        """)
+
+
+ROLLUP_ADD = """
+    INSERT INTO daily_rollup (day, room_type, rooms_sold, revenue)
+    SELECT date({b}.check_in, '+' || s.n || ' days'),
+           IFNULL((SELECT room_type FROM rooms WHERE room_no = {b}.room_no), ''),
+           1, IFNULL({b}.total, 0) / (julianday({b}.check_out) - julianday({b}.check_in))
+    FROM rollup_seq s
+    WHERE s.n < julianday({b}.check_out) - julianday({b}.check_in)
+    ON CONFLICT (day, room_type) DO UPDATE SET
+        rooms_sold = rooms_sold + excluded.rooms_sold, revenue = revenue + excluded.revenue
+"""
+ROLLUP_SUBTRACT = """
+    UPDATE daily_rollup SET rooms_sold = rooms_sold - 1,
+           revenue = revenue - IFNULL(old.total, 0) / (julianday(old.check_out) - julianday(old.check_in))
+    WHERE room_type = IFNULL((SELECT room_type FROM rooms WHERE room_no = old.room_no), '')
+      AND day >= date(old.check_in) AND day < date(old.check_out)
+      AND julianday(old.check_out) > julianday(old.check_in)
+"""
+ROLLUP_BACKFILL = """
+    INSERT INTO daily_rollup (day, room_type, rooms_sold, revenue)
+    SELECT date(b.check_in, '+' || s.n || ' days') AS day, IFNULL(r.room_type, '') AS room_type,
+           COUNT(*), SUM(IFNULL(b.total, 0) / (julianday(b.check_out) - julianday(b.check_in)))
+    FROM {stays} b
+    JOIN rollup_seq s ON s.n < julianday(b.check_out) - julianday(b.check_in)
+    LEFT JOIN rooms r ON r.room_no = b.room_no
+    GROUP BY 1, 2
+"""
+# A room's booked nights, grouped by day, for moving them between types.
+ROOM_NIGHTS = """
+    SELECT date(b.check_in, '+' || s.n || ' days') AS day, COUNT(*) AS sold,
+           SUM(IFNULL(b.total, 0) / (julianday(b.check_out) - julianday(b.check_in))) AS amount
+    FROM {stays} b JOIN rollup_seq s ON s.n < julianday(b.check_out) - julianday(b.check_in)
+    WHERE {where}
+    GROUP BY 1
+"""
+ROLLUP_MOVE = """
+    UPDATE daily_rollup SET rooms_sold = rooms_sold - m.sold, revenue = revenue - m.amount
+    FROM ({nights}) AS m
+    WHERE daily_rollup.day = m.day AND daily_rollup.room_type = {src};
+    INSERT INTO daily_rollup (day, room_type, rooms_sold, revenue)
+    SELECT m.day, {dst}, m.sold, m.amount FROM ({nights}) AS m WHERE true
+    ON CONFLICT (day, room_type) DO UPDATE SET
+        rooms_sold = rooms_sold + excluded.rooms_sold, revenue = revenue + excluded.revenue;
+"""
+ROLLUP_MAX_NIGHTS = 3660
+
+
+def _rollup_move(where, src, dst, stays="bookings"):
+    return ROLLUP_MOVE.format(nights=ROOM_NIGHTS.format(stays=stays, where=where), src=src, dst=dst)
+
+
+def _v8_daily_rollup(c):
+    # Rooms sold and revenue per night and room type, so reports read a
+    # few thousand rollup rows instead of scanning every booking. Triggers
+    # keep it current for every writer: a stay adds one room-night per
+    # night, with its total spread evenly across them, under its room's
+    # current type ('' when the room no longer exists). Room inserts,
+    # deletes, renames and type changes move that room's nights between
+    # types, so the rollup always equals a fresh ROLLUP_BACKFILL.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            day TEXT NOT NULL,
+            room_type TEXT NOT NULL,
+            rooms_sold INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, room_type)
+        ) WITHOUT ROWID
+    """)
+    # Night offsets 0..ROLLUP_MAX_NIGHTS-1, used to expand a stay into nights.
+    c.execute("CREATE TABLE IF NOT EXISTS rollup_seq (n INTEGER PRIMARY KEY)")
+    c.execute(f"""
+        INSERT OR IGNORE INTO rollup_seq (n)
+        WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {ROLLUP_MAX_NIGHTS - 1})
+        SELECT n FROM seq
+    """)
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS bookings_rollup_ai AFTER INSERT ON bookings BEGIN {ROLLUP_ADD.format(b='new')}; END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS bookings_rollup_ad AFTER DELETE ON bookings BEGIN {ROLLUP_SUBTRACT}; END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_rollup_au AFTER UPDATE OF room_no, check_in, check_out, total ON bookings BEGIN
+            {ROLLUP_SUBTRACT};
+            {ROLLUP_ADD.format(b='new')};
+        END
+    """)
+    _rooms_rollup_triggers(c, "bookings")
+    c.execute("DELETE FROM daily_rollup")
+    c.execute(ROLLUP_BACKFILL.format(stays="bookings"))
+
+
+def _rooms_rollup_triggers(c, stays):
+    old_type, new_type = "IFNULL(old.room_type, '')", "IFNULL(new.room_type, '')"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_ai AFTER INSERT ON rooms BEGIN
+            {_rollup_move("b.room_no = new.room_no", "''", new_type, stays)}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_ad AFTER DELETE ON rooms BEGIN
+            {_rollup_move("b.room_no = old.room_no", old_type, "''", stays)}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_au AFTER UPDATE OF room_no, room_type ON rooms
+        WHEN old.room_no != new.room_no OR {old_type} != {new_type}
+        BEGIN
+            {_rollup_move("b.room_no = old.room_no", old_type, f"CASE WHEN new.room_no = old.room_no THEN {new_type} ELSE '' END", stays)}
+            {_rollup_move("b.room_no = new.room_no AND new.room_no != old.room_no", "''", new_type, stays)}
+        END
+    """)
+
+
+# Every stay the rollup counts: live and archived bookings.
+ALL_STAYS = "(SELECT room_no, check_in, check_out, total FROM bookings UNION ALL SELECT room_no, check_in, check_out, total FROM bookings_archive)"
+
+
+def _v9_bookings_archive(c):
+    # Checked-out stays move here, keeping their ids, so the live table
+    # (overlap checks, search, paging) only holds current and future stays.
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS bookings_archive (
+            id INTEGER PRIMARY KEY,
+            guest_name TEXT NOT NULL,
+            room_no TEXT NOT NULL,
+            phone TEXT,
+            check_in TEXT,
+            check_out TEXT,
+            created_at TEXT,
+            nights INTEGER DEFAULT 0,
+            total REAL DEFAULT 0,
+            archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_archive_room_dates ON bookings_archive (room_no, check_out)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_archive_created ON bookings_archive (created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_archive_check_out ON bookings_archive (check_out)")
+    # Archived stays stay in the rollup: a delete only subtracts when the
+    # row was not archived first. Room changes move archived nights too.
+    c.execute("DROP TRIGGER IF EXISTS bookings_rollup_ad")
+    c.execute(f"""
+        CREATE TRIGGER bookings_rollup_ad AFTER DELETE ON bookings
+        WHEN NOT EXISTS (SELECT 1 FROM bookings_archive WHERE id = old.id)
+        BEGIN {ROLLUP_SUBTRACT}; END
+    """)
+    for name in ("rooms_rollup_ai", "rooms_rollup_ad", "rooms_rollup_au"):
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    _rooms_rollup_triggers(c, ALL_STAYS)
+    try:
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bookings_archive_fts USING fts5(
+                guest_name, phone, room_no,
+                content='bookings_archive', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_archive_fts_ai AFTER INSERT ON bookings_archive BEGIN
+            INSERT INTO bookings_archive_fts (rowid, guest_name, phone, room_no)
+            VALUES (new.id, new.guest_name, new.phone, new.room_no);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_archive_fts_ad AFTER DELETE ON bookings_archive BEGIN
+            INSERT INTO bookings_archive_fts (bookings_archive_fts, rowid, guest_name, phone, room_no)
+            VALUES ('delete', old.id, old.guest_name, old.phone, old.room_no);
+        END
+    """)
+
+
+STAY_ROLLUP_ADD = """
+    INSERT INTO daily_rollup (day, room_type, rooms_sold, revenue)
+    SELECT date((new.day_in + s.n) * 86400, 'unixepoch'),
+           IFNULL((SELECT room_type FROM rooms WHERE id = new.room_id), ''),
+           1, IFNULL(new.total, 0) * 1.0 / (new.day_out - new.day_in)
+    FROM rollup_seq s
+    WHERE s.n < new.day_out - new.day_in
+    ON CONFLICT (day, room_type) DO UPDATE SET
+        rooms_sold = rooms_sold + excluded.rooms_sold, revenue = revenue + excluded.revenue
+"""
+STAY_ROLLUP_SUBTRACT = """
+    UPDATE daily_rollup SET rooms_sold = rooms_sold - 1,
+           revenue = revenue - IFNULL(old.total, 0) * 1.0 / (old.day_out - old.day_in)
+    WHERE room_type = IFNULL((SELECT room_type FROM rooms WHERE id = old.room_id), '')
+      AND day >= date(old.day_in * 86400, 'unixepoch') AND day < date(old.day_out * 86400, 'unixepoch')
+      AND old.day_out > old.day_in
+"""
+STAY_COLUMNS = "id, guest_name, room_no, phone, check_in, check_out, created_at, nights, total"
+# CROSS JOIN keeps stays as the outer loop, so listing in created_at order
+# walks idx_stays_created; look stays up by room through stays.room_id.
+BOOKINGS_VIEW = f"""
+    CREATE VIEW IF NOT EXISTS bookings AS
+    SELECT s.id AS id, s.guest_name AS guest_name, r.room_no AS room_no, s.phone AS phone,
+           {DATE_SQL.format("s.day_in")} AS check_in, {DATE_SQL.format("s.day_out")} AS check_out,
+           s.created_at AS created_at, s.nights AS nights, s.total AS total
+    FROM stays s CROSS JOIN rooms r ON r.id = s.room_id
+"""
+# The view's rows with rooms as the outer loop, for listing by room_no:
+# the view's CROSS JOIN cannot take that order from an index.
+BOOKINGS_BY_ROOM = f"""(
+    SELECT s.id AS id, s.guest_name AS guest_name, r.room_no AS room_no, s.phone AS phone,
+           {DATE_SQL.format("s.day_in")} AS check_in, {DATE_SQL.format("s.day_out")} AS check_out,
+           s.created_at AS created_at, s.nights AS nights, s.total AS total
+    FROM rooms r JOIN stays s ON s.room_id = r.id
+)"""
+# Raised before a write through the view that the stays table could not
+# represent.
+VIEW_CHECKS = f"""
+    SELECT RAISE(ABORT, '{UNKNOWN_ROOM_ERROR}') WHERE NOT EXISTS (SELECT 1 FROM rooms WHERE room_no = new.room_no);
+    SELECT RAISE(ABORT, 'invalid date')
+    WHERE (IFNULL(new.check_in, '') != '' AND julianday(new.check_in) IS NULL)
+       OR (IFNULL(new.check_out, '') != '' AND julianday(new.check_out) IS NULL);
+"""
+
+
+def _v10_stays(c):
+    # Bookings move into `stays`, which keeps dates as day numbers (see
+    # days.py) and the room as a rooms.id foreign key, so overlap probes
+    # and joins compare integers. `bookings` becomes a view with the old
+    # columns; INSTEAD OF triggers pass writes through it on to stays.
+    # Rows whose room no longer exists or whose dates are not dates cannot
+    # be represented and go to the archive, unchanged.
+    c.execute(f"""
+        INSERT INTO bookings_archive ({STAY_COLUMNS})
+        SELECT {STAY_COLUMNS} FROM bookings b
+        WHERE NOT EXISTS (SELECT 1 FROM rooms r WHERE r.room_no = b.room_no)
+           OR (IFNULL(b.check_in, '') != '' AND julianday(b.check_in) IS NULL)
+           OR (IFNULL(b.check_out, '') != '' AND julianday(b.check_out) IS NULL)
+    """)
+    c.execute("DELETE FROM bookings WHERE id IN (SELECT id FROM bookings_archive)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS stays (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id INTEGER NOT NULL REFERENCES rooms (id),
+            day_in INTEGER,
+            day_out INTEGER,
+            guest_name TEXT NOT NULL,
+            phone TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            nights INTEGER DEFAULT 0,
+            total REAL DEFAULT 0
+        )
+    """)
+    c.execute(f"""
+        INSERT INTO stays (id, room_id, day_in, day_out, guest_name, phone, created_at, nights, total)
+        SELECT b.id, r.id, {DAY_SQL.format("b.check_in")}, {DAY_SQL.format("b.check_out")},
+               b.guest_name, b.phone, b.created_at, b.nights, b.total
+        FROM bookings b JOIN rooms r ON r.room_no = b.room_no
+    """)
+    # Ids stay unique across live and archived stays, so the sequence
+    # carries on from the old table's.
+    seq = c.execute("SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ('bookings', 'stays')").fetchone()[0]
+    c.execute("DELETE FROM sqlite_sequence WHERE name = 'stays'")
+    if seq is not None:
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('stays', ?)", (seq,))
+    for name in ("rooms_rollup_ai", "rooms_rollup_ad", "rooms_rollup_au"):
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    c.execute("DROP TABLE bookings")
+
+    # Covering indexes: overlap probes per room, date-window scans across
+    # rooms (occupancy, archiving, invoicing), and the listing order.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stays_room_days ON stays (room_id, day_out, day_in)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stays_day_out ON stays (day_out, day_in, room_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_stays_created ON stays (created_at, id)")
+
+    c.execute(BOOKINGS_VIEW)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_view_insert INSTEAD OF INSERT ON bookings BEGIN
+            {VIEW_CHECKS}
+            INSERT INTO stays (id, room_id, day_in, day_out, guest_name, phone, created_at, nights, total)
+            VALUES (new.id, (SELECT id FROM rooms WHERE room_no = new.room_no),
+                    {DAY_SQL.format("new.check_in")}, {DAY_SQL.format("new.check_out")}, new.guest_name, new.phone,
+                    IFNULL(new.created_at, CURRENT_TIMESTAMP), IFNULL(new.nights, 0), IFNULL(new.total, 0));
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_view_update INSTEAD OF UPDATE ON bookings BEGIN
+            {VIEW_CHECKS}
+            UPDATE stays SET room_id = (SELECT id FROM rooms WHERE room_no = new.room_no),
+                   day_in = {DAY_SQL.format("new.check_in")}, day_out = {DAY_SQL.format("new.check_out")},
+                   guest_name = new.guest_name, phone = new.phone, created_at = new.created_at,
+                   nights = new.nights, total = new.total
+            WHERE id = old.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS bookings_view_delete INSTEAD OF DELETE ON bookings BEGIN
+            DELETE FROM stays WHERE id = old.id;
+        END
+    """)
+
+    # The v6/v7/v8 booking triggers, now on stays.
+    for suffix, event in (("bi", "INSERT"), ("bu", "UPDATE OF room_id, day_in, day_out")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS stays_no_overlap_{suffix} BEFORE {event} ON stays
+            WHEN new.day_in IS NOT NULL AND new.day_out IS NOT NULL
+            BEGIN
+                SELECT RAISE(ABORT, '{OVERLAP_ERROR}')
+                WHERE EXISTS (
+                    SELECT 1 FROM stays
+                    WHERE room_id = new.room_id AND day_out > new.day_in AND day_in < new.day_out
+                      AND id IS NOT new.id
+                );
+            END
+        """)
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS stays_version_{suffix} AFTER {event} ON stays BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'bookings';
+            END
+        """)
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS stays_rollup_ai AFTER INSERT ON stays BEGIN {STAY_ROLLUP_ADD}; END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS stays_rollup_ad AFTER DELETE ON stays
+        WHEN NOT EXISTS (SELECT 1 FROM bookings_archive WHERE id = old.id)
+        BEGIN {STAY_ROLLUP_SUBTRACT}; END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS stays_rollup_au AFTER UPDATE OF room_id, day_in, day_out, total ON stays BEGIN
+            {STAY_ROLLUP_SUBTRACT};
+            {STAY_ROLLUP_ADD};
+        END
+    """)
+
+    # Live stays follow their room through renames; deleting a room
+    # archives its stays first, which keeps the room number they had.
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_archive_stays_bd BEFORE DELETE ON rooms BEGIN
+            INSERT INTO bookings_archive ({STAY_COLUMNS})
+            SELECT {STAY_COLUMNS} FROM bookings WHERE id IN (SELECT id FROM stays WHERE room_id = old.id);
+            DELETE FROM stays WHERE room_id = old.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS rooms_rename_au AFTER UPDATE OF room_no ON rooms
+        WHEN old.room_no != new.room_no
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'bookings';
+        END
+    """)
+    # Live nights move with a type change; archived ones, which refer to
+    # rooms by number, move as in v8.
+    old_type, new_type = "IFNULL(old.room_type, '')", "IFNULL(new.room_type, '')"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_ai AFTER INSERT ON rooms BEGIN
+            {_rollup_move("b.room_no = new.room_no", "''", new_type, "bookings_archive")}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_ad AFTER DELETE ON rooms BEGIN
+            {_rollup_move("b.room_no = old.room_no", old_type, "''", "bookings_archive")}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rooms_rollup_au AFTER UPDATE OF room_no, room_type ON rooms
+        WHEN old.room_no != new.room_no OR {old_type} != {new_type}
+        BEGIN
+            {_rollup_move(f"b.id IN (SELECT id FROM stays WHERE room_id = new.id) AND {old_type} != {new_type}", old_type, new_type, "bookings")}
+            {_rollup_move("b.room_no = old.room_no", old_type, f"CASE WHEN new.room_no = old.room_no THEN {new_type} ELSE '' END", "bookings_archive")}
+            {_rollup_move("b.room_no = new.room_no AND new.room_no != old.room_no", "''", new_type, "bookings_archive")}
+        END
+    """)
+
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name = 'bookings_fts'").fetchone():
+        return
+    # The search index keeps its rows: same ids, same text, now read
+    # through the view.
+    room_of = "(SELECT room_no FROM rooms WHERE id = {}.room_id)"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS stays_fts_ai AFTER INSERT ON stays BEGIN
+            INSERT INTO bookings_fts (rowid, guest_name, phone, room_no)
+            VALUES (new.id, new.guest_name, new.phone, {room_of.format("new")});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS stays_fts_ad AFTER DELETE ON stays BEGIN
+            INSERT INTO bookings_fts (bookings_fts, rowid, guest_name, phone, room_no)
+            VALUES ('delete', old.id, old.guest_name, old.phone, {room_of.format("old")});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS stays_fts_au AFTER UPDATE OF guest_name, phone, room_id ON stays BEGIN
+            INSERT INTO bookings_fts (bookings_fts, rowid, guest_name, phone, room_no)
+            VALUES ('delete', old.id, old.guest_name, old.phone, {room_of.format("old")});
+            INSERT INTO bookings_fts (rowid, guest_name, phone, room_no)
+            VALUES (new.id, new.guest_name, new.phone, {room_of.format("new")});
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS rooms_fts_au AFTER UPDATE OF room_no ON rooms
+        WHEN old.room_no != new.room_no
+        BEGIN
+            INSERT INTO bookings_fts (bookings_fts, rowid, guest_name, phone, room_no)
+            SELECT 'delete', id, guest_name, phone, old.room_no FROM stays WHERE room_id = new.id;
+            INSERT INTO bookings_fts (rowid, guest_name, phone, room_no)
+            SELECT id, guest_name, phone, new.room_no FROM stays WHERE room_id = new.id;
+        END
+    """)
+
+
+def _v11_rate_plans(c):
+    # Rate rules by room type, '' meaning every type without rules of its
+    # own (see rates.py). Season days are day numbers like stays, day_to
+    # exclusive; rates are nightly prices that replace the room's rate.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS rate_plans (
+            room_type TEXT PRIMARY KEY,
+            weekend_rate REAL,
+            weekend_days TEXT NOT NULL DEFAULT '4,5'
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS rate_seasons (
+            id INTEGER PRIMARY KEY,
+            room_type TEXT NOT NULL DEFAULT '',
+            name TEXT NOT NULL DEFAULT '',
+            day_from INTEGER NOT NULL,
+            day_to INTEGER NOT NULL,
+            rate REAL,
+            weekend_rate REAL,
+            CHECK (day_to > day_from)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS los_discounts (
+            room_type TEXT NOT NULL DEFAULT '',
+            min_nights INTEGER NOT NULL CHECK (min_nights > 1),
+            percent REAL NOT NULL CHECK (percent > 0 AND percent < 100),
+            PRIMARY KEY (room_type, min_nights)
+        ) WITHOUT ROWID
+    """)
+    # One change counter for all three, for the calendar cache.
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('rates', 0)")
+    for table in ("rate_plans", "rate_seasons", "los_discounts"):
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = 'rates';
+                END
+            """)
+
+
+def _v12_sort_indexes(c):
+    # One index per header sort of the booking list (see paging.py), on
+    # the same expressions the view yields, so every sort pages by index
+    # seek instead of sorting the whole join. id comes last for keyset
+    # ties. Sorting by room walks rooms by room_no and each room's stays
+    # in id order through idx_stays_room (see BOOKINGS_BY_ROOM).
+    keys = {
+        "guest": "IFNULL(guest_name, '')",
+        "phone": "IFNULL(phone, '')",
+        "check_in": DATE_SQL.format("day_in"),
+        "check_out": DATE_SQL.format("day_out"),
+        "nights": "IFNULL(nights, 0)",
+        "total": "IFNULL(total, 0)",
+        "room": "room_id",
+    }
+    for name, expr in keys.items():
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_stays_{name} ON stays ({expr}, id)")
+
+
+MIGRATIONS = [
+    (1, _v1_base_tables),
+    (2, _v2_booking_indexes),
+    (3, _v3_check_out_index),
+    (4, _v4_booking_search_index),
+    (5, _v5_table_versions),
+    (6, _v6_booking_overlap_triggers),
+    (7, _v7_bookings_version),
+    (8, _v8_daily_rollup),
+    (9, _v9_bookings_archive),
+    (10, _v10_stays),
+    (11, _v11_rate_plans),
+    (12, _v12_sort_indexes),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(db):
+    return db.query("PRAGMA user_version")[0][0]
+
+
+def migrate(db):
+    version = current_version(db)
+    for target, step in MIGRATIONS:
+        if target <= version:
+            continue
+        with db.transaction(immediate=True) as c:
+            # Another process may have migrated while we waited for the lock.
+            if c.execute("PRAGMA user_version").fetchone()[0] >= target:
+                continue
+            step(c)
+            c.execute(f"PRAGMA user_version = {target}")
+        version = target
+    return version
+
+
+# ---------- QUERY PLAN CHECKS ----------
+# name -> (sql, sample params, ordering must come from an index)
+HOT_QUERIES = {
+    "booking_overlap": (
+        "SELECT 1 FROM stays WHERE room_id = ? AND day_out > ? AND day_in < ? AND id IS NOT ?",
+        (1, 19723, 19727, None),
+        False,
+    ),
+    "free_rooms": (
+        "SELECT r.room_no FROM rooms r WHERE NOT EXISTS (SELECT 1 FROM stays s WHERE s.room_id = r.id AND s.day_out > ? AND s.day_in < ?) ORDER BY r.room_no",
+        (19723, 19727),
+        False,
+    ),
+    "occupancy_window": (
+        "SELECT room_id, day_in, day_out FROM stays WHERE day_out > ? AND day_in < ?",
+        (19723, 20123),
+        False,
+    ),
+    "room_rate": (
+        "SELECT rate FROM rooms WHERE room_no=?",
+        ("101",),
+        False,
+    ),
+    "room_bookings": (
+        "SELECT id FROM stays WHERE room_id=?",
+        (1,),
+        False,
+    ),
+    "booking_by_id": (
+        "SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings WHERE id=?",
+        (1,),
+        False,
+    ),
+    "invoice_batch": (
+        "SELECT id FROM stays WHERE day_out >= ? AND day_out <= ?",
+        (19723, 19753),
+        False,
+    ),
+    "archive_candidates": (
+        "SELECT id FROM stays WHERE day_out <= ?",
+        (19723,),
+        False,
+    ),
+    "archive_by_created": (
+        "SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings_archive ORDER BY created_at DESC",
+        (),
+        True,
+    ),
+    "rollup_range": (
+        "SELECT day, SUM(rooms_sold), SUM(revenue) FROM daily_rollup WHERE day >= ? AND day <= ? GROUP BY day",
+        ("2024-01-01", "2024-12-31"),
+        False,
+    ),
+    "bookings_by_created": (
+        "SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings ORDER BY created_at DESC",
+        (),
+        True,
+    ),
+}
+# Sort keys of the booking list (paging.py), each matching an index from
+# v12. Nullable columns are wrapped so row comparisons never see NULL; the
+# view already turns missing dates into ''. id is always the tie-breaker.
+SORT_KEYS = {
+    "id": "id",
+    "guest_name": "IFNULL(guest_name, '')",
+    "room_no": "room_no",
+    "phone": "IFNULL(phone, '')",
+    "check_in": "check_in",
+    "check_out": "check_out",
+    "nights": "IFNULL(nights, 0)",
+    "total": "IFNULL(total, 0)",
+    "created_at": "created_at",
+}
+PAGE_SQL = ("SELECT id, guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM {} "
+            "WHERE {key} <= ? AND ({key} < ? OR id < ?) ORDER BY {key} DESC, id DESC LIMIT 201")
+HOT_QUERIES.update({
+    f"bookings_page_by_{col}": (PAGE_SQL.format(BOOKINGS_BY_ROOM if col == "room_no" else "bookings", key=key), ("", "", 1), True)
+    for col, key in SORT_KEYS.items()
+})
+
+
+def plan_problems(plan, ordered=False):
+    problems = []
+    for row in plan:
+        detail = row[-1]
+        if detail.startswith("SCAN") and "INDEX" not in detail:
+            problems.append(detail)
+        elif ordered and "TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(db, queries=HOT_QUERIES):
+    failures = {}
+    for name, (sql, params, ordered) in queries.items():
+        problems = plan_problems(db.query("EXPLAIN QUERY PLAN " + sql, params), ordered)
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "hotel.db"
+    db = ConnectionManager(path)
+    print(f"{path}: schema version {migrate(db)}")
+    failures = check_query_plans(db)
+    for name, problems in failures.items():
+        print(f"FAIL {name}: " + "; ".join(problems))
+    db.close_all()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,176 @@
+import threading
+from datetime import date, timedelta
+
+from catalog import TableWatch
+from days import to_day
+from events import INSERT, UPDATE, DELETE, RELOAD
+
+LOOKBACK_DAYS = 7
+WINDOW_DAYS = 400
+SEARCH_HORIZON = 90
+
+STAYS_SQL = """
+    SELECT r.room_no, s.day_in, s.day_out FROM stays s JOIN rooms r ON r.id = s.room_id
+    WHERE s.day_out > ? AND s.day_in < ?
+"""
+ROOM_STAYS_SQL = """
+    SELECT s.day_in, s.day_out FROM stays s JOIN rooms r ON r.id = s.room_id
+    WHERE r.room_no = ? AND s.day_out > ? AND s.day_in < ?
+"""
+
+
+def runs(free, n):
+    # Bit d of the result is set when bits d .. d+n-1 of `free` are all
+    # set, i.e. an n-night stay can start on day d. Shift-and-AND with
+    # doubling widths: O(log n) big-int operations per room.
+    width = 1
+    while width < n:
+        step = min(width, n - width)
+        free &= free >> step
+        width += step
+    return free
+
+
+class OccupancyIndex:
+    # Rooms x days bitmap: for each room an int whose bit d is set when the
+    # night starting origin + d is booked. Window searches become shifts,
+    # ANDs and popcounts over whole rows instead of overlap queries.
+    # Store booking events patch single rows; other writers are caught by a
+    # TableWatch on bookings and trigger a rebuild on next use.
+    def __init__(self, db, catalog, events=None, window_days=WINDOW_DAYS):
+        self.db = db
+        self.catalog = catalog
+        self.window_days = window_days
+        self.watch = TableWatch(db, "bookings")
+        self._lock = threading.RLock()
+        self.origin = None
+        self._origin_day = None
+        self._rows = None
+        if events is not None:
+            events.subscribe("bookings", self.on_event)
+            events.subscribe("rooms", self.on_room_event)
+
+    # ---------- BUILD / MAINTAIN ----------
+    def _span(self, day_in, day_out):
+        # Bit range of the nights [day_in, day_out) inside the window.
+        if day_in is None or day_out is None:
+            return 0
+        lo = max(day_in - self._origin_day, 0)
+        hi = min(day_out - self._origin_day, self.window_days)
+        return ((1 << (hi - lo)) - 1) << lo if hi > lo else 0
+
+    def _bounds(self):
+        return self._origin_day, self._origin_day + self.window_days
+
+    def build(self, origin=None):
+        with self._lock:
+            self.origin = origin or date.today() - timedelta(days=LOOKBACK_DAYS)
+            self._origin_day = to_day(self.origin)
+            self.watch.loaded()
+            rows = dict.fromkeys(self.catalog.room_numbers(), 0)
+            for room_no, day_in, day_out in self.db.query(STAYS_SQL, self._bounds()):
+                if room_no in rows:
+                    rows[room_no] |= self._span(day_in, day_out)
+            self._rows = rows
+            return rows
+
+    def _reload_room(self, rows, room_no):
+        bits = 0
+        for day_in, day_out in self.db.query(ROOM_STAYS_SQL, (room_no, *self._bounds())):
+            bits |= self._span(day_in, day_out)
+        rows[room_no] = bits
+
+    def on_event(self, event):
+        with self._lock:
+            if self._rows is None:
+                return
+            if event.action == RELOAD:
+                self._rows = None
+                return
+            rows = dict(self._rows)
+            row = event.row
+            if event.action == INSERT:
+                if row[2] in rows:
+                    rows[row[2]] |= self._span(to_day(row[4]), to_day(row[5]))
+            else:
+                # Re-read the affected rooms rather than clearing bits, so
+                # legacy overlapping stays cannot leave holes.
+                for room_no in {row[2], (event.old or row)[2]}:
+                    if room_no in rows:
+                        self._reload_room(rows, room_no)
+            self._rows = rows if self.watch.applied() else None
+
+    def on_room_event(self, event):
+        with self._lock:
+            if self._rows is None:
+                return
+            rows = dict(self._rows)
+            if event.action in (UPDATE, DELETE):
+                rows.pop((event.old or event.row)[1], None)
+            if event.action in (INSERT, UPDATE):
+                self._reload_room(rows, event.row[1])
+            self._rows = rows
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    def snapshot(self, start, end):
+        # (origin, rows) covering the nights [start, end); rebuilt first when
+        # stale or when the range falls outside the current window.
+        with self._lock:
+            fits = self._rows is not None and self.origin <= start and (end - self.origin).days <= self.window_days
+            if not fits or self.watch.stale():
+                self.build(self.origin if fits else start - timedelta(days=LOOKBACK_DAYS))
+            if (end - self.origin).days > self.window_days:
+                raise ValueError(f"searches are limited to {self.window_days - LOOKBACK_DAYS} days")
+            return self.origin, self._rows
+
+    # ---------- SEARCHES ----------
+    def _rooms(self, room_type=None, max_rate=None):
+        return [r.room_no for r in self.catalog.rooms()
+                if (not room_type or r.room_type == room_type) and (max_rate is None or r.rate <= max_rate)]
+
+    def earliest_fit(self, nights, room_type=None, start=None, horizon=SEARCH_HORIZON, max_rate=None):
+        # First check-in date in [start, start + horizon) for which some
+        # matching room is free for `nights` consecutive nights (the stay
+        # must also end within the horizon). Returns (date, rooms) or
+        # (None, []).
+        if nights < 1:
+            raise ValueError("nights must be at least 1")
+        start = start or date.today()
+        origin, rows = self.snapshot(start, start + timedelta(days=horizon))
+        lo = (start - origin).days
+        window = ((1 << horizon) - 1) << lo
+        best, fits = None, []
+        for room_no in self._rooms(room_type, max_rate):
+            starts = runs(~rows.get(room_no, 0) & window, nights)
+            if not starts:
+                continue
+            first = (starts & -starts).bit_length() - 1
+            if best is None or first < best:
+                best, fits = first, [room_no]
+            elif first == best:
+                fits.append(room_no)
+        if best is None:
+            return None, []
+        return origin + timedelta(days=best), fits
+
+    def free_on(self, days, k=None, room_type=None, max_rate=None):
+        # Rooms free on at least k of the given nights (all of them when k
+        # is None), as (room_no, nights free) with the best matches first.
+        days = sorted(set(days))
+        if not days:
+            return []
+        k = len(days) if k is None else k
+        origin, rows = self.snapshot(days[0], days[-1] + timedelta(days=1))
+        wanted = 0
+        for d in days:
+            wanted |= 1 << (d - origin).days
+        found = []
+        for room_no in self._rooms(room_type, max_rate):
+            free = (wanted & ~rows.get(room_no, 0)).bit_count()
+            if free >= k:
+                found.append((room_no, free))
+        found.sort(key=lambda f: (-f[1], f[0]))
+        return found
@@ -0,0 +1,207 @@
+from collections import deque
+
+from migrations import BOOKINGS_BY_ROOM, SORT_KEYS
+from store import BOOKING_COLUMNS
+
+
+class BookingPager:
+    # Keeps a sliding window of at most max_pages pages of bookings. Pages
+    # are fetched with keyset queries on (sort key, id), each one an index
+    # seek (see migrations v12), so each fetch costs the same no matter how
+    # deep into the table the window is.
+    def __init__(self, db, page_size=200, max_pages=5):
+        self.db = db
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.sort_col = "created_at"
+        self.descending = True
+        self.pages = deque()
+        self.at_start = True
+        self.at_end = True
+        self.static = False
+        self.generation = 0
+
+    def set_sort(self, col):
+        if col not in SORT_KEYS:
+            raise ValueError(f"Unknown sort column: {col}")
+        if col == self.sort_col:
+            self.descending = not self.descending
+        else:
+            self.sort_col, self.descending = col, col == "created_at"
+        self.generation += 1
+
+    def _key(self, row):
+        value = row[BOOKING_COLUMNS.index(self.sort_col)]
+        if value is None:
+            value = 0 if self.sort_col in ("nights", "total") else ""
+        return value, row[0]
+
+    # ---------- PAGING ----------
+    # Each step is split so the query can run off the UI thread: plan_*()
+    # and apply_*() run on the thread that owns the window, fetch(plan) on
+    # any thread. A plan made before the sort changed or the window was
+    # reset (generation) is dropped by apply_*().
+    def _plan(self, after=None, backwards=False):
+        return self.generation, self.sort_col, self.descending, after, backwards
+
+    def plan_first(self):
+        # Until the new first page is applied, the old window neither pages
+        # nor keeps keys for a sort order that may have changed.
+        self.generation += 1
+        self.at_start = self.at_end = True
+        return self._plan()
+
+    def plan_next(self):
+        if self.at_end or not self.pages:
+            return None
+        return self._plan(after=self._key(self.pages[-1][-1]))
+
+    def plan_prev(self):
+        if self.at_start or not self.pages:
+            return None
+        return self._plan(after=self._key(self.pages[0][0]), backwards=True)
+
+    def fetch(self, plan):
+        _, sort_col, descending, after, backwards = plan
+        expr = SORT_KEYS[sort_col]
+        desc = descending != backwards
+        where, params = "", []
+        if after is not None:
+            # Spelled out rather than as a row value, which SQLite cannot
+            # seek an expression index with.
+            op = "<" if desc else ">"
+            where, params = f" WHERE {expr} {op}= ? AND ({expr} {op} ? OR id {op} ?)", [after[0], *after]
+        direction = "DESC" if desc else "ASC"
+        source = BOOKINGS_BY_ROOM if sort_col == "room_no" else "bookings"
+        sql = f"SELECT {', '.join(BOOKING_COLUMNS)} FROM {source}{where} ORDER BY {expr} {direction}, id {direction} LIMIT ?"
+        params.append(self.page_size + 1)
+        rows = self.db.query(sql, params)
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+        return rows, more
+
+    def _fresh(self, plan, rows):
+        # Rows placed from events while the fetch ran may come back again.
+        if plan[0] != self.generation:
+            return None
+        shown = {r[0] for page in self.pages for r in page}
+        return [r for r in rows if r[0] not in shown]
+
+    def apply_first(self, plan, fetched):
+        # The rows to show, or None when the plan is stale.
+        if plan[0] != self.generation:
+            return None
+        rows, more = fetched
+        self.pages = deque([rows]) if rows else deque()
+        self.at_start, self.at_end = True, not more
+        self.static = False
+        return rows
+
+    def apply_next(self, plan, fetched):
+        # Returns (new rows appended at the bottom, rows evicted from the top).
+        rows = self._fresh(plan, fetched[0])
+        if rows is None:
+            return [], []
+        self.at_end = not fetched[1]
+        if not rows:
+            return [], []
+        self.pages.append(rows)
+        evicted = []
+        if len(self.pages) > self.max_pages:
+            evicted = self.pages.popleft()
+            self.at_start = False
+        return rows, evicted
+
+    def apply_prev(self, plan, fetched):
+        # Returns (new rows prepended at the top, rows evicted from the bottom).
+        rows = self._fresh(plan, fetched[0])
+        if rows is None:
+            return [], []
+        self.at_start = not fetched[1]
+        if not rows:
+            return [], []
+        self.pages.appendleft(rows)
+        evicted = []
+        if len(self.pages) > self.max_pages:
+            evicted = self.pages.pop()
+            self.at_end = False
+        return rows, evicted
+
+    def first_page(self):
+        plan = self.plan_first()
+        return self.apply_first(plan, self.fetch(plan))
+
+    def next_page(self):
+        plan = self.plan_next()
+        return self.apply_next(plan, self.fetch(plan)) if plan else ([], [])
+
+    def prev_page(self):
+        plan = self.plan_prev()
+        return self.apply_prev(plan, self.fetch(plan)) if plan else ([], [])
+
+    def show_rows(self, rows):
+        # Holds a precomputed result (e.g. ranked search hits) in the window;
+        # no paging or re-sorting happens until first_page() is called again.
+        self.generation += 1
+        self.pages = deque([list(rows)]) if rows else deque()
+        self.at_start = self.at_end = True
+        self.static = True
+        return rows
+
+    def loaded(self):
+        return sum(len(p) for p in self.pages)
+
+    # ---------- INCREMENTAL UPDATES ----------
+    def _before(self, a, b):
+        return a > b if self.descending else a < b
+
+    def place(self, row):
+        # Inserts a changed row into the window if it belongs there and
+        # returns its position, or None when it sorts outside the window.
+        if self.static:
+            return None
+        key = self._key(row)
+        if not self.pages:
+            if not (self.at_start and self.at_end):
+                return None
+            self.pages.append([row])
+            return 0
+        if not self.at_start and self._before(key, self._key(self.pages[0][0])):
+            return None
+        if not self.at_end and self._before(self._key(self.pages[-1][-1]), key):
+            return None
+        offset = 0
+        for i, page in enumerate(self.pages):
+            last = i == len(self.pages) - 1
+            if last or not self._before(self._key(page[-1]), key):
+                lo, hi = 0, len(page)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self._before(self._key(page[mid]), key):
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                page.insert(lo, row)
+                return offset + lo
+            offset += len(page)
+
+    def replace(self, row):
+        for page in self.pages:
+            for j, old in enumerate(page):
+                if old[0] == row[0]:
+                    page[j] = row
+                    return True
+        return False
+
+    def remove(self, booking_id):
+        booking_id = int(booking_id)
+        for i, page in enumerate(self.pages):
+            for j, row in enumerate(page):
+                if row[0] == booking_id:
+                    del page[j]
+                    if not page:
+                        del self.pages[i]
+                    return True
+        return False
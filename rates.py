@@ -0,0 +1,312 @@
+import argparse
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import date
+from itertools import accumulate
+
+from catalog import TableWatch
+from days import to_day, from_day
+
+ALL_TYPES = ""
+WEEKEND_NIGHTS = (4, 5)  # Friday and Saturday nights, as date.weekday()
+CALENDAR_PAST = 400
+CALENDAR_FUTURE = 1100
+REPRICE_BATCH = 5000
+NAN = float("nan")
+
+PLANS_SQL = "SELECT room_type, weekend_rate, weekend_days FROM rate_plans"
+SEASONS_SQL = "SELECT room_type, day_from, day_to, rate, weekend_rate FROM rate_seasons ORDER BY id"
+DISCOUNTS_SQL = "SELECT room_type, min_nights, percent FROM los_discounts ORDER BY room_type, min_nights"
+REPRICE_SQL = """
+    SELECT s.id, s.room_id, s.day_in, s.day_out, s.total, r.room_type, r.rate
+    FROM stays s JOIN rooms r ON r.id = s.room_id
+    WHERE s.day_out > ? AND s.day_in >= ?
+"""
+# Only stays still on the dates and room they were priced for are changed.
+REPRICE_UPDATE = "UPDATE stays SET total = ? WHERE id = ? AND room_id = ? AND day_in = ? AND day_out = ?"
+
+
+def weekend_days(text):
+    return tuple(int(d) for d in text.split(",") if d.strip()) if text else ()
+
+
+class RateCalendar:
+    # Nightly prices per room type over the days [origin, origin + days),
+    # as arrays. A night is NaN when no rule sets it and the room's own
+    # rate applies. Alongside each price array go two prefix sums, of the
+    # fixed prices and of the nights left at the room rate, so pricing a
+    # stay of any length is two subtractions. Later rules win: seasons for
+    # the type over seasons for all types over the weekend rate.
+    def __init__(self, origin, days, plans, seasons, discounts):
+        self.origin = origin
+        self.days = days
+        self.plans = plans
+        self.seasons = seasons
+        self.discounts = discounts
+        self._tables = {}
+
+    def covers(self, lo, hi):
+        return self.origin <= lo and hi <= self.origin + self.days
+
+    def _weekend(self, room_type):
+        plan = self.plans.get(room_type) or self.plans.get(ALL_TYPES)
+        return plan or (None, WEEKEND_NIGHTS)
+
+    def _fill(self, price, a, b, value, nights=None):
+        # Sets price[a:b] (only the given weekdays when `nights` is set)
+        # with slice assignment rather than a loop over days.
+        a, b = max(a, 0), min(b, self.days)
+        if a >= b:
+            return
+        if nights is None:
+            price[a:b] = array("d", [value]) * (b - a)
+            return
+        for weekday in nights:
+            # Day 0 (1970-01-01) was a Thursday, weekday 3.
+            i = a + (weekday - (self.origin + a + 3)) % 7
+            if i < b:
+                price[i:b:7] = array("d", [value]) * len(range(i, b, 7))
+
+    def _build(self, room_type):
+        price = array("d", [NAN]) * self.days
+        weekend_rate, nights = self._weekend(room_type)
+        if weekend_rate is not None:
+            self._fill(price, 0, self.days, weekend_rate, nights)
+        for t in (ALL_TYPES, room_type) if room_type != ALL_TYPES else (ALL_TYPES,):
+            for day_from, day_to, rate, season_weekend in self.seasons.get(t, ()):
+                if rate is not None:
+                    self._fill(price, day_from - self.origin, day_to - self.origin, rate)
+                if season_weekend is not None:
+                    self._fill(price, day_from - self.origin, day_to - self.origin, season_weekend, nights)
+        fixed = array("d", [0.0])
+        fixed.extend(accumulate(0.0 if p != p else p for p in price))
+        base = array("l", [0])
+        base.extend(accumulate(1 if p != p else 0 for p in price))
+        return price, fixed, base
+
+    def table(self, room_type):
+        room_type = room_type or ALL_TYPES
+        if room_type not in self.plans and room_type not in self.seasons:
+            room_type = ALL_TYPES
+        t = self._tables.get(room_type)
+        if t is None:
+            t = self._tables[room_type] = self._build(room_type)
+        return t
+
+    def discount(self, room_type, nights):
+        # Percent off for a stay of `nights`: the largest min_nights step
+        # reached, from the room type's own steps or else the default ones.
+        steps = self.discounts.get(room_type or ALL_TYPES) or self.discounts.get(ALL_TYPES)
+        if not steps:
+            return 0.0
+        i = bisect_right(steps[0], nights)
+        return steps[1][i - 1] if i else 0.0
+
+    def subtotal(self, room_type, base_rate, day_in, day_out):
+        # Rounded to cents: the prefix-sum difference carries float noise
+        # (3 x 99.99 comes out as 299.96999999997...).
+        _, fixed, base = self.table(room_type)
+        a, b = day_in - self.origin, day_out - self.origin
+        return round((fixed[b] - fixed[a]) + (base_rate or 0.0) * (base[b] - base[a]), 2)
+
+    def quote(self, room_type, base_rate, day_in, day_out):
+        if day_in is None or day_out is None or day_out <= day_in:
+            return 0.0
+        total = self.subtotal(room_type, base_rate, day_in, day_out)
+        pct = self.discount(room_type, day_out - day_in)
+        return round(total * (1 - pct / 100.0), 2)
+
+    def nightly(self, room_type, base_rate, day_in, day_out):
+        # ([(day, price)], discount percent) for invoice lines.
+        if day_in is None or day_out is None or day_out <= day_in:
+            return [], 0.0
+        price = self.table(room_type)[0]
+        a = day_in - self.origin
+        rate = base_rate or 0.0
+        nights = [(day_in + i, rate if p != p else p) for i, p in enumerate(price[a:a + day_out - day_in])]
+        return nights, self.discount(room_type, day_out - day_in)
+
+
+class RateBook:
+    # The current RateCalendar, rebuilt when the rate tables change (a
+    # TableWatch on 'rates') or a stay falls outside its window. Rule writes
+    # should call invalidate() so the next quote does not wait out the
+    # watch's recheck interval.
+    def __init__(self, db):
+        self.db = db
+        self.watch = TableWatch(db, "rates")
+        self._lock = threading.Lock()
+        self._calendar = None
+
+    def _load(self, lo, hi):
+        self.watch.loaded()
+        plans = {t: (rate, weekend_days(days)) for t, rate, days in self.db.query(PLANS_SQL)}
+        seasons = {}
+        for t, day_from, day_to, rate, weekend_rate in self.db.query(SEASONS_SQL):
+            seasons.setdefault(t, []).append((day_from, day_to, rate, weekend_rate))
+        discounts = {}
+        for t, min_nights, percent in self.db.query(DISCOUNTS_SQL):
+            steps = discounts.setdefault(t, ([], []))
+            steps[0].append(min_nights); steps[1].append(percent)
+        return RateCalendar(lo, hi - lo, plans, seasons, discounts)
+
+    def calendar(self, lo=None, hi=None):
+        today = to_day(date.today())
+        lo = today if lo is None else lo
+        hi = lo + 1 if hi is None else hi
+        with self._lock:
+            cal = self._calendar
+            if cal is None or not cal.covers(lo, hi) or self.watch.stale():
+                start, end = min(lo, today - CALENDAR_PAST), max(hi, today + CALENDAR_FUTURE)
+                if cal is not None:
+                    # Never shrink the window a caller already needed.
+                    start, end = min(start, cal.origin), max(end, cal.origin + cal.days)
+                cal = self._calendar = self._load(start, end)
+            return cal
+
+    def invalidate(self):
+        with self._lock:
+            self._calendar = None
+
+    def quote(self, room_type, base_rate, day_in, day_out):
+        if day_in is None or day_out is None or day_out <= day_in:
+            return 0.0
+        return self.calendar(day_in, day_out).quote(room_type, base_rate, day_in, day_out)
+
+    def nightly(self, room_type, base_rate, day_in, day_out):
+        if day_in is None or day_out is None or day_out <= day_in:
+            return [], 0.0
+        return self.calendar(day_in, day_out).nightly(room_type, base_rate, day_in, day_out)
+
+
+# ---------- RULES ----------
+def set_weekend(db, room_type, rate, nights=WEEKEND_NIGHTS):
+    db.execute("INSERT INTO rate_plans (room_type, weekend_rate, weekend_days) VALUES (?, ?, ?) "
+               "ON CONFLICT (room_type) DO UPDATE SET weekend_rate = excluded.weekend_rate, weekend_days = excluded.weekend_days",
+               (room_type, rate, ",".join(str(d) for d in nights)))
+
+
+def add_season(db, room_type, date_from, date_to, rate=None, weekend_rate=None, name=""):
+    # Nights from date_from up to (not including) date_to.
+    with db.transaction() as c:
+        cur = c.execute("INSERT INTO rate_seasons (room_type, name, day_from, day_to, rate, weekend_rate) VALUES (?, ?, ?, ?, ?, ?)",
+                        (room_type, name, to_day(date_from), to_day(date_to), rate, weekend_rate))
+        return cur.lastrowid
+
+
+def delete_season(db, season_id):
+    db.execute("DELETE FROM rate_seasons WHERE id = ?", (season_id,))
+
+
+def set_discount(db, room_type, min_nights, percent):
+    db.execute("INSERT OR REPLACE INTO los_discounts (room_type, min_nights, percent) VALUES (?, ?, ?)", (room_type, min_nights, percent))
+
+
+def delete_discount(db, room_type, min_nights):
+    db.execute("DELETE FROM los_discounts WHERE room_type = ? AND min_nights = ?", (room_type, min_nights))
+
+
+def list_rules(db):
+    return {
+        "weekend": db.query("SELECT room_type, weekend_rate, weekend_days FROM rate_plans ORDER BY room_type"),
+        "seasons": [(i, t, name, from_day(a), from_day(b), rate, wk) for i, t, name, a, b, rate, wk in
+                    db.query("SELECT id, room_type, name, day_from, day_to, rate, weekend_rate FROM rate_seasons ORDER BY day_from, id")],
+        "discounts": db.query(DISCOUNTS_SQL),
+    }
+
+
+# ---------- BULK REPRICE ----------
+def reprice(db, since=None, room_type=None, book=None, job=None, batch_size=REPRICE_BATCH, on_batch=None):
+    # Re-prices every stay starting on or after `since` (default today)
+    # from the current rules, e.g. after a tariff change. One read, totals
+    # from the calendar's prefix sums, then only the changed rows written
+    # back with executemany in batches; on_batch(chunk) is called after
+    # each one commits. Returns the number changed.
+    since = to_day(since or date.today())
+    sql, params = REPRICE_SQL, [since, since]
+    if room_type is not None:
+        sql += " AND r.room_type = ?"; params.append(room_type)
+    rows = db.query(sql, params)
+    if not rows:
+        return 0
+    book = book or RateBook(db)
+    cal = book.calendar(min(r[2] for r in rows), max(r[3] for r in rows))
+    quote = cal.quote
+    changes = []
+    for stay_id, room_id, day_in, day_out, total, t, rate in rows:
+        new = quote(t, rate, day_in, day_out)
+        if new != round(total or 0.0, 2):
+            changes.append((new, stay_id, room_id, day_in, day_out))
+    done = 0
+    for i in range(0, len(changes), batch_size):
+        chunk = changes[i:i + batch_size]
+        db.write(lambda c: c.executemany(REPRICE_UPDATE, chunk))
+        if on_batch is not None:
+            on_batch(chunk)
+        done += len(chunk)
+        if job is not None:
+            job.check()
+            job.progress(done, len(changes))
+    return len(changes)
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Rate rules by room type, quotes and bulk repricing")
+    parser.add_argument("--db", default="hotel.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    p = sub.add_parser("weekend", help="weekend rate for a room type ('' for all types)")
+    p.add_argument("room_type"); p.add_argument("rate", type=float)
+    p.add_argument("--nights", default="4,5", help="weekdays of weekend nights, Monday=0 (default: Fri,Sat)")
+    p = sub.add_parser("season", help="season rate for nights from FROM up to TO")
+    p.add_argument("room_type"); p.add_argument("date_from"); p.add_argument("date_to")
+    p.add_argument("--rate", type=float); p.add_argument("--weekend-rate", type=float); p.add_argument("--name", default="")
+    p = sub.add_parser("delete-season")
+    p.add_argument("id", type=int)
+    p = sub.add_parser("discount", help="percent off stays of at least MIN_NIGHTS (0 percent removes it)")
+    p.add_argument("room_type"); p.add_argument("min_nights", type=int); p.add_argument("percent", type=float)
+    p = sub.add_parser("quote")
+    p.add_argument("room_no"); p.add_argument("check_in"); p.add_argument("check_out")
+    p = sub.add_parser("reprice", help="re-price stays starting on or after --since")
+    p.add_argument("--since"); p.add_argument("--type", dest="room_type")
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    migrations.migrate(db)
+    if args.command == "list":
+        rules = list_rules(db)
+        for t, rate, nights in rules["weekend"]:
+            print(f"weekend  {t or '(all)'}: {rate} on nights {nights}")
+        for i, t, name, a, b, rate, wk in rules["seasons"]:
+            print(f"season {i}  {t or '(all)'} {name} {a}..{b}: rate {rate} weekend {wk}")
+        for t, n, pct in rules["discounts"]:
+            print(f"discount {t or '(all)'}: {pct}% from {n} nights")
+    elif args.command == "weekend":
+        set_weekend(db, args.room_type, args.rate, weekend_days(args.nights))
+    elif args.command == "season":
+        print(f"Added season {add_season(db, args.room_type, args.date_from, args.date_to, args.rate, args.weekend_rate, args.name)}")
+    elif args.command == "delete-season":
+        delete_season(db, args.id)
+    elif args.command == "discount":
+        if args.percent:
+            set_discount(db, args.room_type, args.min_nights, args.percent)
+        else:
+            delete_discount(db, args.room_type, args.min_nights)
+    elif args.command == "quote":
+        row = db.query("SELECT room_type, rate FROM rooms WHERE room_no = ?", (args.room_no,))
+        if not row:
+            parser.error(f"unknown room {args.room_no}")
+        book = RateBook(db)
+        day_in, day_out = to_day(args.check_in), to_day(args.check_out)
+        nights, pct = book.nightly(row[0][0], row[0][1], day_in, day_out)
+        for day, price in nights:
+            print(f"{from_day(day)}  {price:.2f}")
+        if pct:
+            print(f"length-of-stay discount {pct:g}%")
+        print(f"total {book.quote(row[0][0], row[0][1], day_in, day_out):.2f}")
+    elif args.command == "reprice":
+        print(f"Repriced {reprice(db, args.since, args.room_type)} stays")
+    db.close_all()
@@ -0,0 +1,182 @@
+import argparse
+import csv
+from datetime import date, timedelta
+
+from migrations import ALL_STAYS, ROLLUP_BACKFILL
+
+PERIODS = ("day", "week", "month")
+ALL_TYPES = "All"
+REPORT_HEADER = ["Period", "Room Type", "Rooms", "Available", "Sold", "Occupancy %", "ADR", "RevPAR", "Revenue"]
+COMPARE_HEADER = ["Prev Occupancy %", "Prev ADR", "Prev RevPAR", "RevPAR Change %"]
+ROLLUP_SQL = "SELECT day, room_type, rooms_sold, revenue FROM daily_rollup WHERE day >= ? AND day <= ?"
+
+
+def period_key(day, period):
+    if period == "week":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if period == "month":
+        return day.strftime("%Y-%m")
+    return day.isoformat()
+
+
+def _previous_year(day, period):
+    # Weeks and days compare against 52 weeks earlier so weekdays line up;
+    # months against the same month a year earlier.
+    if period != "month":
+        return day - timedelta(days=364)
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+def room_counts(db):
+    return {t: n for t, n in db.query("SELECT IFNULL(room_type, ''), COUNT(*) FROM rooms GROUP BY 1")}
+
+
+def _days(date_from, date_to):
+    d = date_from
+    while d <= date_to:
+        yield d
+        d += timedelta(days=1)
+
+
+def report(db, date_from, date_to, period="day", by_type=False, room_type=None):
+    # Occupancy, ADR and RevPAR per period (and room type), read from the
+    # daily_rollup table. Available room-nights use today's room count per
+    # type for every day.
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    counts = room_counts(db)
+    groups = {}
+
+    def group(key, t):
+        g = groups.get((key, t))
+        if g is None:
+            g = groups[(key, t)] = {"period": key, "room_type": t, "rooms": counts.get(t, 0) if t != ALL_TYPES else 0,
+                                    "available": 0, "sold": 0, "revenue": 0.0}
+        return g
+    types = [room_type] if room_type else list(counts)
+    total_rooms = sum(counts.get(t, 0) for t in types)
+    keys = {}
+    for day in _days(date_from, date_to):
+        key = keys[day.isoformat()] = period_key(day, period)
+        if by_type:
+            for t in types:
+                group(key, t)["available"] += counts.get(t, 0)
+        else:
+            g = group(key, room_type or ALL_TYPES)
+            g["available"] += total_rooms
+            g["rooms"] = total_rooms
+    sql, params = ROLLUP_SQL, [date_from.isoformat(), date_to.isoformat()]
+    if room_type:
+        sql += " AND room_type = ?"; params.append(room_type)
+    for day, t, sold, revenue in db.query(sql, params):
+        g = group(keys[day], t if by_type else (room_type or ALL_TYPES))
+        g["sold"] += sold
+        g["revenue"] += revenue
+    rows = sorted(groups.values(), key=lambda g: (g["period"], g["room_type"]))
+    for g in rows:
+        g["occupancy"] = 100.0 * g["sold"] / g["available"] if g["available"] else None
+        g["adr"] = g["revenue"] / g["sold"] if g["sold"] else None
+        g["revpar"] = g["revenue"] / g["available"] if g["available"] else None
+    return rows
+
+
+def compare_years(db, date_from, date_to, period="day", by_type=False, room_type=None):
+    # The report for the range plus the same metrics a year earlier,
+    # aligned period by period.
+    rows = report(db, date_from, date_to, period, by_type, room_type)
+    prev = {}
+    for g in report(db, _previous_year(date_from, period), _previous_year(date_to, period), period, by_type, room_type):
+        if period == "month":
+            y, m = g["period"].split("-")
+            key = f"{int(y) + 1:04d}-{m}"
+        else:
+            key = (date.fromisoformat(g["period"]) + timedelta(days=364)).isoformat()
+        prev[(key, g["room_type"])] = g
+    for g in rows:
+        p = prev.get((g["period"], g["room_type"]))
+        g["prev_occupancy"] = p["occupancy"] if p else None
+        g["prev_adr"] = p["adr"] if p else None
+        g["prev_revpar"] = p["revpar"] if p else None
+        g["revpar_change"] = (100.0 * (g["revpar"] - p["revpar"]) / p["revpar"]
+                              if p and p["revpar"] and g["revpar"] is not None else None)
+    return rows
+
+
+def totals(rows):
+    available = sum(g["available"] for g in rows)
+    sold = sum(g["sold"] for g in rows)
+    revenue = sum(g["revenue"] for g in rows)
+    return {
+        "available": available, "sold": sold, "revenue": revenue,
+        "occupancy": 100.0 * sold / available if available else None,
+        "adr": revenue / sold if sold else None,
+        "revpar": revenue / available if available else None,
+    }
+
+
+def fmt(value):
+    return "" if value is None else f"{value:.2f}"
+
+
+def format_row(g, compare=False):
+    values = [g["period"], g["room_type"], g["rooms"], g["available"], g["sold"],
+              fmt(g["occupancy"]), fmt(g["adr"]), fmt(g["revpar"]), fmt(g["revenue"])]
+    if compare:
+        values += [fmt(g.get("prev_occupancy")), fmt(g.get("prev_adr")), fmt(g.get("prev_revpar")), fmt(g.get("revpar_change"))]
+    return values
+
+
+def export_report(rows, fpath, compare=False):
+    with open(fpath, mode="w", newline='', encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_HEADER + (COMPARE_HEADER if compare else []))
+        writer.writerows(format_row(g, compare) for g in rows)
+    return len(rows)
+
+
+def rebuild_rollup(db):
+    # Recomputes the rollup from live and archived bookings. The triggers
+    # keep it exact, so this is only needed after editing the database by
+    # hand.
+    with db.transaction(immediate=True) as c:
+        c.execute("DELETE FROM daily_rollup")
+        c.execute(ROLLUP_BACKFILL.format(stays=ALL_STAYS))
+    return db.query("SELECT COUNT(*) FROM daily_rollup")[0][0]
+
+
+if __name__ == "__main__":
+    from db import ConnectionManager
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Occupancy, ADR and RevPAR reports from hotel.db")
+    parser.add_argument("command", choices=["show", "export", "rebuild"])
+    parser.add_argument("file", nargs="?", help="CSV file for export")
+    parser.add_argument("--db", default="hotel.db")
+    parser.add_argument("--from", dest="date_from", help="default: one year before --to")
+    parser.add_argument("--to", dest="date_to", help="default: today")
+    parser.add_argument("--period", choices=PERIODS, default="month")
+    parser.add_argument("--type", dest="room_type")
+    parser.add_argument("--by-type", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="add the same metrics a year earlier")
+    args = parser.parse_args()
+    db = ConnectionManager(args.db)
+    migrations.migrate(db)
+    if args.command == "rebuild":
+        print(f"Rebuilt {rebuild_rollup(db)} rollup rows")
+    else:
+        date_to = date.fromisoformat(args.date_to) if args.date_to else date.today()
+        date_from = date.fromisoformat(args.date_from) if args.date_from else date_to - timedelta(days=364)
+        rows = (compare_years if args.compare else report)(db, date_from, date_to, args.period, args.by_type, args.room_type)
+        if args.command == "export":
+            if not args.file:
+                parser.error("export needs a file")
+            print(f"Exported {export_report(rows, args.file, args.compare)} rows to {args.file}")
+        else:
+            header = REPORT_HEADER + (COMPARE_HEADER if args.compare else [])
+            print("\t".join(header))
+            for g in rows:
+                print("\t".join(str(v) for v in format_row(g, args.compare)))
+    db.close_all()
@@ -0,0 +1,64 @@
+import re
+
+from store import BOOKING_COLUMNS
+
+RESULT_LIMIT = 500
+CANDIDATE_LIMIT = 5000
+MIN_QUERY_LENGTH = 2
+
+# bm25 has to score every match before it can sort, so very broad prefixes
+# ("an") would cost O(matches). Ranking is limited to the newest
+# CANDIDATE_LIMIT matches, which FTS5 finds by walking rowids backwards.
+FTS_SQL = """
+    SELECT {columns}
+    FROM {table}_fts f JOIN {table} b ON b.id = f.rowid
+    WHERE {table}_fts MATCH ?1 AND f.rowid >= IFNULL((
+        SELECT MIN(rowid) FROM (
+            SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?1
+            ORDER BY rowid DESC LIMIT ?3
+        )
+    ), 0)
+    ORDER BY f.rank LIMIT ?2
+"""
+LIKE_SQL = """
+    SELECT {columns} FROM {table}
+    WHERE guest_name LIKE ? OR room_no LIKE ? OR phone LIKE ?
+    ORDER BY created_at DESC LIMIT ?
+"""
+ARCHIVE_TABLE = "bookings_archive"
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def has_fts(db, table="bookings"):
+    return bool(db.query("SELECT 1 FROM sqlite_master WHERE name = ?", (table + "_fts",)))
+
+
+def match_expression(q):
+    # Every word must match as a token prefix, in any indexed column:
+    # "ann 10" finds Anna in room 104. Quoting keeps FTS5 syntax out.
+    tokens = _TOKEN.findall(q)
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _search(db, table, q, limit, fts):
+    if fts:
+        expr = match_expression(q)
+        if not expr:
+            return []
+        sql = FTS_SQL.format(columns=", ".join("b." + c for c in BOOKING_COLUMNS), table=table)
+        return db.query(sql, (expr, limit, CANDIDATE_LIMIT))
+    like = f"%{q}%"
+    return db.query(LIKE_SQL.format(columns=", ".join(BOOKING_COLUMNS), table=table), (like, like, like, limit))
+
+
+def search_bookings(db, q, limit=RESULT_LIMIT, fts=None, include_archive=False):
+    # Best-ranked bookings first (bm25) when the FTS5 index exists,
+    # otherwise newest first from a LIKE scan. Archived stays, when asked
+    # for, fill the remaining slots after the live matches.
+    if fts is None:
+        fts = has_fts(db)
+    rows = _search(db, "bookings", q, limit, fts)
+    if include_archive and len(rows) < limit:
+        rows += _search(db, ARCHIVE_TABLE, q, limit - len(rows), fts and has_fts(db, ARCHIVE_TABLE))
+    return rows
@@ -0,0 +1,259 @@
+import sqlite3
+from datetime import date
+
+import archive
+import availability
+import invoices
+import search
+from days import MAX_NIGHTS, parse_day, to_day, from_day
+from occupancy import OccupancyIndex, SEARCH_HORIZON
+from store import Store, UnknownRoom, BOOKING_COLUMNS, ROOM_COLUMNS
+
+RECENT_LIMIT = 200
+
+
+class ValidationError(ValueError):
+    pass
+
+
+class NotFound(LookupError):
+    pass
+
+
+class DuplicateRoom(Exception):
+    pass
+
+
+def text(value):
+    # A form field or JSON value as a stripped string ("" for None), so a
+    # number sent where text is expected is taken as its digits.
+    return "" if value is None else str(value).strip()
+
+
+def parse_date(value, what="Date"):
+    if isinstance(value, date):
+        return value
+    value = text(value)
+    if not value:
+        raise ValidationError(f"{what} is required.")
+    try:
+        return parse_day(value)
+    except ValueError:
+        raise ValidationError(f"Date format should be YYYY-MM-DD: {value}") from None
+
+
+def parse_number(value, what, cast=float, default=None):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return default
+    try:
+        return cast(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        kind = "a whole number" if cast is int else "a number"
+        raise ValidationError(f"{what} must be {kind}.") from None
+
+
+def stay_nights(check_in, check_out):
+    # Nights between two YYYY-MM-DD strings; 0 when either is blank.
+    dates = [parse_date(d) if d else None for d in (check_in, check_out)]
+    if dates[0] is None or dates[1] is None:
+        return 0
+    nights = (dates[1] - dates[0]).days
+    if nights <= 0:
+        raise ValidationError("Check-out must be after check-in.")
+    if nights > MAX_NIGHTS:
+        raise ValidationError(f"A stay can be at most {MAX_NIGHTS} nights.")
+    return nights
+
+
+def room_dict(row):
+    return dict(zip(ROOM_COLUMNS, row))
+
+
+def booking_dict(row):
+    return dict(zip(BOOKING_COLUMNS, row))
+
+
+class HotelService:
+    # Room, booking, availability and invoice operations with no UI in
+    # them. Inputs are the strings a form or a JSON request carries; bad
+    # input raises ValidationError with a message fit to show a user. All
+    # writes go through the Store, so every listener still gets its
+    # RowEvents. Safe to call from several threads at once.
+    def __init__(self, db, store=None, occupancy=None):
+        self.db = db
+        self.store = store or Store(db)
+        self.occupancy = occupancy or OccupancyIndex(db, self.store.catalog, self.store.events)
+
+    # ---------- ROOMS ----------
+    def rooms(self):
+        return [r.as_row() for r in self.store.catalog.rooms()]
+
+    def room(self, room_id):
+        row = self.store.get_room(room_id)
+        if row is None:
+            raise NotFound(f"Room {room_id} does not exist.")
+        return row
+
+    def room_types(self):
+        return self.store.catalog.room_types()
+
+    def _room_values(self, room_no, room_type, rate, notes):
+        room_no = text(room_no)
+        if not room_no:
+            raise ValidationError("Room number is required.")
+        return room_no, text(room_type), parse_number(rate, "Rate", default=0.0), text(notes)
+
+    def _write_room(self, fn, duplicate_message):
+        try:
+            return fn()
+        except sqlite3.IntegrityError:
+            raise DuplicateRoom(duplicate_message) from None
+
+    def add_room(self, room_no, room_type="", rate=None, notes=""):
+        values = self._room_values(room_no, room_type, rate, notes)
+        return self._write_room(lambda: self.store.add_room(*values), "Room number already exists.")
+
+    def update_room(self, room_id, room_no, room_type="", rate=None, notes=""):
+        values = self._room_values(room_no, room_type, rate, notes)
+        row = self._write_room(lambda: self.store.update_room(room_id, *values), "Room number conflicts with existing room.")
+        if row is None:
+            raise NotFound(f"Room {room_id} does not exist.")
+        return row
+
+    def room_booking_count(self, room_id):
+        return self.db.query("SELECT COUNT(*) FROM stays WHERE room_id=?", (room_id,))[0][0]
+
+    def delete_room(self, room_id):
+        # Its bookings move to the archive (see migrations v10).
+        old = self.store.delete_room(room_id)
+        if old is None:
+            raise NotFound(f"Room {room_id} does not exist.")
+        return old
+
+    # ---------- BOOKINGS ----------
+    def booking(self, booking_id):
+        row = self.store.get_booking(booking_id)
+        if row is None:
+            raise NotFound(f"Booking {booking_id} does not exist.")
+        return row
+
+    def recent_bookings(self, limit=RECENT_LIMIT, before=None):
+        # Newest first; pass the last row's (created_at, id) as `before`
+        # for the next page.
+        limit = min(parse_number(limit, "Limit", int, RECENT_LIMIT), 1000)
+        if limit < 1:
+            raise ValidationError("Limit must be at least 1.")
+        sql = f"SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings"
+        params = []
+        if before:
+            sql += " WHERE (created_at, id) < (?, ?)"; params.extend(before)
+        return self.db.query(sql + " ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit))
+
+    def search(self, q, include_archive=False, limit=search.RESULT_LIMIT):
+        q = text(q)
+        if len(q) < search.MIN_QUERY_LENGTH:
+            raise ValidationError(f"Search needs at least {search.MIN_QUERY_LENGTH} characters.")
+        limit = min(parse_number(limit, "Limit", int, search.RESULT_LIMIT), search.RESULT_LIMIT)
+        if limit < 1:
+            raise ValidationError("Limit must be at least 1.")
+        return search.search_bookings(self.db, q, limit, include_archive=include_archive)
+
+    def _booking_values(self, name, room, phone, check_in, check_out):
+        name, room = text(name), text(room)
+        if not name or not room:
+            raise ValidationError("Guest name and room number are required.")
+        check_in, check_out = text(check_in), text(check_out)
+        return name, room, text(phone), check_in, check_out, stay_nights(check_in, check_out)
+
+    def add_booking(self, name, room, phone="", check_in="", check_out=""):
+        return self.store.add_booking(*self._booking_values(name, room, phone, check_in, check_out))
+
+    def update_booking(self, booking_id, name, room, phone="", check_in="", check_out=""):
+        row = self.store.update_booking(booking_id, *self._booking_values(name, room, phone, check_in, check_out))
+        if row is None:
+            raise NotFound(f"Booking {booking_id} does not exist.")
+        return row
+
+    def check_out(self, booking_id):
+        old = self.store.check_out(booking_id)
+        if old is None:
+            raise NotFound(f"Booking {booking_id} is not a live booking.")
+        return old
+
+    def cancel_booking(self, booking_id):
+        old = self.store.delete_booking(booking_id)
+        if old is None:
+            raise NotFound(f"Booking {booking_id} does not exist.")
+        return old
+
+    def archive_closed(self, before=None, job=None):
+        # Archiving bypasses the Store, so no RowEvents reach the index.
+        try:
+            return archive.archive_closed(self.db, parse_date(before) if before else None, job=job)
+        finally:
+            self.occupancy.invalidate()
+
+    # ---------- AVAILABILITY ----------
+    def _filters(self, room_type, max_rate):
+        return text(room_type) or None, parse_number(max_rate, "Max rate")
+
+    def free_rooms(self, frm, to, room_type=None, max_rate=None):
+        frm, to = parse_date(frm, "From date"), parse_date(to, "To date")
+        if to <= frm:
+            raise ValidationError("To date must be after From date.")
+        return availability.free_rooms(self.db, frm, to, *self._filters(room_type, max_rate))
+
+    def earliest_fit(self, nights, room_type=None, start=None, horizon=None, max_rate=None):
+        nights = parse_number(nights, "Nights", int)
+        horizon = parse_number(horizon, "Days", int, SEARCH_HORIZON)
+        if nights is None or nights < 1 or horizon < nights:
+            raise ValidationError("Nights must be at least 1 and fit within the number of days.")
+        start = parse_date(start) if start else date.today()
+        room_type, max_rate = self._filters(room_type, max_rate)
+        try:
+            return self.occupancy.earliest_fit(nights, room_type, start, horizon, max_rate)
+        except ValueError as e:
+            raise ValidationError(str(e)) from None
+
+    def free_on(self, dates, k=None, room_type=None, max_rate=None):
+        if isinstance(dates, str):
+            dates = dates.replace(";", ",").split(",")
+        days = [parse_date(d) for d in dates if isinstance(d, date) or text(d)]
+        if not days:
+            raise ValidationError("Please enter one or more dates.")
+        k = parse_number(k, "At least", int)
+        room_type, max_rate = self._filters(room_type, max_rate)
+        try:
+            return self.occupancy.free_on(days, k, room_type, max_rate)
+        except ValueError as e:
+            raise ValidationError(str(e)) from None
+
+    def quote(self, room, check_in, check_out):
+        # Price of a stay before booking it: per-night prices, the
+        # length-of-stay discount and the total.
+        room = text(room)
+        rec = self.store.catalog.get(room)
+        if rec is None:
+            raise UnknownRoom(room)
+        check_in, check_out = parse_date(check_in, "Check-in"), parse_date(check_out, "Check-out")
+        stay_nights(check_in, check_out)
+        day_in, day_out = to_day(check_in), to_day(check_out)
+        nightly, pct = self.store.rates.nightly(rec.room_type, rec.rate, day_in, day_out)
+        return {"room_no": rec.room_no, "nights": [{"date": from_day(d), "rate": p} for d, p in nightly],
+                "discount_percent": pct, "total": self.store.rates.quote(rec.room_type, rec.rate, day_in, day_out)}
+
+    # ---------- INVOICES ----------
+    def invoice(self, booking_id, pdf=False):
+        # (filename, bytes) for a live or archived booking.
+        item = invoices.select_booking(self.db, booking_id, self.store.rates)
+        if item is None:
+            raise NotFound(f"Booking {booking_id} does not exist.")
+        pdf = pdf and invoices.FPDF_AVAILABLE
+        booking, room_type, rate = item
+        return f"invoice_booking_{booking_id}{'.pdf' if pdf else '.txt'}", invoices.render_invoice(booking, room_type, rate, pdf)
+
+    def write_invoice(self, booking_id, fpath):
+        item = invoices.select_booking(self.db, booking_id, self.store.rates)
+        if item is None:
+            raise NotFound(f"Booking {booking_id} does not exist.")
+        invoices.write_invoice(fpath, *item)
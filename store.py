@@ -0,0 +1,149 @@
+import sqlite3
+
+from archive import archive_booking
+from catalog import RoomCatalog
+from days import to_day
+from events import EventBus, INSERT, UPDATE, DELETE, RELOAD
+from migrations import OVERLAP_ERROR, UNKNOWN_ROOM_ERROR
+from rates import RateBook, reprice
+
+ROOM_COLUMNS = ("id", "room_no", "room_type", "rate", "notes")
+BOOKING_COLUMNS = ("id", "guest_name", "room_no", "phone", "check_in", "check_out", "nights", "total", "created_at")
+
+ROOM_SELECT = f"SELECT {', '.join(ROOM_COLUMNS)} FROM rooms"
+BOOKING_SELECT = f"SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings"
+STAY_INSERT = "INSERT INTO stays (guest_name, room_id, phone, day_in, day_out, nights, total) VALUES (?, ?, ?, ?, ?, ?, ?)"
+STAY_UPDATE = "UPDATE stays SET guest_name=?, room_id=?, phone=?, day_in=?, day_out=?, nights=?, total=? WHERE id=?"
+
+
+class RoomOccupied(Exception):
+    pass
+
+
+class UnknownRoom(Exception):
+    pass
+
+
+class Store:
+    # All room and booking writes go through here so that every mutation
+    # emits a RowEvent carrying the affected row.
+    def __init__(self, db, events=None, catalog=None):
+        self.db = db
+        self.events = events or EventBus()
+        self.catalog = catalog or RoomCatalog(db, self.events)
+        self.rates = RateBook(db)
+
+    def get_room(self, room_id):
+        rows = self.db.query(ROOM_SELECT + " WHERE id=?", (room_id,))
+        return rows[0] if rows else None
+
+    def get_booking(self, booking_id):
+        rows = self.db.query(BOOKING_SELECT + " WHERE id=?", (booking_id,))
+        return rows[0] if rows else None
+
+    # ---------- ROOMS ----------
+    def add_room(self, room_no, room_type, rate, notes):
+        def insert(c):
+            cur = c.execute("INSERT INTO rooms (room_no, room_type, rate, notes) VALUES (?, ?, ?, ?)", (room_no, room_type, rate, notes))
+            return self.get_room(cur.lastrowid)
+        row = self.db.write(insert)
+        self.events.emit("rooms", INSERT, row)
+        return row
+
+    def update_room(self, room_id, room_no, room_type, rate, notes):
+        def update(c):
+            old = self.get_room(room_id)
+            c.execute("UPDATE rooms SET room_no=?, room_type=?, rate=?, notes=? WHERE id=?", (room_no, room_type, rate, notes, room_id))
+            return self.get_room(room_id), old
+        row, old = self.db.write(update)
+        if row is not None:
+            self.events.emit("rooms", UPDATE, row, old)
+        return row
+
+    def delete_room(self, room_id):
+        def delete(c):
+            old = self.get_room(room_id)
+            c.execute("DELETE FROM rooms WHERE id=?", (room_id,))
+            return old
+        old = self.db.write(delete)
+        if old is not None:
+            self.events.emit("rooms", DELETE, old)
+        return old
+
+    # ---------- BOOKINGS ----------
+    # Booking writes run in one BEGIN IMMEDIATE transaction (db.write), and
+    # the stays_no_overlap triggers reject a clashing stay inside the same
+    # statement, so two desks can never both book a room. They go straight
+    # to the stays table; rows read back through the bookings view.
+    def _room(self, room_no):
+        rec = self.catalog.get(room_no)
+        if rec is None:
+            # Possibly added by another desk since the catalog last looked.
+            rec = self.catalog.refresh(force=True)[0].get(room_no)
+        if rec is None:
+            raise UnknownRoom(room_no)
+        return rec
+
+    def _write_booking(self, fn, room):
+        try:
+            return self.db.write(fn)
+        except sqlite3.IntegrityError as e:
+            if OVERLAP_ERROR in str(e):
+                raise RoomOccupied(room) from None
+            if UNKNOWN_ROOM_ERROR in str(e) or "FOREIGN KEY" in str(e):
+                raise UnknownRoom(room) from None
+            raise
+
+    def add_booking(self, name, room, phone, check_in, check_out, nights):
+        rec = self._room(room)
+        day_in, day_out = to_day(check_in), to_day(check_out)
+        values = (name, rec.id, phone, day_in, day_out, nights, self.rates.quote(rec.room_type, rec.rate, day_in, day_out))
+
+        def insert(c):
+            cur = c.execute(STAY_INSERT, values)
+            return self.get_booking(cur.lastrowid)
+        row = self._write_booking(insert, room)
+        self.events.emit("bookings", INSERT, row)
+        return row
+
+    def update_booking(self, booking_id, name, room, phone, check_in, check_out, nights):
+        rec = self._room(room)
+        day_in, day_out = to_day(check_in), to_day(check_out)
+        values = (name, rec.id, phone, day_in, day_out, nights, self.rates.quote(rec.room_type, rec.rate, day_in, day_out), booking_id)
+
+        def update(c):
+            old = self.get_booking(booking_id)
+            c.execute(STAY_UPDATE, values)
+            return self.get_booking(booking_id), old
+        row, old = self._write_booking(update, room)
+        if row is not None:
+            self.events.emit("bookings", UPDATE, row, old)
+        return row
+
+    def check_out(self, booking_id):
+        # Moves the stay into bookings_archive. For the live table, and so
+        # for listeners, this is a DELETE.
+        def move(c):
+            old = self.get_booking(booking_id)
+            if old is not None:
+                archive_booking(c, booking_id)
+            return old
+        old = self.db.write(move)
+        if old is not None:
+            self.events.emit("bookings", DELETE, old)
+        return old
+
+    def delete_booking(self, booking_id):
+        def delete(c):
+            old = self.get_booking(booking_id)
+            c.execute("DELETE FROM stays WHERE id=?", (booking_id,))
+            return old
+        old = self.db.write(delete)
+        if old is not None:
+            self.events.emit("bookings", DELETE, old)
+        return old
+
+    def reprice(self, since=None, room_type=None, job=None):
+        # Bulk writes carry no rows; each committed batch emits one RELOAD.
+        return reprice(self.db, since, room_type, book=self.rates, job=job,
+                       on_batch=lambda chunk: self.events.emit("bookings", RELOAD, None))
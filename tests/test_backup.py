@@ -0,0 +1,60 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import backup
+import migrations
+from db import ConnectionManager
+from store import Store
+
+
+class BackupStopTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        store = Store(self.db)
+        for i in range(200):
+            store.add_room(str(100 + i), "Double", 90.0, "x" * 2000)
+        self.dir = os.path.join(self.tmp.name, "backups")
+        os.makedirs(self.dir)
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def test_stop_event(self):
+        stop = threading.Event()
+        stop.set()
+        for compress in (False, True):
+            with self.assertRaises(backup.BackupStopped):
+                backup.take_snapshot(self.db, self.dir, compress=compress, stop=stop)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_scheduler_stops_mid_backup(self):
+        # One page per step with a long pause: a full copy would take
+        # minutes, so stop() returning promptly means it was cut short.
+        started = threading.Event()
+        real = backup.backup
+
+        def slow(db, dest, **kwargs):
+            started.set()
+            return real(db, dest, pages=1, pause=0.05, **kwargs)
+        backup.backup = slow
+        try:
+            scheduler = backup.BackupScheduler(self.db, self.dir, 0.01)
+            scheduler.start()
+            self.assertTrue(started.wait(10))
+            t0 = time.monotonic()
+            scheduler.stop()
+            self.assertLess(time.monotonic() - t0, 5)
+        finally:
+            backup.backup = real
+        self.assertEqual(os.listdir(self.dir), [])
+        self.assertEqual(backup.snapshots(self.db, self.dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, timedelta
+
+import migrations
+from days import to_day
+from db import ConnectionManager
+from store import Store, RoomOccupied
+
+ROOMS = ("101", "102", "103")
+FIRST_DAY = date(2030, 1, 1)
+DAYS = 30
+WRITERS = 6
+ATTEMPTS = 60
+
+OVERLAPS_SQL = """
+    SELECT COUNT(*) FROM stays a JOIN stays b
+      ON b.room_id = a.room_id AND b.id < a.id AND b.day_out > a.day_in AND b.day_in < a.day_out
+"""
+
+
+def _attempt(store, rng):
+    frm = FIRST_DAY + timedelta(days=rng.randint(0, DAYS))
+    nights = rng.randint(1, 4)
+    try:
+        store.add_booking("Writer", rng.choice(ROOMS), "", frm.isoformat(), (frm + timedelta(days=nights)).isoformat(), nights)
+        return 1
+    except RoomOccupied:
+        return 0
+
+
+def _writer(path, seed, barrier, results):
+    # One desk: its own process, connections and Store.
+    db = ConnectionManager(path)
+    store = Store(db)
+    rng = random.Random(seed)
+    barrier.wait()
+    booked = sum(_attempt(store, rng) for _ in range(ATTEMPTS))
+    db.close_all()
+    results.put(booked)
+
+
+class ConcurrentBookingTest(unittest.TestCase):
+    # Many writers booking the same few rooms over the same month must
+    # never leave two stays of one room overlapping (see db.write and the
+    # stays_no_overlap triggers).
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "hotel.db")
+        self.db = ConnectionManager(self.path)
+        migrations.migrate(self.db)
+        store = Store(self.db)
+        for room_no in ROOMS:
+            store.add_room(room_no, "Double", 90.0, "")
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def assertNoOverlaps(self):
+        self.assertEqual(self.db.query(OVERLAPS_SQL)[0][0], 0)
+
+    def test_processes(self):
+        ctx = multiprocessing.get_context("spawn")
+        barrier = ctx.Barrier(WRITERS)
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_writer, args=(self.path, i, barrier, results)) for i in range(WRITERS)]
+        for p in procs:
+            p.start()
+        booked = sum(results.get(timeout=120) for _ in procs)
+        for p in procs:
+            p.join(timeout=30)
+            self.assertEqual(p.exitcode, 0)
+        self.assertGreater(booked, 0)
+        self.assertEqual(self.db.query("SELECT COUNT(*) FROM stays")[0][0], booked)
+        self.assertNoOverlaps()
+
+    def test_threads(self):
+        # Threads of one process, each on its own thread-local connection.
+        store = Store(self.db)
+        barrier = threading.Barrier(WRITERS)
+        booked = []
+
+        def run(seed):
+            rng = random.Random(seed)
+            barrier.wait()
+            booked.append(sum(_attempt(store, rng) for _ in range(ATTEMPTS)))
+            self.db.close()
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(WRITERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(booked), WRITERS)
+        self.assertEqual(self.db.query("SELECT COUNT(*) FROM stays")[0][0], sum(booked))
+        self.assertNoOverlaps()
+
+    def test_raw_insert_refused(self):
+        # The database refuses an overlap even from a writer that skips
+        # every check in the Store.
+        Store(self.db).add_booking("First", "101", "", "2030-01-01", "2030-01-05", 4)
+        room_id = self.db.query("SELECT id FROM rooms WHERE room_no = '101'")[0][0]
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.write(lambda c: c.execute(
+                "INSERT INTO stays (room_id, day_in, day_out, guest_name) VALUES (?, ?, ?, 'Second')",
+                (room_id, to_day(date(2030, 1, 3)), to_day(date(2030, 1, 7)))))
+        self.assertNoOverlaps()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+import csvio
+import migrations
+from db import ConnectionManager
+from store import Store
+
+
+class CsvImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        self.store = Store(self.db)
+        for room_no in ("101", "102"):
+            self.store.add_room(room_no, "Double", 100.0, "")
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def import_bookings(self, text, **kwargs):
+        path = os.path.join(self.tmp.name, "bookings.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.write(text)
+        return csvio.import_bookings(self.db, path, **kwargs)
+
+    def stays(self):
+        return self.db.query("SELECT guest_name, room_no, phone, check_in, check_out, nights, total, created_at FROM bookings ORDER BY id")
+
+    def test_missing_column_with_extra_field(self):
+        # No phone or created_at column, and a stray trailing field: the
+        # stray value must not leak into the missing columns.
+        report = self.import_bookings("Guest Name,Room No,Check-in,Check-out\nAnn,101,2030-01-01,2030-01-03,EXTRA\n")
+        self.assertEqual((report.accepted, report.rejected), (1, []))
+        name, room, phone, check_in, check_out, nights, total, created_at = self.stays()[0]
+        self.assertEqual((name, room, phone, check_in, check_out, nights, total), ("Ann", "101", "", "2030-01-01", "2030-01-03", 2, 200.0))
+        self.assertNotEqual(created_at, "EXTRA")
+
+    def test_short_rows(self):
+        report = self.import_bookings("guest_name,room_no,phone,check_in,check_out\nBen,102\n")
+        self.assertEqual(report.accepted, 1)
+        self.assertEqual(self.stays()[0][:5], ("Ben", "102", "", "", ""))
+
+    def test_error_rows(self):
+        report = self.import_bookings(
+            "guest_name,room_no,check_in,check_out,total\n"
+            ",101,2030-01-01,2030-01-02,\n"
+            "Cara,999,2030-01-01,2030-01-02,\n"
+            "Dan,101,2030-13-01,2030-01-02,\n"
+            "Eve,101,2030-01-05,2030-01-05,\n"
+            "Finn,101,2030-01-01,2030-01-02,abc\n"
+            "Gil,101,2030-01-01,2030-01-02,\n"
+        )
+        self.assertEqual(report.accepted, 1)
+        self.assertEqual([line for line, _ in report.rejected], [2, 3, 4, 5, 6])
+        reasons = [reason for _, reason in report.rejected]
+        self.assertIn("required", reasons[0])
+        self.assertIn("unknown room 999", reasons[1])
+        self.assertIn("YYYY-MM-DD", reasons[2])
+        self.assertIn("after check-in", reasons[3])
+        self.assertIn("must be a number", reasons[4])
+        self.assertEqual([s[0] for s in self.stays()], ["Gil"])
+
+    def test_overlap_sweep(self):
+        self.store.add_booking("Stored", "101", "", "2030-02-10", "2030-02-15", 5)
+        report = self.import_bookings(
+            "guest_name,room_no,check_in,check_out\n"
+            "A,101,2030-02-01,2030-02-05\n"    # 2: free
+            "B,101,2030-02-04,2030-02-06\n"    # 3: overlaps A
+            "C,101,2030-02-05,2030-02-08\n"    # 4: starts as A leaves
+            "D,101,2030-02-14,2030-02-16\n"    # 5: overlaps the stored stay
+            "E,102,2030-02-04,2030-02-06\n"    # 6: inside F, which starts earlier
+            "F,102,2030-01-20,2030-03-01\n"    # 7: room 102, kept
+            "G,101,2030-02-15,2030-02-20\n"    # 8: starts as the stored stay ends
+        )
+        # Within the file the stay that starts first wins.
+        self.assertEqual(sorted(line for line, _ in report.rejected), [3, 5, 6])
+        self.assertEqual(report.accepted, 4)
+        self.assertEqual(sorted(s[0] for s in self.stays()), ["A", "C", "F", "G", "Stored"])
+
+    def test_overlap_across_batches(self):
+        # Later batches see earlier ones as stored stays.
+        report = self.import_bookings(
+            "guest_name,room_no,check_in,check_out\n"
+            "A,101,2030-03-01,2030-03-05\n"
+            "B,102,2030-03-01,2030-03-05\n"
+            "C,101,2030-03-03,2030-03-04\n",
+            batch_size=2,
+        )
+        self.assertEqual(report.rejected, [(4, "room 101 is occupied during these dates")])
+        self.assertEqual(report.accepted, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
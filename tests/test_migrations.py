@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+
+import archive
+import migrations
+from db import ConnectionManager
+from migrations import ALL_STAYS, ROLLUP_BACKFILL, STAY_COLUMNS
+from store import Store
+
+# The schema hotel.db was created with, before any migration ran.
+BASELINE_SCHEMA = """
+    CREATE TABLE rooms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_no TEXT UNIQUE NOT NULL,
+        room_type TEXT,
+        rate REAL DEFAULT 0,
+        notes TEXT
+    );
+    CREATE TABLE bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guest_name TEXT NOT NULL,
+        room_no TEXT NOT NULL,
+        phone TEXT,
+        check_in TEXT,
+        check_out TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        nights INTEGER DEFAULT 0,
+        total REAL DEFAULT 0
+    );
+"""
+ROOMS = [("101", "Suite", 1000.0, ""), ("102", "Double", 120.0, None), ("103", None, 80.0, "")]
+# (id, guest_name, room_no, phone, check_in, check_out, created_at, nights, total)
+LEGACY = [
+    (1, "John Doe", "101", "9087654321", "2025-09-10", "2025-09-20", "2025-08-01 10:00:00", 10, 10000.0),
+    (2, "Ann", "102", None, "2025-09-12", "2025-09-15", "2025-08-02 10:00:00", 3, None),
+    # Overlaps Ann: legacy data predates the overlap checks and is kept.
+    (3, "Ben", "102", "", "2025-09-14", "2025-09-16", "2025-08-03 10:00:00", 2, 240.0),
+    (4, "Walk-in", "103", "", "", "", "2025-08-04 10:00:00", 0, 0.0),
+    (5, "Gone", "999", "", "2025-09-01", "2025-09-03", "2025-08-05 10:00:00", 2, 160.0),
+    (6, "Typo", "103", "", "2025-9-1", "2025-09-03", "2025-08-06 10:00:00", 2, 160.0),
+    (9, "Late", "103", "555", "2025-10-01", "2025-10-04", "2025-08-09 10:00:00", 3, 240.0),
+]
+REBUILD_SQL = ROLLUP_BACKFILL.split("SELECT", 1)[1]
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "hotel.db")
+        conn = sqlite3.connect(self.path)
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany("INSERT INTO rooms (room_no, room_type, rate, notes) VALUES (?, ?, ?, ?)", ROOMS)
+        conn.executemany(f"INSERT INTO bookings ({STAY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", LEGACY)
+        conn.commit()
+        conn.close()
+        self.db = ConnectionManager(self.path)
+        self.assertEqual(migrations.migrate(self.db), migrations.SCHEMA_VERSION)
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def assertRollupRebuilt(self):
+        # The trigger-maintained rollup must equal one rebuilt from scratch
+        # over live and archived stays.
+        def table(rows):
+            return {(day, room_type): (sold, round(revenue, 6)) for day, room_type, sold, revenue in rows
+                    if sold or abs(revenue) > 1e-9}
+        kept = table(self.db.query("SELECT day, room_type, rooms_sold, revenue FROM daily_rollup"))
+        rebuilt = table(self.db.query("SELECT" + REBUILD_SQL.format(stays=ALL_STAYS)))
+        self.assertEqual(kept, rebuilt)
+
+    def test_v10_keeps_every_row(self):
+        live = self.db.query(f"SELECT {STAY_COLUMNS} FROM bookings ORDER BY id")
+        archived = self.db.query(f"SELECT {STAY_COLUMNS} FROM bookings_archive ORDER BY id")
+        # Unknown room and malformed date cannot live in stays: archived as is.
+        self.assertEqual(archived, [LEGACY[4], LEGACY[5]])
+        expected = [r for r in LEGACY if r not in archived]
+        expected[1] = expected[1][:8] + (None,)
+        self.assertEqual(live, expected)
+        self.assertEqual(self.db.query("SELECT day_in, day_out FROM stays WHERE id = 4"), [(None, None)])
+        # New ids carry on past the old table's sequence.
+        store = Store(self.db)
+        row = store.add_booking("New", "101", "", "2025-11-01", "2025-11-03", 2)
+        self.assertEqual(row[0], 10)
+        self.assertRollupRebuilt()
+
+    def test_rollup_follows_writes(self):
+        store = Store(self.db)
+        row = store.add_booking("Cara", "101", "", "2025-10-01", "2025-10-05", 4)
+        self.assertRollupRebuilt()
+        store.update_booking(row[0], "Cara", "102", "", "2025-10-02", "2025-10-06", 4)
+        self.assertRollupRebuilt()
+        store.update_room(2, "102", "Twin", 130.0, "")
+        self.assertRollupRebuilt()
+        store.update_room(3, "104", "Single", 80.0, "")
+        self.assertRollupRebuilt()
+        store.delete_booking(3)
+        self.assertRollupRebuilt()
+        store.check_out(row[0])
+        self.assertRollupRebuilt()
+        self.assertEqual(archive.archive_closed(self.db, date(2025, 9, 30)), 2)
+        self.assertRollupRebuilt()
+        # Deleting a room archives its stays under the number it had.
+        store.delete_room(3)
+        self.assertRollupRebuilt()
+        self.assertEqual(self.db.query("SELECT room_no FROM bookings_archive WHERE id = 9"), [("104",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
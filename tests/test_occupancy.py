@@ -0,0 +1,121 @@
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import availability
+import migrations
+from db import ConnectionManager
+from occupancy import OccupancyIndex, runs
+from store import RoomOccupied, Store
+
+START = date(2030, 3, 1)
+HORIZON = 40
+ROOMS = (("101", "Single", 60.0), ("102", "Single", 70.0), ("201", "Double", 90.0),
+         ("202", "Double", 120.0), ("301", "Suite", 200.0), ("302", "Suite", 250.0))
+FILTERS = ((None, None), ("Double", None), ("Suite", 220.0), (None, 80.0), ("Penthouse", None))
+
+
+class OccupancyIndexTest(unittest.TestCase):
+    # Every bitmap answer must match the NOT EXISTS overlap query in
+    # availability.py, asked one candidate range at a time.
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        self.store = Store(self.db)
+        for room_no, room_type, rate in ROOMS:
+            self.store.add_room(room_no, room_type, rate, "")
+        self.index = OccupancyIndex(self.db, self.store.catalog, self.store.events)
+        self.rng = random.Random(14)
+        self.ids = [self.book() for _ in range(60)]
+        self.ids = [i for i in self.ids if i is not None]
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def book(self):
+        # Starts a little before START too, to cover the lookback days.
+        frm = START + timedelta(days=self.rng.randint(-10, HORIZON))
+        nights = self.rng.randint(1, 6)
+        try:
+            row = self.store.add_booking("Guest", self.rng.choice(ROOMS)[0], "", frm.isoformat(),
+                                         (frm + timedelta(days=nights)).isoformat(), nights)
+        except RoomOccupied:
+            return None
+        return row[0]
+
+    def sql_free(self, frm, nights, room_type, max_rate):
+        return availability.free_rooms(self.db, frm, frm + timedelta(days=nights), room_type, max_rate)
+
+    def naive_earliest_fit(self, nights, room_type, max_rate):
+        for d in range(HORIZON - nights + 1):
+            frm = START + timedelta(days=d)
+            free = self.sql_free(frm, nights, room_type, max_rate)
+            if free:
+                return frm, free
+        return None, []
+
+    def naive_free_on(self, days, k, room_type, max_rate):
+        counts = {}
+        for d in days:
+            for room_no in self.sql_free(d, 1, room_type, max_rate):
+                counts[room_no] = counts.get(room_no, 0) + 1
+        k = len(days) if k is None else k
+        return sorted(((r, n) for r, n in counts.items() if n >= k), key=lambda f: (-f[1], f[0]))
+
+    def assertMatchesSql(self):
+        for room_type, max_rate in FILTERS:
+            for nights in (1, 2, 3, 5, 9):
+                found, rooms = self.index.earliest_fit(nights, room_type, START, HORIZON, max_rate)
+                self.assertEqual((found, sorted(rooms)), self.naive_earliest_fit(nights, room_type, max_rate))
+            days = sorted({START + timedelta(days=self.rng.randint(0, HORIZON)) for _ in range(5)})
+            for k in (None, 1, 3):
+                self.assertEqual(self.index.free_on(days, k, room_type, max_rate), self.naive_free_on(days, k, room_type, max_rate))
+
+    def test_runs(self):
+        for _ in range(200):
+            free = self.rng.getrandbits(64)
+            n = self.rng.randint(1, 12)
+            naive = 0
+            for d in range(64):
+                if all(free >> (d + i) & 1 for i in range(n)):
+                    naive |= 1 << d
+            self.assertEqual(runs(free, n), naive)
+
+    def test_matches_sql(self):
+        self.assertMatchesSql()
+
+    def test_matches_sql_after_store_writes(self):
+        # Built first, then patched from the Store's RowEvents.
+        self.index.earliest_fit(1, None, START, HORIZON)
+        for _ in range(15):
+            self.book()
+        for booking_id in self.ids[:5]:
+            row = self.store.get_booking(booking_id)
+            frm = date.fromisoformat(row[4]) + timedelta(days=self.rng.randint(-3, 3))
+            try:
+                self.store.update_booking(booking_id, row[1], self.rng.choice(ROOMS)[0], row[3], frm.isoformat(),
+                                          (frm + timedelta(days=2)).isoformat(), 2)
+            except RoomOccupied:
+                pass
+        for booking_id in self.ids[5:10]:
+            self.store.delete_booking(booking_id)
+        self.assertIsNotNone(self.index._rows)
+        self.assertMatchesSql()
+
+    def test_full_horizon(self):
+        # Nothing free: every room taken for the whole horizon.
+        self.db.write(lambda c: c.execute("DELETE FROM stays"))
+        self.index.invalidate()
+        for room_no, _, _ in ROOMS:
+            self.store.add_booking("Long", room_no, "", START.isoformat(), (START + timedelta(days=HORIZON)).isoformat(), HORIZON)
+        self.assertEqual(self.index.earliest_fit(1, None, START, HORIZON), (None, []))
+        self.assertEqual(self.index.free_on([START, START + timedelta(days=HORIZON)], 1),
+                         [(room_no, 1) for room_no, _, _ in ROOMS])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import random
+import tempfile
+import unittest
+
+import migrations
+from db import ConnectionManager
+from migrations import SORT_KEYS
+from paging import BookingPager
+from store import BOOKING_COLUMNS, Store
+
+ROOMS = ("101", "102", "103", "201")
+STAYS = 120
+NUMERIC = ("nights", "total")
+
+
+def _sort_key(col, row):
+    value = row[BOOKING_COLUMNS.index(col)]
+    if value is None:
+        value = 0 if col in NUMERIC else ""
+    return value, row[0]
+
+
+class BookingPagerTest(unittest.TestCase):
+    # Few distinct values per column, so most pages start and end inside a
+    # run of ties, plus NULL phones, nights and totals and undated stays.
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        store = Store(self.db)
+        for room_no in ROOMS:
+            store.add_room(room_no, "Double", 100.0, "")
+        room_ids = [r[0] for r in self.db.query("SELECT id FROM rooms")]
+        rng = random.Random(4)
+        stays = []
+        for i in range(STAYS):
+            day_in = None if i % 9 == 0 else 22000 + rng.randint(0, 5)
+            day_out = None if day_in is None else day_in + rng.randint(1, 3)
+            stays.append((rng.choice(room_ids), day_in, day_out, rng.choice(["Ann", "Ben", "ann"]),
+                          rng.choice([None, "", "555"]), rng.choice(["2030-01-01 10:00:00", "2030-01-02 09:00:00"]),
+                          rng.choice([None, 1, 2]), rng.choice([None, 0.0, 90.5, 200.0])))
+        # Raw inserts: stays in one room may overlap, which is fine here.
+        self.db.write(lambda c: c.execute("DROP TRIGGER stays_no_overlap_bi"))
+        self.db.write(lambda c: c.executemany(
+            "INSERT INTO stays (room_id, day_in, day_out, guest_name, phone, created_at, nights, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", stays))
+        self.rows = self.db.query(f"SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings")
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def expected(self, col, descending):
+        return [r[0] for r in sorted(self.rows, key=lambda r: _sort_key(col, r), reverse=descending)]
+
+    def pager(self, col, descending):
+        pager = BookingPager(self.db, page_size=7, max_pages=3)
+        pager.set_sort(col)
+        if pager.descending != descending:
+            pager.set_sort(col)
+        return pager
+
+    def test_every_sort_key_both_ways(self):
+        for col in SORT_KEYS:
+            for descending in (False, True):
+                with self.subTest(col=col, descending=descending):
+                    expected = self.expected(col, descending)
+                    pager = self.pager(col, descending)
+                    seen = [r[0] for r in pager.first_page()]
+                    while not pager.at_end:
+                        rows, evicted = pager.next_page()
+                        seen += [r[0] for r in rows]
+                        self.assertLessEqual(pager.loaded(), 21)
+                    self.assertEqual(seen, expected)
+                    # And back up again from the bottom of the window.
+                    back = [r[0] for r in pager.pages[0]]
+                    while not pager.at_start:
+                        rows, evicted = pager.prev_page()
+                        back = [r[0] for r in rows] + back
+                    self.assertEqual(back, expected[:len(back)])
+                    self.assertEqual([r[0] for page in pager.pages for r in page], expected[:pager.loaded()])
+
+    def test_stale_plan_dropped(self):
+        pager = self.pager("guest_name", False)
+        plan = pager.plan_first()
+        fetched = pager.fetch(plan)
+        pager.set_sort("total")
+        self.assertIsNone(pager.apply_first(plan, fetched))
+        self.assertEqual([r[0] for r in pager.first_page()], self.expected("total", False)[:7])
+
+    def test_place_among_ties(self):
+        pager = self.pager("guest_name", False)
+        pager.first_page()
+        for _ in range(4):
+            pager.next_page()
+        before = [r[0] for page in pager.pages for r in page]
+        row = pager.pages[1][3]
+        pager.remove(row[0])
+        pos = pager.place(row)
+        window = [r[0] for page in pager.pages for r in page]
+        self.assertEqual(window[pos], row[0])
+        self.assertEqual(window, before)
+        # A row that sorts before the window is left out.
+        first = next(r for r in self.rows if r[0] == self.expected("guest_name", False)[0])
+        self.assertIsNone(pager.place(first))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import migrations
+import rates
+from days import from_day, to_day
+from db import ConnectionManager
+from events import RELOAD
+from store import Store
+
+FIRST = date(2030, 1, 1)
+TYPES = ("Single", "Double", "Suite")
+
+
+def weekday(day):
+    return date.fromisoformat(from_day(day)).weekday()
+
+
+class RateCalendarTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        self.store = Store(self.db)
+        # Weekend rates for all types and a different weekend for Suites,
+        # overlapping seasons and length-of-stay discounts, with prices
+        # that do not add up exactly in binary.
+        rates.set_weekend(self.db, "", 99.99)
+        rates.set_weekend(self.db, "Suite", 333.33, nights=(5, 6))
+        rates.add_season(self.db, "", FIRST + timedelta(days=20), FIRST + timedelta(days=50), rate=80.1)
+        rates.add_season(self.db, "Double", FIRST + timedelta(days=40), FIRST + timedelta(days=70), rate=110.7, weekend_rate=150.05)
+        rates.add_season(self.db, "", FIRST + timedelta(days=60), FIRST + timedelta(days=65), weekend_rate=120.01)
+        rates.set_discount(self.db, "", 7, 10.0)
+        rates.set_discount(self.db, "", 14, 15.0)
+        rates.set_discount(self.db, "Suite", 3, 5.0)
+        self.rules = rates.list_rules(self.db)
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def naive(self, room_type, base_rate, day_in, day_out):
+        # One night at a time, straight from the rules as listed.
+        plans = {t: (rate, rates.weekend_days(days)) for t, rate, days in self.rules["weekend"]}
+        weekend_rate, nights = plans.get(room_type) or plans.get(rates.ALL_TYPES) or (None, rates.WEEKEND_NIGHTS)
+        seasons = sorted((s for s in self.rules["seasons"] if s[1] in (rates.ALL_TYPES, room_type)),
+                         key=lambda s: (s[1] != rates.ALL_TYPES, s[0]))
+        total = 0.0
+        for day in range(day_in, day_out):
+            weekend = weekday(day) in nights
+            price = weekend_rate if weekend and weekend_rate is not None else base_rate
+            for _, _, _, frm, to, rate, season_weekend in seasons:
+                if frm <= from_day(day) < to:
+                    if rate is not None:
+                        price = rate
+                    if season_weekend is not None and weekend:
+                        price = season_weekend
+            total += price
+        steps = [(n, pct) for t, n, pct in self.rules["discounts"] if t == room_type] or \
+                [(n, pct) for t, n, pct in self.rules["discounts"] if t == rates.ALL_TYPES]
+        pct = max((pct for n, pct in steps if day_out - day_in >= n), default=0.0)
+        return round(round(total, 2) * (1 - pct / 100.0), 2)
+
+    def test_quote_matches_naive_sum(self):
+        book = rates.RateBook(self.db)
+        rng = random.Random(20)
+        first = to_day(FIRST)
+        for _ in range(500):
+            room_type = rng.choice(TYPES + ("Other",))
+            day_in = first + rng.randint(-5, 90)
+            day_out = day_in + rng.randint(1, 21)
+            quote = book.quote(room_type, 89.95, day_in, day_out)
+            self.assertEqual(quote, self.naive(room_type, 89.95, day_in, day_out))
+            self.assertEqual(quote, round(quote, 2))
+
+    def test_weekend_nights(self):
+        cal = rates.RateBook(self.db).calendar(to_day(FIRST), to_day(FIRST) + 14)
+        nights, pct = cal.nightly("Single", 50.0, to_day(FIRST), to_day(FIRST) + 7)
+        self.assertEqual(pct, 10.0)
+        weekend = {d for d, price in nights if price == 99.99}
+        self.assertEqual({weekday(d) for d in weekend}, set(rates.WEEKEND_NIGHTS))
+        self.assertEqual(len(weekend), 2)
+        nights, _ = cal.nightly("Suite", 50.0, to_day(FIRST), to_day(FIRST) + 7)
+        self.assertEqual({weekday(d) for d, price in nights if price == 333.33}, {5, 6})
+
+    def test_subtotal_rounded_to_cents(self):
+        cal = rates.RateBook(self.db).calendar(to_day(FIRST), to_day(FIRST) + 400)
+        # Three nights at 99.99 sum to 299.96999... before rounding.
+        self.assertEqual(cal.subtotal("Single", 99.99, to_day(date(2030, 1, 1)), to_day(date(2030, 1, 4))), 299.97)
+
+    def test_reprice_emits_reload(self):
+        self.store.add_room("101", "Double", 100.0, "")
+        for i in range(5):
+            frm = FIRST + timedelta(days=10 * i)
+            self.store.add_booking("Guest", "101", "", frm.isoformat(), (frm + timedelta(days=8)).isoformat(), 8)
+        events = []
+        self.store.events.subscribe("bookings", events.append)
+        rates.set_discount(self.db, "", 7, 50.0)
+        self.store.rates.invalidate()
+        self.assertEqual(self.store.reprice(FIRST), 5)
+        self.assertEqual([e.action for e in events], [RELOAD])
+        book = rates.RateBook(self.db)
+        for day_in, day_out, total in self.db.query("SELECT day_in, day_out, total FROM stays"):
+            self.assertEqual(total, book.quote("Double", 100.0, day_in, day_out))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import api
+import csvio
+import migrations
+from days import MAX_NIGHTS
+from db import ConnectionManager
+from service import HotelService, ValidationError, stay_nights
+
+CHECK_IN = date(2030, 1, 1)
+
+
+class StayLengthTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = ConnectionManager(os.path.join(self.tmp.name, "hotel.db"))
+        migrations.migrate(self.db)
+        self.service = HotelService(self.db)
+        self.service.add_room("101", "Double", "100")
+
+    def tearDown(self):
+        self.db.close_all()
+        self.tmp.cleanup()
+
+    def test_stay_nights(self):
+        longest = (CHECK_IN + timedelta(days=MAX_NIGHTS)).isoformat()
+        self.assertEqual(stay_nights(CHECK_IN.isoformat(), longest), MAX_NIGHTS)
+        with self.assertRaises(ValidationError):
+            stay_nights(CHECK_IN.isoformat(), (CHECK_IN + timedelta(days=MAX_NIGHTS + 1)).isoformat())
+
+    def test_api_refuses_long_stays(self):
+        body = {"guest_name": "Ann", "room_no": "101", "check_in": "2030-01-01", "check_out": "3000-01-01"}
+        status, payload = api.dispatch(self.service, "POST", "/bookings", body)
+        self.assertEqual(status, 400)
+        self.assertIn(str(MAX_NIGHTS), payload["error"])
+        status, _ = api.dispatch(self.service, "GET", "/quote?room=101&from=2030-01-01&to=3000-01-01", None)
+        self.assertEqual(status, 400)
+        self.assertEqual(self.db.query("SELECT COUNT(*) FROM stays")[0][0], 0)
+
+    def test_csv_refuses_long_stays(self):
+        path = os.path.join(self.tmp.name, "bookings.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.write("guest_name,room_no,check_in,check_out\nAnn,101,2030-01-01,3000-01-01\n")
+        report = csvio.import_bookings(self.db, path)
+        self.assertEqual(report.accepted, 0)
+        self.assertIn(str(MAX_NIGHTS), report.rejected[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import queue
+import threading
+from contextlib import nullcontext
+from tkinter import messagebox
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, worker, label):
+        self.worker = worker
+        self.label = label
+        self.future = None
+        self.span = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+        if self.future is not None and self.future.cancel():
+            # Never started, so _run will not report back for it.
+            self.worker.call_soon(self.worker._finish, self, None, None, f"{self.label} cancelled")
+
+    def bind(self, conn):
+        # While bound, cancel() also interrupts the statement running on
+        # conn, so a stale query stops at once instead of at the next check.
+        with self._lock:
+            self._conn = conn
+
+    def unbind(self):
+        with self._lock:
+            self._conn = None
+
+    def check(self):
+        # Long-running job bodies call this between chunks of work.
+        if self._cancel.is_set():
+            raise Cancelled(self.label)
+
+    def progress(self, done, total=None):
+        text = f"{self.label}: {done}" + (f"/{total}" if total else "")
+        self.worker.call_soon(self.worker.set_status, text)
+
+
+class BackgroundWorker:
+    # Runs database and file I/O on a thread pool. Tk is not thread-safe,
+    # so results travel back through a queue drained by root.after on the
+    # Tk thread, and callbacks always run there. With a profiler, jobs and
+    # callbacks count towards the UI action (Span) that started them.
+    def __init__(self, root, status_var=None, max_workers=4, on_jobs_changed=None, profiler=None):
+        self.root = root
+        self.status_var = status_var
+        self.on_jobs_changed = on_jobs_changed
+        self.profiler = profiler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hotelms-io")
+        self.jobs = []
+        self._ui = queue.SimpleQueue()
+        self._closing = False
+        self._stopped = False
+        self._after = self.root.after(POLL_MS, self._poll)
+
+    def set_status(self, text):
+        if self.status_var is not None:
+            self.status_var.set(text)
+
+    def _current_span(self):
+        span = self.profiler.current() if self.profiler is not None else None
+        if span is not None:
+            span.hold()
+        return span
+
+    def call_soon(self, callback, *args):
+        self._ui.put((callback, args, self._current_span()))
+
+    def submit(self, label, fn, *args, on_done=None, on_error=None):
+        # fn is called as fn(job, *args) on a pool thread.
+        job = Job(self, label)
+        job.span = self._current_span()
+        self.jobs.append(job)
+        self._jobs_changed()
+        self.set_status(f"{label}...")
+        job.future = self.executor.submit(self._run, job, fn, args, on_done, on_error)
+        return job
+
+    def _run(self, job, fn, args, on_done, on_error):
+        try:
+            with job.span.active("worker") if job.span is not None else nullcontext():
+                job.check()
+                result = fn(job, *args)
+        except Cancelled:
+            self.call_soon(self._finish, job, None, None, f"{job.label} cancelled")
+        except Exception as e:
+            self.call_soon(self._finish, job, on_error or self._default_error, e, None)
+        else:
+            self.call_soon(self._finish, job, on_done, result, None)
+
+    def _finish(self, job, callback, value, status):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        self._jobs_changed()
+        if status:
+            self.set_status(status)
+        if self._closing:
+            # Results and errors of jobs cut short by shutdown() are dropped.
+            callback = None
+        if job.span is None:
+            if callback is not None:
+                callback(value)
+            return
+        try:
+            with job.span.active("tk"):
+                if callback is not None:
+                    callback(value)
+        finally:
+            job.span.release()
+
+    def _default_error(self, error):
+        self.set_status(f"Error: {error}")
+        messagebox.showerror("Error", str(error))
+
+    def _jobs_changed(self):
+        if self.on_jobs_changed is not None:
+            self.on_jobs_changed(len(self.jobs))
+
+    def cancel_latest(self):
+        if self.jobs:
+            self.jobs[-1].cancel()
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    callback, args, span = self._ui.get_nowait()
+                except queue.Empty:
+                    break
+                if span is None:
+                    callback(*args)
+                    continue
+                try:
+                    with span.active("tk"):
+                        callback(*args)
+                finally:
+                    span.release()
+        finally:
+            if not self._stopped:
+                self._after = self.root.after(POLL_MS, self._poll)
+
+    def shutdown(self, final=None, on_done=None):
+        # Cancels every job and waits for the pool to drain on a separate
+        # thread, so the Tk loop keeps polling meanwhile. final() runs on
+        # that thread once no job is left (e.g. to close connections), then
+        # on_done on the Tk thread, after which nothing more is polled.
+        self._closing = True
+        for job in list(self.jobs):
+            job.cancel()
+
+        def stopped():
+            self._stopped = True
+            self.root.after_cancel(self._after)
+            if on_done is not None:
+                on_done()
+
+        def drain():
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            try:
+                if final is not None:
+                    final()
+            finally:
+                self.call_soon(stopped)
+        threading.Thread(target=drain, name="hotelms-shutdown", daemon=True).start()